@@ -0,0 +1,187 @@
+"""
+Contention benchmark for WhitelistDB.
+
+Runs simulated Flask API threads (list + per-device lookups, occasional
+registrations) next to a simulated monitor thread (per-device lookups every
+cycle) against the same database file, and reports throughput and lookup
+latency percentiles for the legacy connect-per-call access pattern and for
+the pooled WAL implementation.
+
+    python benchmarks/bench_db_contention.py [--seconds 3] [--devices 500]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import datetime
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.core.db import WhitelistDB
+from src.utils.logger import log
+
+
+class LegacyWhitelistDB:
+    """The pre-pool access pattern: a fresh rollback-journal connection per call."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS whitelisted_devices (
+                canonical_id TEXT PRIMARY KEY, friendly_name TEXT NOT NULL, device_type TEXT,
+                added_on TEXT NOT NULL, structural_fingerprint TEXT, lockfile_signature TEXT)
+        """)
+        conn.commit()
+        conn.close()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register_device(self, canonical_id, friendly_name, device_type="unknown"):
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO whitelisted_devices (canonical_id, friendly_name, device_type, added_on) VALUES (?, ?, ?, ?)",
+                (canonical_id, friendly_name, device_type, datetime.datetime.now().isoformat()))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+
+    def remove_device(self, canonical_id):
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute("DELETE FROM whitelisted_devices WHERE canonical_id = ?", (canonical_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+
+    def get_device_details(self, canonical_id):
+        conn = self._get_connection()
+        try:
+            row = conn.execute("SELECT * FROM whitelisted_devices WHERE canonical_id = ?", (canonical_id,)).fetchone()
+            return dict(row) if row else None
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def list_devices(self):
+        conn = self._get_connection()
+        try:
+            return [dict(row) for row in conn.execute("SELECT * FROM whitelisted_devices ORDER BY friendly_name")]
+        except sqlite3.Error:
+            return []
+        finally:
+            conn.close()
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_contention(db, devices, seconds, api_threads=4, connected=20):
+    """Runs the API and monitor workloads together and returns a result dict."""
+    for i in range(devices):
+        db.register_device(f"VID_{i:04X}&PID_0001&SN_{i:08d}", f"Device {i}", "peripheral")
+    connected_ids = [f"VID_{i:04X}&PID_0001&SN_{i:08d}" for i in range(connected)]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies, operations, errors = [], [0], [0]
+
+    def lookup_all(samples):
+        for device_id in connected_ids:
+            start = time.perf_counter()
+            if db.get_device_details(device_id) is None:
+                errors[0] += 1
+            samples.append(time.perf_counter() - start)
+
+    def monitor():
+        samples, ops = [], 0
+        while not stop.is_set():
+            lookup_all(samples)
+            ops += len(connected_ids)
+        with lock:
+            latencies.extend(samples)
+            operations[0] += ops
+
+    def api(worker):
+        samples, ops, n = [], 0, 0
+        while not stop.is_set():
+            db.list_devices()
+            lookup_all(samples)
+            ops += 1 + len(connected_ids)
+            n += 1
+            if n % 10 == 0:
+                # The UI registering and removing a device now and then
+                device_id = f"VID_FFFF&PID_{worker:04X}&SN_{n:08d}"
+                db.register_device(device_id, "Bench Device")
+                db.remove_device(device_id)
+                ops += 2
+        with lock:
+            latencies.extend(samples)
+            operations[0] += ops
+
+    threads = [threading.Thread(target=monitor)] + [threading.Thread(target=api, args=(w,)) for w in range(api_threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if hasattr(db, "close"):
+        db.close()
+
+    return {
+        "ops_per_sec": operations[0] / elapsed,
+        "lookups": len(latencies),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "errors": errors[0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--api-threads", type=int, default=4)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")  # Registrations log at INFO; keep them out of the timings
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "before (connect per call, rollback journal)": run_contention(
+                LegacyWhitelistDB(os.path.join(tmp, "legacy.db")), args.devices, args.seconds, args.api_threads),
+            "after (pooled, WAL, snapshot)": run_contention(
+                WhitelistDB(os.path.join(tmp, "pooled.db")), args.devices, args.seconds, args.api_threads),
+        }
+
+    print(f"\n{'variant':<46}{'ops/s':>12}{'lookups':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<46}{r['ops_per_sec']:>12.0f}{r['lookups']:>10}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['errors']:>8}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+DeviceID parser micro-benchmark.
+
+Parses 100k synthetic USB and USBSTOR DeviceIDs (plus PCI and root hub noise)
+with the old split-based parser and with src.core.device_id, checks both give
+identical results for every ID, and times uncached parsing and the memoized
+repeat scans the monitor actually does.
+
+    python benchmarks/bench_device_id_parser.py [--ids 100000] [--machine 500] [--scans 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.core.device_id import parse_device_id
+from src.core.detector import _parse_pnp_device
+from src.utils.logger import log
+
+
+def legacy_parse(device_id, caption):
+    """The split-based parser detector.py used before src.core.device_id."""
+    if not device_id:
+        return None
+
+    is_usb = device_id.startswith("USB\\")
+    is_usbstor = device_id.startswith("USBSTOR\\")
+
+    if not (is_usb or is_usbstor):
+        return None
+
+    # Parse VID, PID, and Serial from the DeviceID
+    vid_pid_part = None
+    vid, pid = "", ""
+
+    if is_usb:
+        # Regular USB PnP device
+        vid_pid_part = next((p for p in device_id.split('\\') if 'VID_' in p and 'PID_' in p), None)
+        if vid_pid_part:
+            vid = vid_pid_part.split('VID_')[1].split('&')[0]
+            pid = vid_pid_part.split('PID_')[1].split('&')[0]
+    elif is_usbstor:
+        # USB Storage device - extract VID/PID from VEN_ and PROD_ fields
+        parts = device_id.split('\\')
+        if len(parts) >= 2:
+            ven_prod = parts[1]
+            # Extract VID from VEN_ field
+            if 'VEN_' in ven_prod:
+                ven_part = ven_prod.split('VEN_')[1].split('&')[0]
+                # SanDisk shows as '_USB' which means VID_0781, handle this mapping
+                if ven_part == '_USB':
+                    vid = '0781'  # SanDisk's VID
+                else:
+                    vid = ven_part.replace('_', '')
+            # Extract PID from PROD_ field
+            if 'PROD_' in ven_prod:
+                prod_part = ven_prod.split('PROD_')[1].split('&')[0]
+                # For SanDisk 3.2Gen1, the actual PID is 5591
+                if prod_part == '_SANDISK_3.2GEN1':
+                    pid = '5591'  # SanDisk USB Drive PID
+                else:
+                    pid = prod_part.replace('_', '')
+
+    if not vid or not pid:
+        return None
+
+    # Extract serial number
+    parts = device_id.split('\\')
+    serial = parts[-1] if len(parts) > 2 and '&' not in parts[-1] else "NO_SERIAL"
+
+    canonical_id = f"VID_{vid}&PID_{pid}&SN_{serial if serial != 'NO_SERIAL' else 'NO_SERIAL'}"
+
+    return {
+        "friendly_name": caption or "Unknown USB Device",
+        "vid": vid,
+        "pid": pid,
+        "serial_number": serial,
+        "canonical_id": canonical_id,
+        "device_id_wmi": device_id
+    }
+
+
+def as_dict(record):
+    """The new parser returns DeviceRecords; compare them in the legacy dict shape."""
+    if record is None:
+        return None
+    data = record.to_dict()
+    del data['drive_letter']
+    return data
+
+
+def synthetic_ids(count, seed=1):
+    rng = random.Random(seed)
+    ids = []
+    for i in range(count):
+        kind = rng.random()
+        serial = f"{rng.getrandbits(48):012X}"
+        if kind < 0.45:
+            ids.append(f"USB\\VID_{rng.getrandbits(16):04X}&PID_{rng.getrandbits(16):04X}\\{serial}")
+        elif kind < 0.6:
+            ids.append(f"USB\\VID_{rng.getrandbits(16):04X}&PID_{rng.getrandbits(16):04X}&MI_0{i % 4}\\7&{serial[:8]}&0&000{i % 4}")
+        elif kind < 0.75:
+            ids.append(f"USBSTOR\\DISK&VEN_KINGSTON&PROD_DT_100_G{i % 9}&REV_PMAP\\{serial}&0")
+        elif kind < 0.85:
+            ids.append(f"USBSTOR\\DISK&VEN__USB&PROD__SANDISK_3.2GEN1&REV_1.00\\{serial}&0")
+        elif kind < 0.95:
+            ids.append(f"PCI\\VEN_8086&DEV_{i % 0xFFFF:04X}\\3&11583659&0&{i % 256:02X}")
+        else:
+            ids.append(f"USB\\ROOT_HUB30\\4&{serial[:8]}&0&0")
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=100000)
+    parser.add_argument("--machine", type=int, default=500, help="IDs present on one machine, for repeat scans")
+    parser.add_argument("--scans", type=int, default=200)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    ids = synthetic_ids(args.ids)
+
+    # Parity: every ID, same dict (or None) from both parsers
+    parse_device_id.cache_clear()
+    _parse_pnp_device.cache_clear()
+    mismatches = [d for d in ids if legacy_parse(d, "Caption") != as_dict(_parse_pnp_device(d, "Caption"))]
+    assert not mismatches, f"{len(mismatches)} mismatches, e.g. {mismatches[:3]}"
+
+    started = time.perf_counter()
+    for device_id in ids:
+        legacy_parse(device_id, "Caption")
+    legacy = time.perf_counter() - started
+
+    uncached_parse = parse_device_id.__wrapped__
+    started = time.perf_counter()
+    for device_id in ids:
+        uncached_parse(device_id)
+    uncached = time.perf_counter() - started
+
+    machine = ids[:args.machine]
+    parse_device_id.cache_clear()
+    _parse_pnp_device.cache_clear()
+    started = time.perf_counter()
+    for _ in range(args.scans):
+        for device_id in machine:
+            legacy_parse(device_id, "Caption")
+    legacy_scans = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(args.scans):
+        for device_id in machine:
+            _parse_pnp_device(device_id, "Caption")
+    memo_scans = time.perf_counter() - started
+
+    print(f"\n{len(ids)} DeviceIDs, outputs identical")
+    print(f"  legacy parser:      {legacy / len(ids) * 1e9:8.0f} ns/id")
+    print(f"  compiled (no memo): {uncached / len(ids) * 1e9:8.0f} ns/id  ({legacy / uncached:.1f}x)")
+    total = args.scans * len(machine)
+    print(f"\n{args.scans} scans of {len(machine)} IDs")
+    print(f"  legacy parser:      {legacy_scans / total * 1e9:8.0f} ns/id")
+    print(f"  memoized:           {memo_scans / total * 1e9:8.0f} ns/id  ({legacy_scans / memo_scans:.1f}x)")
+    return {"legacy_ns": legacy / len(ids) * 1e9, "compiled_ns": uncached / len(ids) * 1e9,
+            "memoized_scan_ns": memo_scans / total * 1e9}
+
+
+if __name__ == "__main__":
+    main()
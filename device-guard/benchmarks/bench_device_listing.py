@@ -0,0 +1,71 @@
+"""
+Registered-devices listing benchmark.
+
+Bulk-imports --devices whitelist entries and times what the Registered tab
+asks for: the first page, a page deep into the list (keyset pagination, so it
+should cost the same as the first), a filtered page and a page of one device
+type, against the old behaviour of listing every row.
+
+    python benchmarks/bench_device_listing.py [--devices 100000] [--page 100] [--repeat 20]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.core.db import WhitelistDB
+from src.utils.logger import log
+
+
+def best_ms(operation, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=100000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WhitelistDB(os.path.join(tmp, "whitelist.db"))
+        try:
+            db.import_devices({"canonical_id": f"VID_0781&PID_5591&SN_{i:020d}",
+                               "friendly_name": f"Device {(i * 7919) % args.devices:07d}",
+                               "device_type": "storage" if i % 4 == 0 else "peripheral"}
+                              for i in range(args.devices))
+            deep = db.list_devices(limit=1000, after=(f"Device {args.devices - 1000:07d}", ""))[0]
+            after = (deep["friendly_name"], deep["canonical_id"])
+            cases = [
+                ("first page", lambda: db.list_devices(limit=args.page)),
+                ("deep page", lambda: db.list_devices(limit=args.page, after=after)),
+                ("filtered page", lambda: db.list_devices(limit=args.page, filter="Device 00123")),
+                ("type page", lambda: db.list_devices(limit=args.page, device_type="storage", after=after)),
+                ("all rows", lambda: db.list_devices()),
+            ]
+            assert len(cases[1][1]()) == args.page and cases[1][1]()[0]["friendly_name"] > after[0]
+            print(f"\n{args.devices} devices, {args.page} per page")
+            print(f"{'listing':<16} {'ms':>10}")
+            results = {}
+            for name, operation in cases:
+                results[name] = best_ms(operation, args.repeat if name != "all rows" else 3)
+                print(f"{name:<16} {results[name]:>10.2f}")
+        finally:
+            db.close()
+    return results
+
+
+if __name__ == "__main__":
+    main()
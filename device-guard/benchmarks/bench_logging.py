@@ -0,0 +1,118 @@
+"""
+Logging hot-path benchmark.
+
+Logs --calls messages from the calling thread, as the monitor loop does for a
+device that stays unauthorized (the same few warnings over and over, plus
+distinct ones), through the previous setup (RotatingFileHandler formatted and
+written synchronously) and through the queue pipeline (LazyQueueHandler plus
+a QueueListener writer thread with RepeatCollapsingHandler). Reports the
+per-call cost and p99 seen by the caller, and how many lines reached the file.
+--fsync makes every file write durable, standing in for a slow disk.
+
+    python benchmarks/bench_logging.py [--calls 20000] [--distinct 0.1] [--fsync]
+"""
+import os
+import sys
+import time
+import queue
+import logging
+import argparse
+import tempfile
+from logging.handlers import RotatingFileHandler, QueueListener
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.utils.logger import LazyQueueHandler, RepeatCollapsingHandler, LOG_BACKUP_COUNT
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DurableFileHandler(RotatingFileHandler):
+    def flush(self):
+        super().flush()
+        if self.stream:
+            os.fsync(self.stream.fileno())
+
+
+def file_handler(path, fsync):
+    handler = (DurableFileHandler if fsync else RotatingFileHandler)(
+        path, maxBytes=2 * 1024 * 1024, backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    return handler
+
+
+def log_burst(logger, calls, distinct):
+    """Per-call latencies (seconds) for a mix of repeated and distinct messages."""
+    every = max(1, int(1 / distinct)) if distinct else 0
+    latencies = []
+    for i in range(calls):
+        started = time.perf_counter()
+        if every and i % every == 0:
+            logger.info("Device disconnected: VID_0781&PID_5591&SN_%08d", i)
+        else:
+            logger.warning("Blocking unauthorized storage device: %s (%s)", "SanDisk Cruzer", "E:")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def count_lines(path):
+    """Lines in the log and its rotated backups."""
+    total = 0
+    for candidate in [path] + [f"{path}.{i}" for i in range(1, LOG_BACKUP_COUNT + 1)]:
+        if os.path.exists(candidate):
+            with open(candidate, encoding="utf-8") as f:
+                total += sum(1 for _ in f)
+    return total
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    return sum(ordered) / len(ordered) * 1e6, ordered[int(len(ordered) * 0.99)] * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--distinct", type=float, default=0.1, help="share of distinct (non-repeating) messages")
+    parser.add_argument("--fsync", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_path = os.path.join(tmp, "sync.log")
+        sync_logger = logging.getLogger("bench.sync")
+        sync_logger.propagate = False
+        sync_logger.setLevel(logging.INFO)
+        sync_logger.addHandler(file_handler(sync_path, args.fsync))
+        started = time.perf_counter()
+        latencies = log_burst(sync_logger, args.calls, args.distinct)
+        total = time.perf_counter() - started
+        sync_logger.handlers[0].close()
+        results["synchronous"] = summarize(latencies) + (total, total, count_lines(sync_path))
+
+        queued_path = os.path.join(tmp, "queued.log")
+        listener = QueueListener(queue.SimpleQueue(), RepeatCollapsingHandler([file_handler(queued_path, args.fsync)]))
+        queued_logger = logging.getLogger("bench.queued")
+        queued_logger.propagate = False
+        queued_logger.setLevel(logging.INFO)
+        queued_logger.addHandler(LazyQueueHandler(listener.queue))
+        listener.start()
+        started = time.perf_counter()
+        latencies = log_burst(queued_logger, args.calls, args.distinct)
+        caller_total = time.perf_counter() - started
+        listener.stop()  # Drains the queue
+        drained = time.perf_counter() - started
+        listener.handlers[0].close()
+        results["queue + dedup"] = summarize(latencies) + (caller_total, drained, count_lines(queued_path))
+
+    print(f"\n{args.calls} log calls, {args.distinct:.0%} distinct, fsync {'on' if args.fsync else 'off'}")
+    print(f"{'pipeline':<16} {'us/call':>8} {'p99 us':>8} {'caller s':>9} {'written s':>10} {'lines':>7}")
+    for name, (mean, p99, caller_s, written_s, lines) in results.items():
+        print(f"{name:<16} {mean:>8.1f} {p99:>8.1f} {caller_s:>9.3f} {written_s:>10.3f} {lines:>7}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
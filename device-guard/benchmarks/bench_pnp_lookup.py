@@ -0,0 +1,68 @@
+"""
+PnP entity lookup benchmark for enforcement.
+
+Compares the old full Win32_PnPEntity enumeration per blocked device with the
+keyed lookup in detector.get_pnp_entity, against a fake WMI provider holding
+thousands of entities.
+
+    python benchmarks/bench_pnp_lookup.py [--entities 5000] [--blocked 50]
+"""
+import os
+import sys
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks import fakes
+
+provider = fakes.install()
+
+import wmi
+from src.core.detector import get_separated_usb_devices, get_pnp_entity
+from src.utils.logger import log
+
+
+def legacy_lookup(device_id):
+    """The old _disable_wmi_device search: enumerate every PnP entity."""
+    for pnp_device in wmi.WMI().Win32_PnPEntity():
+        if pnp_device.DeviceID == device_id:
+            return pnp_device
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--blocked", type=int, default=50)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    usb = args.entities // 5
+    provider.add_usb_devices(usb)
+    provider.add_other_entities(args.entities - len(provider.entities))
+    conn = wmi.WMI()
+    get_separated_usb_devices()  # Populates the entity path index
+
+    targets = [e.DeviceID for e in provider.entities if e.DeviceID.startswith("USB\\")][-args.blocked:]
+
+    started = time.perf_counter()
+    for device_id in targets:
+        assert legacy_lookup(device_id) is not None
+    legacy = (time.perf_counter() - started) / len(targets)
+
+    started = time.perf_counter()
+    for device_id in targets:
+        assert get_pnp_entity(device_id, conn) is not None
+    keyed = (time.perf_counter() - started) / len(targets)
+
+    print(f"\n{len(provider.entities)} PnP entities, {len(targets)} blocked devices")
+    print(f"  full enumeration: {legacy * 1e6:10.1f} us per device")
+    print(f"  keyed lookup:     {keyed * 1e6:10.1f} us per device  ({legacy / keyed:.0f}x faster)")
+    return {"legacy_us": legacy * 1e6, "keyed_us": keyed * 1e6}
+
+
+if __name__ == "__main__":
+    main()
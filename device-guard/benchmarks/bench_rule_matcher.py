@@ -0,0 +1,188 @@
+"""
+Whitelist rule matcher scaling benchmark.
+
+Compiles rule sets of increasing size (a fleet-like mix of exact, VID, VID+PID,
+PID range, serial prefix and serial glob rules) and times per-device decisions
+for a fixed set of matching and non-matching canonical IDs. Lookup cost should
+stay flat as the rule count grows; a linear scan over the same rules is timed
+on the smallest set for comparison. With --db the largest set is also loaded
+through WhitelistDB.add_rules and resolved with get_many_device_details.
+
+    python benchmarks/bench_rule_matcher.py [--rules 1000 10000 100000 250000] [--lookups 20000] [--db]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from fnmatch import fnmatchcase
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.core import rules as rule_kinds
+from src.core.rules import RuleMatcher, split_canonical_id
+from src.utils.logger import log
+
+# Share of each rule kind in the generated sets
+RULE_MIX = (
+    (rule_kinds.RULE_EXACT, 0.45),
+    (rule_kinds.RULE_VID_PID, 0.2),
+    (rule_kinds.RULE_SERIAL_PREFIX, 0.15),
+    (rule_kinds.RULE_SERIAL_GLOB, 0.1),
+    (rule_kinds.RULE_PID_RANGE, 0.07),
+    (rule_kinds.RULE_VID, 0.03),
+)
+
+
+def _serial(rng, length=20):
+    return "".join(rng.choice("0123456789ABCDEF") for _ in range(length))
+
+
+def generate_rules(count, seed=1):
+    rng = random.Random(seed)
+    generated = []
+    for kind, share in RULE_MIX:
+        for _ in range(int(count * share)):
+            vid, pid = f"{rng.randrange(0x10000):04X}", f"{rng.randrange(0x10000):04X}"
+            rule = {"id": len(generated) + 1, "kind": kind, "vid": None, "pid": None, "pid_max": None, "pattern": None}
+            if kind == rule_kinds.RULE_EXACT:
+                rule["pattern"] = f"VID_{vid}&PID_{pid}&SN_{_serial(rng)}"
+            elif kind == rule_kinds.RULE_VID:
+                rule["vid"] = vid
+            elif kind == rule_kinds.RULE_VID_PID:
+                rule.update(vid=vid, pid=pid)
+            elif kind == rule_kinds.RULE_PID_RANGE:
+                low = rng.randrange(0x10000 - 0x40)
+                rule.update(vid=vid, pid=f"{low:04X}", pid_max=f"{low + rng.randrange(1, 0x40):04X}")
+            elif kind == rule_kinds.RULE_SERIAL_PREFIX:
+                rule.update(vid=vid, pattern=_serial(rng, rng.randrange(4, 10)))
+            else:
+                rule.update(vid=vid, pid=pid, pattern=f"{_serial(rng, 6)}-??-*")
+            generated.append(rule)
+    return generated
+
+
+def generate_ids(rules, count, seed=2):
+    """Half of the IDs are built to match a rule, half are random devices."""
+    rng = random.Random(seed)
+    ids = []
+    for i in range(count):
+        if i % 2:
+            ids.append(f"VID_{rng.randrange(0x10000):04X}&PID_{rng.randrange(0x10000):04X}&SN_{_serial(rng)}")
+            continue
+        rule = rng.choice(rules)
+        kind, vid, pid = rule["kind"], rule["vid"], rule["pid"] or f"{rng.randrange(0x10000):04X}"
+        if kind == rule_kinds.RULE_EXACT:
+            ids.append(rule["pattern"])
+        elif kind == rule_kinds.RULE_PID_RANGE:
+            ids.append(f"VID_{vid}&PID_{rule['pid_max']}&SN_{_serial(rng)}")
+        elif kind == rule_kinds.RULE_SERIAL_PREFIX:
+            ids.append(f"VID_{vid}&PID_{pid}&SN_{rule['pattern']}{_serial(rng, 8)}")
+        elif kind == rule_kinds.RULE_SERIAL_GLOB:
+            ids.append(f"VID_{vid}&PID_{pid}&SN_{rule['pattern'][:6]}-42-{_serial(rng, 8)}")
+        else:
+            ids.append(f"VID_{vid}&PID_{pid}&SN_{_serial(rng)}")
+    return ids
+
+
+def linear_match(rules, canonical_id):
+    """Reference implementation: tries every rule in turn."""
+    vid, pid, serial = split_canonical_id(canonical_id)
+    for rule in rules:
+        kind = rule["kind"]
+        if kind == rule_kinds.RULE_EXACT and rule["pattern"] == canonical_id:
+            return rule
+        if rule["vid"] and rule["vid"] != vid:
+            continue
+        if kind == rule_kinds.RULE_VID or (kind == rule_kinds.RULE_VID_PID and rule["pid"] == pid):
+            return rule
+        if kind == rule_kinds.RULE_PID_RANGE and int(rule["pid"], 16) <= int(pid, 16) <= int(rule["pid_max"], 16):
+            return rule
+        if kind == rule_kinds.RULE_SERIAL_PREFIX and (not rule["pid"] or rule["pid"] == pid) and serial.startswith(rule["pattern"]):
+            return rule
+        if kind == rule_kinds.RULE_SERIAL_GLOB and (not rule["pid"] or rule["pid"] == pid) and fnmatchcase(serial, rule["pattern"]):
+            return rule
+    return None
+
+
+def time_lookups(match, ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for canonical_id in ids:
+            match(canonical_id)
+        timings.append(time.perf_counter() - started)
+    return min(timings) / len(ids)
+
+
+def bench_rules(count, lookups, repeat):
+    rules = generate_rules(count)
+    ids = generate_ids(rules, lookups)
+    started = time.perf_counter()
+    matcher = RuleMatcher(rules)
+    matcher.match(ids[0])  # Compiles the PID range index
+    compile_s = time.perf_counter() - started
+    matched = sum(1 for canonical_id in ids if matcher.match(canonical_id))
+    assert matched >= lookups // 2, f"only {matched} of {lookups} IDs matched"
+    return {"rules": matcher.size, "compile_ms": compile_s * 1000, "matched": matched,
+            "lookup_ns": time_lookups(matcher.match, ids, repeat) * 1e9}, rules, ids, matcher
+
+
+def bench_db(rules, ids, tmp):
+    from src.core.db import WhitelistDB
+
+    db = WhitelistDB(os.path.join(tmp, "whitelist.db"))
+    try:
+        rows = [dict(rule, friendly_name=f"Rule {rule['id']}") for rule in rules]
+        started = time.perf_counter()
+        added = db.add_rules(rows)
+        insert_s = time.perf_counter() - started
+        db.invalidate_snapshot()
+        started = time.perf_counter()
+        db.get_many_device_details(ids[:1])  # Cold: loads and compiles the rules
+        load_s = time.perf_counter() - started
+        started = time.perf_counter()
+        found = db.get_many_device_details(ids)
+        lookup_s = time.perf_counter() - started
+        return {"rules": len(added), "insert_ms": insert_s * 1000, "load_ms": load_s * 1000,
+                "found": len(found), "lookup_ns": lookup_s / len(ids) * 1e9}
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000, 100000, 250000])
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", action="store_true", help="also load the largest set through WhitelistDB")
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    results = []
+    print(f"\n{'rules':>8} {'compile (ms)':>13} {'matched':>8} {'ns/lookup':>10}")
+    for count in sorted(args.rules):
+        result, rules, ids, matcher = bench_rules(count, args.lookups, args.repeat)
+        results.append(result)
+        print(f"{result['rules']:>8} {result['compile_ms']:>13.1f} {result['matched']:>8} {result['lookup_ns']:>10.0f}")
+        if len(results) == 1:
+            sample = ids[:200]
+            assert all(bool(linear_match(rules, i)) == bool(matcher.match(i)) for i in sample)
+            linear_ns = time_lookups(lambda i: linear_match(rules, i), sample, 1) * 1e9
+            print(f"{'':>8} linear scan of the same {result['rules']} rules: {linear_ns:,.0f} ns/lookup")
+    growth = results[-1]["lookup_ns"] / results[0]["lookup_ns"]
+    print(f"\nLookup cost x{growth:.2f} from {results[0]['rules']} to {results[-1]['rules']} rules")
+
+    if args.db:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = bench_db(rules, ids, tmp)
+        print(f"\nWhitelistDB, {result['rules']} rules: insert {result['insert_ms']:.0f} ms, "
+              f"load+compile {result['load_ms']:.0f} ms, {result['found']} found, {result['lookup_ns']:.0f} ns/lookup")
+    return results
+
+
+if __name__ == "__main__":
+    main()
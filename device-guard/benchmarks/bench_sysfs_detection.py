@@ -0,0 +1,64 @@
+"""
+Linux sysfs detection backend throughput benchmark.
+
+Builds synthetic /sys trees with thousands of USB devices (a quarter of them
+mounted USB disks) and times full SysfsDetectionBackend scans over them,
+checking every device and mount point is found.
+
+    python benchmarks/bench_sysfs_detection.py [--devices 1000 5000] [--repeat 5]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks import fakes
+from src.core.detector import SysfsDetectionBackend
+from src.utils.logger import log
+
+
+def bench_tree(count, repeat, storage_every=4):
+    with tempfile.TemporaryDirectory() as root:
+        canonical_ids = fakes.build_sysfs_tree(root, count, storage_every=storage_every, hubs=4)
+
+        backend = SysfsDetectionBackend(root)
+        delta = backend.refresh()
+        storage, other = backend.separated()
+        assert len(delta.added) == count
+        assert sorted(d.canonical_id for d in storage + other) == sorted(canonical_ids)
+        assert len(storage) == len(range(0, count, storage_every))
+        assert all(d.drive_letter.startswith("/media/usb") for d in storage)
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            delta = backend.refresh()
+            timings.append(time.perf_counter() - started)
+            assert not (delta.added or delta.removed or delta.changed)
+        best = min(timings)
+        return {"devices": count, "scan_ms": best * 1000, "devices_per_s": count / best}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    results = []
+    print(f"\n{'devices':>8} {'scan (ms)':>10} {'devices/s':>12}")
+    for count in args.devices:
+        result = bench_tree(count, args.repeat)
+        results.append(result)
+        print(f"{result['devices']:>8} {result['scan_ms']:>10.1f} {result['devices_per_s']:>12,.0f}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Multi-drive verification benchmark.
+
+Simulates a hub of --drives registered sticks: each "drive" is a sparse disk
+image whose partition structures are read with read_structure(), plus a
+per-drive device latency (--latency-ms, spread from 20% to 100%, standing in
+for USB I/O and mounting), plus an ECDSA lockfile check when cryptography is
+installed. The drives are verified one after another, as the monitor thread
+used to, and through VerificationQueue. The queue should take about as long
+as the slowest drive. A hung drive is added last to show that --timeout
+bounds it without holding up the others.
+
+    python benchmarks/bench_verification_pipeline.py [--drives 16] [--latency-ms 200] [--timeout 1.0]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.fakes import build_disk_image
+from src.core.device_record import DeviceRecord
+from src.security.disk_structure import read_structure
+from src.security.verification_queue import VerificationQueue, VERIFY_PASSED, VERIFY_TIMED_OUT
+from src.utils.logger import log
+
+
+def lockfile_checker():
+    """ECDSA check of a signed payload with a key derived once, or None without cryptography."""
+    try:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+    except ImportError:
+        return None
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_key = private_key.public_key()
+    payload = b"DeviceGuardLock_RegisteredOn_2025-01-01T00:00:00+00:00"
+    content = f"{private_key.sign(payload, ec.ECDSA(hashes.SHA256())).hex()}::{payload.decode()}"
+
+    def check():
+        signature_hex, payload_str = content.split("::", 1)
+        public_key.verify(bytes.fromhex(signature_hex), payload_str.encode(), ec.ECDSA(hashes.SHA256()))
+        return True
+    return check
+
+
+def make_verifier(images, checker):
+    def verify(device, details):
+        time.sleep(details["latency"])
+        structure = read_structure(images[device.canonical_id])
+        if structure.fingerprint != details["structural_fingerprint"]:
+            return False
+        return checker() if checker else True
+    return verify
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drives", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    log.setLevel("ERROR")
+    checker = lockfile_checker()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        devices, details, images = [], {}, {}
+        for i in range(args.drives):
+            device = DeviceRecord(f"Stick {i}", "0781", "5591", f"SN{i:04d}", f"VID_0781&PID_5591&SN_{i:04d}",
+                                  f"USBSTOR\\DISK&VEN_SANDISK\\{i:04d}", f"{chr(ord('E') + i % 20)}:")
+            images[device.canonical_id] = build_disk_image(os.path.join(tmp, f"stick{i}.img"), partitions=1 + i % 4)
+            details[device.canonical_id] = {
+                "structural_fingerprint": read_structure(images[device.canonical_id]).fingerprint,
+                "latency": args.latency_ms / 1000 * (0.2 + 0.8 * i / max(args.drives - 1, 1)),
+            }
+            devices.append(device)
+        verify = make_verifier(images, checker)
+        slowest = max(entry["latency"] for entry in details.values())
+
+        started = time.perf_counter()
+        assert all(verify(device, details[device.canonical_id]) for device in devices)
+        sequential = time.perf_counter() - started
+
+        outcomes, finished_at = {}, {}
+        finished = threading.Event()
+
+        def record(device, _, outcome):
+            outcomes[device.canonical_id] = outcome
+            finished_at[device.canonical_id] = time.perf_counter()
+            if len(outcomes) == len(devices):
+                finished.set()
+
+        queue = VerificationQueue(verify, max_workers=args.drives + 1, timeout=args.timeout, on_result=record)
+        queue.start()
+        started = time.perf_counter()
+        for device in devices:
+            queue.submit(device, details[device.canonical_id])
+        finished.wait(60)
+        concurrent = time.perf_counter() - started
+        assert all(outcome == VERIFY_PASSED for outcome in outcomes.values()), outcomes
+
+        # One drive that never answers: it times out, the others are unaffected
+        outcomes.clear()
+        finished.clear()
+        hung = DeviceRecord("Hung stick", "0781", "5591", "HUNG", "VID_0781&PID_5591&SN_HUNG", "USBSTOR\\HUNG", "Z:")
+        images[hung.canonical_id] = images[devices[0].canonical_id]
+        devices.append(hung)
+        started = time.perf_counter()
+        queue.submit(hung, dict(details[devices[0].canonical_id], latency=args.timeout * 1.5))
+        for device in devices[:-1]:
+            queue.submit(device, details[device.canonical_id])
+        finished.wait(60)
+        hung_s = finished_at.pop(hung.canonical_id) - started
+        with_hung = max(finished_at.values()) - started
+        queue.shutdown(wait=True)  # The hung worker finishes late; its result is dropped
+        assert outcomes[hung.canonical_id] == VERIFY_TIMED_OUT
+
+    print(f"\n{args.drives} drives, device latency {args.latency_ms * 0.2:.0f}-{args.latency_ms:.0f} ms, "
+          f"lockfile ECDSA {'on' if checker else 'skipped (cryptography not installed)'}")
+    print(f"{'sequential':<24} {sequential * 1000:>8.0f} ms")
+    print(f"{'VerificationQueue':<24} {concurrent * 1000:>8.0f} ms   (slowest drive {slowest * 1000:.0f} ms, "
+          f"x{sequential / concurrent:.1f})")
+    print(f"{'... beside a hung drive':<24} {with_hung * 1000:>8.0f} ms   (the hung one timed out at {hung_s * 1000:.0f} ms)")
+    return {"sequential": sequential, "concurrent": concurrent, "slowest": slowest, "with_hung": with_hung, "hung": hung_s}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Whitelist bulk import/export benchmark.
+
+Writes an NDJSON whitelist of --devices entries, imports it into a fresh
+WhitelistDB in each conflict mode, and streams it back out as NDJSON and CSV.
+Each step is timed on its own and then repeated under tracemalloc to report
+its peak Python memory, which should not grow with the number of devices.
+For comparison, the one-call-per-device register_device path is timed on
+--legacy devices.
+
+    python benchmarks/bench_whitelist_io.py [--devices 20000 100000] [--legacy 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.core import whitelist_io
+from src.core.db import WhitelistDB, IMPORT_SKIP, IMPORT_UPSERT, IMPORT_REPLACE
+from src.utils.logger import log
+
+
+def write_whitelist(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            storage = i % 4 == 0
+            f.write(json.dumps({
+                "canonical_id": f"VID_0781&PID_5591&SN_{i:020d}",
+                "friendly_name": f"Device {i}",
+                "device_type": "storage" if storage else "peripheral",
+                "added_on": "2025-01-01T00:00:00",
+                "structural_fingerprint": "f" * 64 if storage else None,
+                "lockfile_signature": "a" * 140 if storage else None,
+            }) + "\n")
+
+
+def measure(step):
+    """Runs step() plainly for its time, then again under tracemalloc for its peak memory."""
+    started = time.perf_counter()
+    result = step()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_size(count, tmp):
+    source = os.path.join(tmp, f"whitelist_{count}.ndjson")
+    write_whitelist(source, count)
+    db = WhitelistDB(os.path.join(tmp, f"whitelist_{count}.db"))
+    rows = []
+    try:
+        def import_file(mode):
+            def step():
+                with open(source, encoding="utf-8") as f:
+                    return db.import_devices(whitelist_io.read_ndjson(f), mode=mode)
+            return step
+
+        for mode in (IMPORT_SKIP, IMPORT_UPSERT, IMPORT_REPLACE):
+            counts, seconds, peak = measure(import_file(mode))
+            rows.append((f"import ({mode})", counts["imported"], seconds, peak))
+        assert len(db.get_many_device_details([f"VID_0781&PID_5591&SN_{i:020d}" for i in (0, count - 1)])) == 2
+
+        for fmt in (whitelist_io.FORMAT_NDJSON, whitelist_io.FORMAT_CSV):
+            def export_step(fmt=fmt):
+                written = 0
+                with open(os.devnull, "w") as sink:
+                    for chunk in whitelist_io.export_rows(db.iter_devices(), fmt):
+                        written += len(chunk)
+                        sink.write(chunk)
+                return written
+            written, seconds, peak = measure(export_step)
+            rows.append((f"export ({fmt})", count, seconds, peak))
+    finally:
+        db.close()
+    return rows
+
+
+def bench_legacy(count, tmp):
+    db = WhitelistDB(os.path.join(tmp, "legacy.db"))
+    try:
+        started = time.perf_counter()
+        for i in range(count):
+            db.register_device(f"VID_0781&PID_5591&SN_{i:020d}", f"Device {i}", "peripheral")
+        return time.perf_counter() - started
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--legacy", type=int, default=2000)
+    args = parser.parse_args(argv)
+    log.setLevel("WARNING")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n{'devices':>8} {'step':<18} {'rows':>8} {'seconds':>8} {'rows/s':>10} {'peak KiB':>9}")
+        for count in args.devices:
+            results[count] = bench_size(count, tmp)
+            for step, rows, seconds, peak in results[count]:
+                print(f"{count:>8} {step:<18} {rows:>8} {seconds:>8.2f} {rows / seconds:>10,.0f} {peak / 1024:>9.0f}")
+        if args.legacy:
+            seconds = bench_legacy(args.legacy, tmp)
+            print(f"\nregister_device() one at a time: {args.legacy / seconds:,.0f} devices/s "
+                  f"({max(args.devices) / (args.legacy / seconds):.0f} s for {max(args.devices)})")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+In-process fakes for the Windows-only modules the engine imports, so the
+benchmarks run on any platform.
+
+    from benchmarks import fakes
+    provider = fakes.install()          # must run before importing src.* modules
+    provider.add_usb_devices(100)
+
+build_sysfs_tree() writes a fake sysfs/procfs tree for the Linux backend, and
+build_disk_image() a sparse GPT/MBR disk image for the structural fingerprint.
+"""
+import os
+import sys
+import math
+import time
+import types
+import threading
+import subprocess
+from collections import deque
+from datetime import datetime, timezone
+
+
+class FakeWMIObject:
+    """A WMI instance: attributes plus associators() and the methods the engine calls."""
+
+    def __init__(self, associations=None, **properties):
+        self.__dict__.update(properties)
+        self._associations = associations or {}
+        self.disabled = False
+
+    def associators(self, wmi_association_class=""):
+        return list(self._associations.get(wmi_association_class, ()))
+
+    def Disable(self):
+        self.disabled = True
+        return (0,)
+
+
+class x_wmi_timed_out(Exception):
+    pass
+
+
+class FakeWMIWatcher:
+    """
+    A watch_for() watcher. Like WMI polling intrinsic events, it hands out an
+    instance event only at the first WITHIN tick after the change; events
+    carry `event_type` and the `timestamp` (naive UTC) of the change.
+    """
+
+    def __init__(self, within):
+        self.within = within
+        self.started = time.monotonic()
+        self.error = None
+        self._pending = deque()
+        self._cond = threading.Condition()
+
+    def push(self, event_type, instance):
+        properties = {k: v for k, v in instance.__dict__.items() if not k.startswith("_") and k != "disabled"}
+        event = FakeWMIObject(event_type=event_type, timestamp=datetime.now(timezone.utc).replace(tzinfo=None),
+                              **properties)
+        with self._cond:
+            ticks = math.ceil((time.monotonic() - self.started) / self.within)
+            self._pending.append((self.started + ticks * self.within, event))
+            self._cond.notify_all()
+
+    def fail(self, error):
+        """Makes the next call raise `error`, like a dropped WMI connection."""
+        with self._cond:
+            self.error = error
+            self._cond.notify_all()
+
+    def __call__(self, timeout_ms=None):
+        deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000
+        with self._cond:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                now = time.monotonic()
+                if self._pending and self._pending[0][0] <= now:
+                    return self._pending.popleft()[1]
+                wake = self._pending[0][0] if self._pending else None
+                if deadline is not None:
+                    if now >= deadline:
+                        raise x_wmi_timed_out()
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._cond.wait(None if wake is None else wake - now)
+
+
+def _unescape_path_key(path):
+    """Extracts the DeviceID from 'Win32_PnPEntity.DeviceID="..."'."""
+    key = path.split('=', 1)[1]
+    return key[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+
+
+class FakeWMIProvider:
+    """
+    Holds the fake machine state shared by every FakeWMI connection.
+    query() understands the handful of WQL shapes the engine issues.
+    """
+
+    def __init__(self):
+        self.entities = []
+        self.disks = []
+        self._by_device_id = {}
+        self.calls = {"query": 0, "get": 0, "enumerate": 0, "associators": 0}
+        self.watchers = []
+        # Raised by watch_for() while set, e.g. to simulate an unreachable WMI service
+        self.watch_error = None
+
+    # --- machine setup -------------------------------------------------
+    def add_entity(self, device_id, caption="Fake Device"):
+        entity = FakeWMIObject(DeviceID=device_id, Caption=caption)
+        self.entities.append(entity)
+        self._by_device_id[device_id] = entity
+        for watcher in self.watchers:
+            watcher.push("creation", entity)
+        return entity
+
+    def add_usb_devices(self, count, storage_every=4, start=0):
+        """Adds `count` USB devices; every `storage_every`-th one is a mounted USB stick."""
+        for i in range(start, start + count):
+            serial = f"SN{i:012d}"
+            if storage_every and i % storage_every == 0:
+                self.add_entity(f"USB\\VID_0781&PID_5591\\{serial}", "USB Mass Storage Device")
+                self.add_entity(f"USBSTOR\\DISK&VEN_SANDISK&PROD_CRUZER&REV_1.00\\{serial}&0", "SanDisk Cruzer USB Device")
+                self.add_disk(serial, f"{chr(ord('D') + (i // storage_every) % 22)}:")
+            else:
+                self.add_entity(f"USB\\VID_{0x1000 + i % 0xE000:04X}&PID_{i % 0xFFFF:04X}\\{serial}", "USB Input Device")
+
+    def add_other_entities(self, count):
+        """Adds non-USB PnP entities (PCI, ACPI...) that a USB scan should never touch."""
+        for i in range(count):
+            self.add_entity(f"PCI\\VEN_8086&DEV_{i:04X}\\3&11583659&0&{i:02X}", "PCI Device")
+
+    def add_disk(self, serial, drive_letter):
+        logical = FakeWMIObject(DeviceID=drive_letter)
+        partition = FakeWMIObject(DeviceID=f"Disk #{len(self.disks)}, Partition #0",
+                                  associations={"Win32_LogicalDiskToPartition": [logical]})
+        disk = FakeWMIObject(
+            DeviceID=f"\\\\.\\PHYSICALDRIVE{len(self.disks) + 1}",
+            PNPDeviceID=f"USBSTOR\\DISK&VEN_SANDISK&PROD_CRUZER\\{serial}",
+            InterfaceType="USB", Model="SanDisk Cruzer", Size="32000000000", Signature="12345678",
+            associations={"Win32_DiskDriveToDiskPartition": [partition]})
+        self.disks.append(disk)
+        return disk
+
+    def remove_disk(self, serial):
+        """Unplugs the disk with `serial`; the next add_disk() reuses its PHYSICALDRIVE number, as Windows does."""
+        self.disks = [d for d in self.disks if not d.PNPDeviceID.endswith(f"\\{serial}")]
+
+    def remove_entity(self, device_id):
+        entity = self._by_device_id.pop(device_id, None)
+        if entity is not None:
+            self.entities.remove(entity)
+            for watcher in self.watchers:
+                watcher.push("deletion", entity)
+
+    def fail_watchers(self, error):
+        """Breaks every open watcher with `error`."""
+        watchers, self.watchers = self.watchers, []
+        for watcher in watchers:
+            watcher.fail(error)
+
+    # --- WMI surface -----------------------------------------------------
+    def query(self, wql):
+        self.calls["query"] += 1
+        if "FROM Win32_DiskDrive" in wql:
+            return [d for d in self.disks if d.InterfaceType == "USB"]
+        if "FROM Win32_PnPEntity" in wql:
+            if "DeviceID = '" in wql:
+                key = wql.split("DeviceID = '", 1)[1][:-1].replace("\\'", "'").replace('\\\\', '\\')
+                entity = self._by_device_id.get(key)
+                return [entity] if entity else []
+            if "LIKE" in wql:
+                return [e for e in self.entities if e.DeviceID.startswith(("USB\\", "USBSTOR\\"))]
+            return list(self.entities)
+        if wql.startswith("ASSOCIATORS OF"):
+            self.calls["associators"] += 1
+            return self.disks[:1]
+        return []
+
+    def get(self, path):
+        self.calls["get"] += 1
+        entity = self._by_device_id.get(_unescape_path_key(path))
+        if entity is None:
+            raise x_wmi_timed_out(f"Not found: {path}")
+        return entity
+
+    def watch_for(self, raw_wql=None, notification_type="operation", wmi_class=None, delay_secs=1, **unused_where):
+        if self.watch_error is not None:
+            raise self.watch_error
+        within = float(raw_wql.split("WITHIN ", 1)[1].split()[0]) if raw_wql and "WITHIN " in raw_wql else delay_secs
+        watcher = FakeWMIWatcher(within)
+        self.watchers.append(watcher)
+        return watcher
+
+    def Win32_PnPEntity(self, **filters):
+        self.calls["enumerate"] += 1
+        return [e for e in self.entities if all(getattr(e, k) == v for k, v in filters.items())]
+
+    def Win32_DiskDrive(self, **filters):
+        return [d for d in self.disks if all(getattr(d, k) == v for k, v in filters.items())]
+
+
+class FakeRegistry:
+    """Stand-in for winreg: keys are dicts of value name -> (type, data)."""
+
+    HKEY_CURRENT_USER = "HKEY_CURRENT_USER"
+    HKEY_LOCAL_MACHINE = "HKEY_LOCAL_MACHINE"
+    KEY_SET_VALUE = 0x0002
+    KEY_READ = 0x20019
+    REG_DWORD = 4
+    REG_SZ = 1
+
+    def __init__(self):
+        self.keys = {}
+        self.writes = 0
+
+    class _Key:
+        def __init__(self, values):
+            self.values = values
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def OpenKey(self, root, path, reserved=0, access=0):
+        return self._Key(self.keys.setdefault((root, path), {}))
+
+    CreateKey = OpenKey
+
+    def SetValueEx(self, key, name, reserved, value_type, value):
+        self.writes += 1
+        key.values[name] = (value_type, value)
+
+    def QueryValueEx(self, key, name):
+        if name not in key.values:
+            raise FileNotFoundError(name)
+        value_type, value = key.values[name]
+        return value, value_type
+
+
+class FakeSubprocess:
+    """Replacement for subprocess.run that records commands instead of running them."""
+
+    def __init__(self, returncode=0):
+        self.returncode = returncode
+        self.commands = []
+
+    def run(self, args, *unused_args, **unused_kwargs):
+        self.commands.append(args)
+        return subprocess.CompletedProcess(args, self.returncode, b"", b"")
+
+
+class FakeWMI:
+    """Stand-in for wmi.WMI(); every connection talks to the installed provider."""
+
+    provider = FakeWMIProvider()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(FakeWMI.provider, name)
+
+
+registry = FakeRegistry()
+subprocess_runner = FakeSubprocess()
+_real_subprocess_run = subprocess.run
+
+
+def install(provider=None):
+    """
+    Registers fake `wmi`, `pythoncom` and `winreg` modules, routes
+    subprocess.run through FakeSubprocess, and returns the active provider.
+    """
+    FakeWMI.provider = provider or FakeWMIProvider()
+
+    wmi_module = types.ModuleType("wmi")
+    wmi_module.WMI = FakeWMI
+    wmi_module.x_wmi_timed_out = x_wmi_timed_out
+    sys.modules["wmi"] = wmi_module
+
+    pythoncom_module = types.ModuleType("pythoncom")
+    pythoncom_module.CoInitialize = lambda: None
+    pythoncom_module.CoUninitialize = lambda: None
+    sys.modules["pythoncom"] = pythoncom_module
+
+    winreg_module = types.ModuleType("winreg")
+    for name in dir(registry):
+        if not name.startswith("_"):
+            setattr(winreg_module, name, getattr(registry, name))
+    sys.modules["winreg"] = winreg_module
+
+    subprocess.run = subprocess_runner.run
+
+    return FakeWMI.provider
+
+
+def uninstall_subprocess():
+    """Restores the real subprocess.run."""
+    subprocess.run = _real_subprocess_run
+
+
+def use_provider(provider):
+    """Swaps the machine state seen by all fake WMI connections."""
+    FakeWMI.provider = provider
+    return provider
+
+
+def _write(path, value):
+    with open(path, "w") as f:
+        f.write(f"{value}\n")
+
+
+def _disk_name(index):
+    """SCSI disk names as the kernel assigns them: sda..sdz, sdaa, sdab..."""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord('a') + rem) + letters
+    return f"sd{letters}"
+
+
+def build_sysfs_tree(root, count, storage_every=4, hubs=1):
+    """
+    Writes a fake /sys/bus/usb/devices, /sys/block and /proc/self/mounts under
+    `root` with `count` USB devices (plus root hubs and one interface each);
+    every `storage_every`-th device is a mounted USB disk. Returns the
+    canonical IDs of the devices, in creation order.
+    """
+    devices_dir = os.path.join(root, "sys", "devices", "pci0000:00", "0000:00:14.0")
+    bus_dir = os.path.join(root, "sys", "bus", "usb", "devices")
+    block_dir = os.path.join(root, "sys", "block")
+    for path in (devices_dir, bus_dir, block_dir, os.path.join(root, "proc", "self")):
+        os.makedirs(path, exist_ok=True)
+
+    canonical_ids, mounts = [], []
+    for hub in range(1, hubs + 1):
+        hub_dir = os.path.join(devices_dir, f"usb{hub}")
+        os.makedirs(hub_dir)
+        _write(os.path.join(hub_dir, "idVendor"), "1d6b")
+        _write(os.path.join(hub_dir, "idProduct"), "0002")
+        os.symlink(os.path.relpath(hub_dir, bus_dir), os.path.join(bus_dir, f"usb{hub}"))
+
+    for i in range(count):
+        hub = i % hubs + 1
+        name = f"{hub}-{i // hubs + 1}"
+        device_dir = os.path.join(devices_dir, f"usb{hub}", name)
+        interface_dir = os.path.join(device_dir, f"{name}:1.0")
+        os.makedirs(interface_dir)
+        os.symlink(os.path.relpath(device_dir, bus_dir), os.path.join(bus_dir, name))
+        os.symlink(os.path.relpath(interface_dir, bus_dir), os.path.join(bus_dir, f"{name}:1.0"))
+        serial = f"SN{i:012d}"
+        if storage_every and i % storage_every == 0:
+            vid, pid, product = "0781", "5591", "Cruzer"
+            disk = _disk_name(i // storage_every)
+            block_target = os.path.join(interface_dir, "host0", "target0:0:0", "0:0:0:0", "block", disk)
+            os.makedirs(block_target)
+            os.symlink(os.path.relpath(block_target, block_dir), os.path.join(block_dir, disk))
+            mounts.append(f"/dev/{disk}1 /media/usb{i} vfat rw,relatime 0 0")
+        else:
+            vid, pid, product = f"{0x1000 + i % 0xE000:04x}", f"{i % 0xFFFF:04x}", "USB Input Device"
+        _write(os.path.join(device_dir, "idVendor"), vid)
+        _write(os.path.join(device_dir, "idProduct"), pid)
+        _write(os.path.join(device_dir, "serial"), serial)
+        _write(os.path.join(device_dir, "product"), product)
+        canonical_ids.append(f"VID_{vid.upper()}&PID_{pid.upper()}&SN_{serial}")
+
+    with open(os.path.join(root, "proc", "self", "mounts"), "w") as f:
+        f.write("sysfs /sys sysfs rw 0 0\n")
+        f.writelines(f"{line}\n" for line in mounts)
+    return canonical_ids
+
+
+def build_disk_image(path, scheme="gpt", sector_size=512, partitions=4, size=64 * 1024 * 1024, entries=128):
+    """
+    Writes a sparse disk image with a partition table: "gpt" (protective MBR,
+    header at LBA1 and an `entries` x 128-byte array at LBA2, CRCs filled in),
+    "mbr" (up to four primary entries) or "none" (a bare volume boot sector).
+    """
+    import zlib
+    import struct
+
+    lba0 = bytearray(sector_size)
+    total_lbas = size // sector_size
+    part_lbas = max(1, (total_lbas - 2048) // max(partitions, 1))
+    with open(path, "wb") as f:
+        f.truncate(size)
+        if scheme == "none":
+            lba0[0:11] = b"\xeb\x3c\x90MSDOS5.0"
+            f.write(lba0)
+            return path
+        if scheme == "mbr":
+            for i in range(min(partitions, 4)):
+                struct.pack_into("<B3sB3sII", lba0, 446 + 16 * i, 0, b"\0\0\0", 0x0C, b"\0\0\0",
+                                 2048 + i * part_lbas, part_lbas)
+            lba0[510:512] = b"\x55\xaa"
+            f.write(lba0)
+            return path
+
+        struct.pack_into("<B3sB3sII", lba0, 446, 0, b"\0\x02\0", 0xEE, b"\xff\xff\xff", 1,
+                         min(total_lbas - 1, 0xFFFFFFFF))
+        lba0[510:512] = b"\x55\xaa"
+        array = bytearray(entries * 128)
+        basic_data = bytes.fromhex("a2a0d0ebe5b9334487c068b6b72699c7")
+        for i in range(partitions):
+            first = 2048 + i * part_lbas
+            unique = struct.pack("<QQ", 0x5EED0000 + i, len(path))
+            name = f"Partition {i + 1}".encode("utf-16-le")
+            struct.pack_into("<16s16sQQQ72s", array, i * 128, basic_data, unique, first, first + part_lbas - 1, 0, name)
+        entry_lbas = -(-len(array) // sector_size)
+        header = bytearray(92)
+        struct.pack_into("<8sIIIIQQQQ16sQIII", header, 0, b"EFI PART", 0x00010000, 92, 0, 0, 1, total_lbas - 1,
+                         2 + entry_lbas, total_lbas - 2 - entry_lbas, b"DEVICEGUARDTEST!", 2, entries, 128,
+                         zlib.crc32(array))
+        struct.pack_into("<I", header, 16, zlib.crc32(header))
+        f.write(lba0)
+        f.write(header.ljust(sector_size, b"\0"))
+        f.write(array)
+    return path
@@ -0,0 +1,376 @@
+"""
+Benchmark suite for the engine's hot paths, with regression thresholds.
+
+Runs on any platform: wmi, pythoncom, winreg and subprocess.run are replaced
+by the in-process fakes in benchmarks/fakes.py. Cases that need a real
+dependency that is not installed (e.g. cryptography for the fingerprinter)
+are reported as skipped.
+
+Each case reports the best (minimum) time per operation over --repeat runs,
+the least noisy estimate on shared machines. With --save the results
+become the baseline; otherwise they are compared against it and the run
+exits with status 1 if any case got slower than its threshold allows.
+Baselines are machine specific: save one per reference host.
+
+    python benchmarks/suite.py --save                # record benchmarks/baseline.json
+    python benchmarks/suite.py                       # compare against it
+    python benchmarks/suite.py --only detector_scan_1000 db_lookup --threshold 0.5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks import fakes
+
+provider = fakes.install()
+
+from src.core import detector
+from src.core.db import WhitelistDB
+from src.core.device_record import DeviceRecord
+from src.utils.log_reader import LogTailReader
+from src.utils.logger import log
+
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json")
+# A case fails when it is this much slower than its baseline (0.5 = 50%). Cases
+# with their own threshold use the larger of the two.
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_REPEAT = 15
+
+CASES = []
+
+
+class Skip(Exception):
+    """Raised by a case's setup when it cannot run here."""
+
+
+def case(name, threshold=None):
+    """
+    Registers a benchmark case. The decorated generator does its setup, yields
+    (operation, ops_per_call), and may clean up after the yield.
+    """
+    def register(func):
+        CASES.append((name, func, threshold))
+        return func
+    return register
+
+
+def _fresh_machine(usb_devices):
+    machine = fakes.FakeWMIProvider()
+    machine.add_usb_devices(usb_devices)
+    fakes.use_provider(machine)
+    detector.set_backend(detector.WMIDetectionBackend())
+    return machine
+
+
+def _registered_db(tmp, canonical_ids):
+    db = WhitelistDB(os.path.join(tmp, "whitelist.db"))
+    for i, canonical_id in enumerate(canonical_ids):
+        db.register_device(canonical_id, f"Device {i}", "peripheral")
+    return db
+
+
+def _require_fingerprinter():
+    try:
+        from src.security.fingerprinter import Fingerprinter
+    except ImportError as e:
+        raise Skip(f"fingerprinter unavailable: {e}")
+    return Fingerprinter
+
+
+# --- Detector ----------------------------------------------------------------
+def _detector_case(count):
+    def run(tmp):
+        _fresh_machine(count)
+        detector.get_separated_usb_devices()
+        yield detector.get_separated_usb_devices, 1
+    return run
+
+
+for _count in (10, 100, 1000):
+    case(f"detector_scan_{_count}")(_detector_case(_count))
+
+
+# --- Whitelist database --------------------------------------------------------
+@case("db_lookup")
+def db_lookup(tmp):
+    ids = [f"VID_0781&PID_5591&SN_{i:020d}" for i in range(1000)]
+    db = _registered_db(tmp, ids)
+
+    def lookups():
+        for canonical_id in ids:
+            db.get_device_details(canonical_id)
+    try:
+        yield lookups, len(ids)
+    finally:
+        db.close()
+
+
+@case("db_lookup_many")
+def db_lookup_many(tmp):
+    ids = [f"VID_0781&PID_5591&SN_{i:020d}" for i in range(1000)]
+    db = _registered_db(tmp, ids)
+    scan = ids[::10]
+    try:
+        yield (lambda: db.get_many_device_details(scan)), 1
+    finally:
+        db.close()
+
+
+@case("db_write", threshold=1.0)
+def db_write(tmp):
+    db = _registered_db(tmp, [f"VID_0781&PID_5591&SN_{i:020d}" for i in range(1000)])
+
+    def register_and_remove():
+        db.register_device("VID_1234&PID_5678&SN_BENCH", "Bench Device", "storage", "f" * 64, "a" * 140)
+        db.remove_device("VID_1234&PID_5678&SN_BENCH")
+    try:
+        yield register_and_remove, 2
+    finally:
+        db.close()
+
+
+@case("rule_match_100k")
+def rule_match_100k(tmp):
+    from benchmarks.bench_rule_matcher import generate_rules, generate_ids
+    from src.core.rules import RuleMatcher
+
+    rules = generate_rules(100000)
+    ids = generate_ids(rules, 1000)
+    matcher = RuleMatcher(rules)
+
+    def decisions():
+        for canonical_id in ids:
+            matcher.match(canonical_id)
+    yield decisions, len(ids)
+
+
+# --- Fingerprinter -------------------------------------------------------------
+def _prepared_drive(tmp):
+    Fingerprinter = _require_fingerprinter()
+    _fresh_machine(4)
+    fingerprinter = Fingerprinter()
+    if fingerprinter.host_key is None:
+        raise Skip("host key unavailable")
+    drive = os.path.join(tmp, "drive")
+    os.makedirs(os.path.join(drive, ".device_guard"))  # Pre-created, so no attrib call
+    fingerprint = fingerprinter.calculate_structural_fingerprint(drive)
+    signature = fingerprinter.create_signed_lockfile(drive)
+    if not (fingerprint and signature):
+        raise Skip("could not fingerprint the fake drive")
+    return fingerprinter, drive, fingerprint, signature
+
+
+@case("verify_device_full")
+def verify_device_full(tmp):
+    fingerprinter, drive, fingerprint, signature = _prepared_drive(tmp)
+
+    def verify():
+        assert fingerprinter.verify_device(drive, fingerprint, signature)
+    yield verify, 1
+
+
+@case("verify_device_cached")
+def verify_device_cached(tmp):
+    fingerprinter, drive, fingerprint, signature = _prepared_drive(tmp)
+
+    def verify():
+        assert fingerprinter.verify_device(drive, fingerprint, signature, canonical_id="VID_0781&PID_5591&SN_BENCH")
+    yield verify, 1
+
+
+@case("structural_fingerprint_gpt")
+def structural_fingerprint_gpt(tmp):
+    from src.security.disk_structure import read_structure
+
+    image = fakes.build_disk_image(os.path.join(tmp, "disk.img"), partitions=4)
+    yield (lambda: read_structure(image)), 1
+
+
+# --- Application log (read_app_log delegates to LogTailReader) ------------------
+def _large_log(tmp, lines=200000):
+    path = os.path.join(tmp, "app_log.log")
+    line = "2025-09-26 16:21:55,474 - USBGuardApp - INFO - Detector found 1 storage devices and {} other devices.\n"
+    with open(path, "w") as f:
+        f.writelines(line.format(i) for i in range(lines))
+    return path, line
+
+
+@case("log_tail_cold")
+def log_tail_cold(tmp):
+    path, _ = _large_log(tmp)
+    reader = LogTailReader(path)
+
+    def cold_read():
+        reader.reset()
+        assert len(reader.read(100)) == 100
+    yield cold_read, 1
+
+
+@case("log_tail_poll")
+def log_tail_poll(tmp):
+    path, line = _large_log(tmp)
+    reader = LogTailReader(path)
+    reader.read(100)
+    log_file = open(path, "a")
+
+    def poll():
+        log_file.write(line.format("new"))
+        log_file.flush()
+        reader.read(100)
+    try:
+        yield poll, 1
+    finally:
+        log_file.close()
+
+
+# --- Service ---------------------------------------------------------------------
+def _service(tmp, usb_devices, event_source=None):
+    _require_fingerprinter()
+    from src.core.event_store import EventStore
+    from src.core.events import SyntheticEventSource
+    from src.services.usb_guard_service import USBGuardService
+
+    machine = _fresh_machine(usb_devices)
+    storage, other = detector.get_separated_usb_devices()
+    # Register half of the devices so each cycle resolves both outcomes
+    db = _registered_db(tmp, [device.canonical_id for device in (storage + other)[::2]])
+    service = USBGuardService(event_source=event_source or SyntheticEventSource(), db=db,
+                              events=EventStore(os.path.join(tmp, "events.db")))
+    return service, machine
+
+
+@case("check_device_changes_100")
+def check_device_changes(tmp):
+    service, _ = _service(tmp, 100)
+    service.enforcement.start()
+    service._check_device_changes()  # First cycle: every device is new
+    try:
+        yield service._check_device_changes, 1
+    finally:
+        service.enforcement.shutdown()
+        service.db.close()
+        service.events.close()
+
+
+@case("synthetic_event_latency", threshold=1.0)
+def synthetic_event_latency(tmp):
+    from src.core.events import SyntheticEventSource
+
+    source = SyntheticEventSource()
+    service, _ = _service(tmp, 100, event_source=source)
+    device = DeviceRecord("Bench Keyboard", "046D", "C52B", "BENCH", "VID_046D&PID_C52B&SN_BENCH",
+                          "USB\\VID_046D&PID_C52B\\BENCH", None)
+    service.db.register_device(device.canonical_id, device.friendly_name, "peripheral")
+    service.start()
+
+    def arrive_and_decide():
+        service.last_decision_latency_ms = None
+        source.arrive(device)
+        deadline = time.monotonic() + 5
+        while service.last_decision_latency_ms is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError("service did not handle the event")
+            time.sleep(0.0001)
+    try:
+        # Let the startup scan finish first
+        arrive_and_decide()
+        yield arrive_and_decide, 1
+    finally:
+        service.stop()
+        service.db.close()
+        service.events.close()
+
+
+# --- Runner ------------------------------------------------------------------------
+def run_case(func, repeat):
+    """Returns the best seconds per operation of one case."""
+    tmp = tempfile.mkdtemp(prefix="dg-bench-")
+    try:
+        steps = func(tmp)
+        operation, ops = next(steps)
+        operation()  # Warm-up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            operation()
+            timings.append((time.perf_counter() - started) / ops)
+        steps.close()
+        return min(timings)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(results, baseline, default_threshold, thresholds):
+    """Returns [(name, current, previous, allowed ratio)] for cases slower than allowed."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        threshold = thresholds.get(name)
+        allowed = 1 + (default_threshold if threshold is None else max(threshold, default_threshold))
+        if current["per_op_us"] > previous["per_op_us"] * allowed:
+            regressions.append((name, current["per_op_us"], previous["per_op_us"], allowed))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", nargs="+", help="case names to run")
+    args = parser.parse_args(argv)
+    log.setLevel("CRITICAL")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results, thresholds = {}, {}
+    print(f"\n{'case':<28} {'us/op':>12} {'baseline':>12} {'change':>8}")
+    for name, func, threshold in CASES:
+        if args.only and name not in args.only:
+            continue
+        thresholds[name] = threshold
+        try:
+            seconds = run_case(func, args.repeat)
+        except Skip as e:
+            print(f"{name:<28} {'skipped':>12}  ({e})")
+            continue
+        results[name] = {"per_op_us": round(seconds * 1e6, 3)}
+        previous = baseline.get(name, {}).get("per_op_us")
+        change = f"{(seconds * 1e6 / previous - 1) * 100:+7.1f}%" if previous else ""
+        print(f"{name:<28} {seconds * 1e6:>12.2f} {previous or '':>12} {change:>8}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                         "machine": platform.machine(), "saved": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                "results": results
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, thresholds)
+    for name, current, previous, allowed in regressions:
+        print(f"REGRESSION {name}: {current:.2f} us/op vs {previous:.2f} baseline (allowed x{allowed:.2f})")
+    if not baseline:
+        print("\nNo baseline found; run with --save to record one.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
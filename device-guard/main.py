@@ -2,56 +2,101 @@ import webview
 import threading
 import sys
 import os
-import wmi
-import re
+import io
+import json
 from datetime import datetime
+from collections import OrderedDict
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 if APP_ROOT not in sys.path:
     sys.path.append(APP_ROOT)
 
-from flask import Flask, render_template, jsonify, request
-from src.core.db import WhitelistDB
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
+from src.core.db import WhitelistDB, IMPORT_MODES, IMPORT_UPSERT, DEFAULT_PAGE_SIZE as DEVICE_PAGE_SIZE, MAX_PAGE_SIZE as DEVICE_MAX_PAGE_SIZE
+from src.core import whitelist_io
 from src.security.fingerprinter import Fingerprinter
-from src.utils.logger import log, LOG_FILE
-from src.core.detector import get_separated_usb_devices
+from src.security.content_integrity import ContentCheck, ContentScheduler, CONTENT_MODES
+from src.security.disk_structure import raw_volume_path
+from src.utils.logger import log, LOG_FILE, LOG_BACKUP_COUNT
+from src.utils.log_reader import LogTailReader
+from src.core.event_store import EventStore, format_event_time, DEFAULT_PAGE_SIZE
+from src.services.event_bus import bus as device_bus
+from src.services.inventory import inventory, SOURCE_API
+from src.core.device_record import serialize_devices
+from src.core.rules import validate_rule
+from src.utils import metrics
 
 server = Flask(__name__, template_folder='src/web/templates')
 db = WhitelistDB()
 fingerprinter = Fingerprinter()
+log_reader = LogTailReader(LOG_FILE, backup_count=LOG_BACKUP_COUNT)
+event_store = EventStore()
+# Builds content trees for drives registered with content integrity, in the background
+content_scheduler = ContentScheduler()
+# Background monitor, when this process runs one (see __main__)
+usb_service = None
+
+# Seconds between SSE keep-alive comments, and the longest a long-poll request is held open
+STREAM_HEARTBEAT = 15
+LONG_POLL_TIMEOUT = 25
 
 # --- HELPER FUNCTION TO READ APP LOGS ---
 def read_app_log(max_lines=100):
-    """Reads and parses the last N lines of the application log file."""
+    """Reads and parses the last N lines of the application log file (and its rotated backups)."""
     parsed_logs = []
     try:
-        with open(LOG_FILE, 'r') as f:
-            lines = f.readlines()
-        
-        # Get the last max_lines
-        recent_lines = lines[-max_lines:]
-        
-        # Regex to parse the log format: 'YYYY-MM-DD HH:MM:SS,ms - NAME - LEVEL - MESSAGE'
-        log_pattern = re.compile(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - .*? - (\w+) - (.*)")
-
-        for line in recent_lines:
-            match = log_pattern.match(line)
-            if match:
-                timestamp_str, level, message = match.groups()
-                # Convert timestamp for sorting
-                timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S,%f')
-                parsed_logs.append({
-                    "time": timestamp,
-                    "type": "Application",
-                    "status": level,
-                    "message": message.strip()
-                })
+        # Seeks back from EOF and caches its offset, so repeat polls only read new bytes
+        parsed_logs = log_reader.read(max_lines)
     except FileNotFoundError:
         log.warning(f"Log file not found at {LOG_FILE}")
     except Exception as e:
         log.error(f"Failed to read or parse log file: {e}")
     return parsed_logs
 
+# Last serialized body per endpoint and query string, reused while its ETag is unchanged.
+# Bounded, since paginated and filtered listings each get their own entry.
+RESPONSE_CACHE_SIZE = 64
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def conditional_json(etag, build):
+    """
+    JSON response with an ETag. Answers 304 when the client already has it,
+    and only calls build() when the body for this ETag isn't cached yet.
+    build() may return a JSON-serializable object or an already encoded string.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = request.full_path
+        with _response_cache_lock:
+            cached = _response_cache.get(key)
+            if cached is not None and cached[0] == etag:
+                _response_cache.move_to_end(key)
+        if cached is None or cached[0] != etag:
+            body = build()
+            if not isinstance(body, str):
+                body = json.dumps(body, default=str)
+            cached = (etag, body)
+            with _response_cache_lock:
+                _response_cache[key] = cached
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def parse_time_param(value):
+    """Accepts Unix seconds or an ISO 8601 timestamp; returns Unix seconds or None."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
 
 @server.route('/')
 def index():
@@ -59,17 +104,111 @@ def index():
 
 @server.route('/api/usb_devices')
 def get_usb_devices():
-    storage, other = get_separated_usb_devices()
-    for device in storage + other:
-        details = db.get_device_details(device['canonical_id'])
-        device['is_registered'] = bool(details)
-        device['is_fingerprinted'] = bool(details and details.get('structural_fingerprint'))
-    return jsonify({"storage_devices": storage, "other_devices": other})
+    # Served from the shared inventory snapshot; a scan only runs if it is stale
+    try:
+        snapshot = inventory.get()
+    except Exception as e:
+        log.error("Error scanning for devices: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 503
+    etag = f"{inventory.epoch}-{snapshot.version}-{db.current_version()}"
+
+    def build():
+        # Records carry their own cached JSON; only the registration flags are per request
+        all_devices = snapshot.storage_devices + snapshot.other_devices
+        registered = db.get_many_device_details([device.canonical_id for device in all_devices])
+        annotations = {}
+        for device in all_devices:
+            details = registered.get(device.canonical_id)
+            annotations[device.canonical_id] = (
+                f',"is_registered":{"true" if details else "false"}'
+                f',"is_fingerprinted":{"true" if details and details.get("structural_fingerprint") else "false"}'
+            )
+        return (f'{{"storage_devices":{serialize_devices(snapshot.storage_devices, annotations)},'
+                f'"other_devices":{serialize_devices(snapshot.other_devices, annotations)}}}')
+    return conditional_json(etag, build)
+
+@server.route('/api/scan', methods=['POST'])
+def scan_now():
+    """Rescans right away instead of waiting for the monitor's next scheduled scan."""
+    try:
+        if usb_service is not None and usb_service.request_scan():
+            # The monitor scans, enforces and publishes the result on the event stream
+            return jsonify({'success': True, 'queued': True})
+        snapshot = inventory.refresh(SOURCE_API)
+        return jsonify({'success': True, 'queued': False, 'version': snapshot.version})
+    except Exception as e:
+        log.error(f"Error scanning for devices: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+def format_sse(message):
+    """Encodes one bus message as a Server-Sent Events frame."""
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
+
+@server.route('/api/events/stream')
+def stream_device_events():
+    """
+    Server-Sent Events feed of device changes detected by the monitor.
+    Starts with a snapshot, then pushes added/removed/blocked/verified deltas.
+    Clients share the monitor's scans instead of polling /api/usb_devices.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+
+    def generate():
+        yield "retry: 3000\n\n"
+        cursor = last_event_id
+        if cursor is None:
+            snapshot = device_bus.snapshot()
+            cursor = snapshot['id']
+            yield format_sse(snapshot)
+        while True:
+            messages = device_bus.wait(cursor, timeout=STREAM_HEARTBEAT)
+            if not messages:
+                yield ": keep-alive\n\n"
+                continue
+            for message in messages:
+                yield format_sse(message)
+            cursor = messages[-1]['id']
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@server.route('/api/events/poll')
+def poll_device_events():
+    """
+    Long-poll fallback for clients without EventSource. Pass the last seen
+    id as `after`; without it the response is a snapshot.
+    """
+    after = request.args.get('after', type=int)
+    if after is None:
+        snapshot = device_bus.snapshot()
+        return jsonify({"last_id": snapshot['id'], "events": [snapshot]})
+    messages = device_bus.wait(after, timeout=LONG_POLL_TIMEOUT)
+    return jsonify({"last_id": messages[-1]['id'] if messages else after, "events": messages})
+
+@server.route('/api/metrics')
+def get_metrics():
+    """Engine latency histograms and counters in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # ... existing endpoints for registered_devices, register, verify, remove ...
 @server.route('/api/registered_devices')
 def get_registered_devices():
-    return jsonify(db.list_devices())
+    """
+    One page of the whitelist in name order: {"devices": [...], "has_more": bool}.
+    Query parameters: limit, q (name or ID substring), type (device_type), and
+    after_name/after_id (the last device of the previous page).
+    """
+    args = request.args
+    # Capped one below the maximum to leave room for the look-ahead row
+    limit = max(1, min(args.get('limit', default=DEVICE_PAGE_SIZE, type=int), DEVICE_MAX_PAGE_SIZE - 1))
+    after = (args['after_name'], args.get('after_id', '')) if 'after_name' in args else None
+
+    def build():
+        # One extra row tells whether another page follows
+        devices = db.list_devices(after=after, limit=limit + 1, filter=args.get('q') or None,
+                                  device_type=args.get('type') or None)
+        return {"devices": devices[:limit], "has_more": len(devices) > limit}
+    return conditional_json(f"{inventory.epoch}-{db.current_version()}", build)
 
 @server.route('/api/devices/register', methods=['POST'])
 def register_device():
@@ -89,6 +228,21 @@ def register_device():
         success = db.register_device(data['canonical_id'], data['friendly_name'], device_type, structural_fingerprint=fp, lockfile_signature=sig)
     else:
         success = db.register_device(data['canonical_id'], data['friendly_name'], device_type)
+    # Optional: also record the drive's contents ("sampled" or "full"); built after the lockfile is written
+    content_mode = data.get('content_integrity')
+    if success and is_storage and content_mode in CONTENT_MODES:
+        path = raw_volume_path(data['drive_letter'])
+        if not path:
+            return jsonify({'success': True, 'content_integrity': 'unavailable'})
+        canonical_id = data['canonical_id']
+
+        def save_tree(check):
+            if check.passed:
+                db.save_content_tree(canonical_id, check.tree.to_bytes())
+            else:
+                log.error(f"Building the content tree of {canonical_id} failed: {check.error}")
+        content_scheduler.submit(canonical_id, ContentCheck(path, mode=content_mode), save_tree)
+        return jsonify({'success': True, 'content_integrity': 'building'})
     return jsonify({'success': success})
 
 @server.route('/api/devices/verify', methods=['POST'])
@@ -97,7 +251,8 @@ def verify_device():
     details = db.get_device_details(data['canonical_id'])
     if not (details and details.get('structural_fingerprint')):
         return jsonify({'success': False, 'error': 'Not fingerprinted.'})
-    is_valid = fingerprinter.verify_device(data['drive_letter'], details['structural_fingerprint'], details['lockfile_signature'])
+    is_valid = fingerprinter.verify_device(data['drive_letter'], details['structural_fingerprint'], details['lockfile_signature'],
+                                           canonical_id=data['canonical_id'])
     return jsonify({'success': True, 'is_valid': is_valid})
 
 @server.route('/api/devices/remove', methods=['POST'])
@@ -109,26 +264,94 @@ def remove_device():
     if not data.get('password') or data.get('password') != ADMIN_PASSWORD:
         return jsonify({'success': False, 'error': 'Invalid admin password'})
     
+    fingerprinter.invalidate_verification(data['canonical_id'])
+    content_scheduler.cancel(data['canonical_id'])
     return jsonify({'success': db.remove_device(data['canonical_id'])})
 
+# --- Whitelist Rule Endpoints ---
+@server.route('/api/rules')
+def get_rules():
+    return conditional_json(f"{inventory.epoch}-{db.current_version()}", db.list_rules)
+
+@server.route('/api/rules/add', methods=['POST'])
+def add_rule():
+    """Adds a rule, e.g. {"kind": "vid", "vid": "046D", "friendly_name": "Logitech"}; kinds in src/core/rules.py."""
+    data = request.json
+
+    # Validate admin password for security
+    ADMIN_PASSWORD = "admin123"  # In production, use environment variable or proper config
+    if not data.get('password') or data.get('password') != ADMIN_PASSWORD:
+        return jsonify({'success': False, 'error': 'Invalid admin password'})
+
+    error = validate_rule(data.get('kind'), data.get('vid'), data.get('pid'), data.get('pid_max'), data.get('pattern'))
+    if error or not data.get('friendly_name'):
+        return jsonify({'success': False, 'error': error or 'A name is required.'})
+    rule_id = db.add_rule(data['kind'], data['friendly_name'], vid=data.get('vid'), pid=data.get('pid'),
+                          pid_max=data.get('pid_max'), pattern=data.get('pattern'),
+                          device_type=data.get('device_type', 'unknown'))
+    return jsonify({'success': rule_id is not None, 'id': rule_id})
+
+@server.route('/api/rules/remove', methods=['POST'])
+def remove_rule():
+    data = request.json
+
+    # Validate admin password for security
+    ADMIN_PASSWORD = "admin123"  # In production, use environment variable or proper config
+    if not data.get('password') or data.get('password') != ADMIN_PASSWORD:
+        return jsonify({'success': False, 'error': 'Invalid admin password'})
+
+    return jsonify({'success': db.remove_rule(data.get('id'))})
+
 # --- Settings and Log Management Endpoints ---
 @server.route('/api/settings/logs', methods=['GET'])
 def get_logs():
-    """Get application logs"""
+    """
+    Get security events and application logs.
+    Optional query parameters filter the security events server-side:
+    level, device (canonical_id), type, since/until (Unix seconds or ISO 8601),
+    limit, and before (the smallest event id of the previous page).
+    """
     try:
-        # Get application events
-        app_logs = read_app_log(max_lines=100)
+        args = request.args
+        level = args.get('level') or None
+        device = args.get('device') or None
+        event_type = args.get('type') or None
+        before = args.get('before', type=int)
+        limit = args.get('limit', default=DEFAULT_PAGE_SIZE, type=int)
+        try:
+            since = parse_time_param(args.get('since'))
+            until = parse_time_param(args.get('until'))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid time range: {e}"}), 400
         
-        # Convert to log format
+        # Structured security events: index lookups with keyset pagination
         all_events = []
-        for log_entry in app_logs:
+        for event in event_store.query(canonical_id=device, level=level, event_type=event_type,
+                                       since=since, until=until, before_id=before, limit=limit):
             all_events.append({
-                "time": log_entry['time'].strftime('%Y-%m-%d %H:%M:%S'),
-                "level": log_entry['status'],
-                "message": log_entry['message'],
-                "source": "Application"
+                "id": event['id'],
+                "time": format_event_time(event['ts']),
+                "level": event['level'],
+                "message": event['message'],
+                "source": "Security",
+                "type": event['event_type'],
+                "canonical_id": event['canonical_id']
             })
         
+        # Application log lines are not device-scoped and have no cursor, so
+        # they are only part of the first, unfiltered-by-device page
+        if not (device or event_type or before):
+            for log_entry in read_app_log(max_lines=100):
+                timestamp = log_entry['time'].timestamp()
+                if (level and log_entry['status'] != level) or (since and timestamp < since) or (until and timestamp >= until):
+                    continue
+                all_events.append({
+                    "time": log_entry['time'].strftime('%Y-%m-%d %H:%M:%S'),
+                    "level": log_entry['status'],
+                    "message": log_entry['message'],
+                    "source": "Application"
+                })
+        
         # Sort by time (newest first)
         all_events.sort(key=lambda x: x['time'], reverse=True)
         
@@ -149,9 +372,14 @@ def clear_logs():
         return jsonify({'success': False, 'error': 'Invalid admin password'})
     
     try:
-        # Clear the log file
+        # Clear the log file and its rotated backups
         with open(LOG_FILE, 'w') as f:
             f.write("")  # Truncate the file
+        for i in range(1, LOG_BACKUP_COUNT + 1):
+            if os.path.exists(f"{LOG_FILE}.{i}"):
+                os.remove(f"{LOG_FILE}.{i}")
+        log_reader.reset()
+        event_store.clear()
         
         log.info("System logs cleared by administrator")
         return jsonify({'success': True, 'message': 'Logs cleared successfully'})
@@ -162,25 +390,54 @@ def clear_logs():
 
 @server.route('/api/settings/export_db', methods=['GET'])
 def export_database():
-    """Export device whitelist database"""
+    """Export device whitelist database as NDJSON (default) or CSV (?format=csv), streamed from a cursor"""
+    fmt = request.args.get('format', whitelist_io.FORMAT_NDJSON)
+    if fmt not in whitelist_io.FORMATS:
+        return jsonify({"error": f"Unknown export format '{fmt}'"}), 400
+    mimetype, extension = whitelist_io.FORMATS[fmt]
     try:
-        devices = db.list_devices()
-        
-        # Convert to JSON for download
-        import json
-        json_data = json.dumps(devices, indent=2, default=str)
-        
-        from flask import Response
         return Response(
-            json_data,
-            mimetype='application/json',
-            headers={'Content-Disposition': 'attachment; filename=device_whitelist.json'}
+            whitelist_io.export_rows(db.iter_devices(), fmt),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=device_whitelist.{extension}'}
         )
         
     except Exception as e:
         log.error(f"Error exporting database: {e}")
         return jsonify({"error": str(e)})
 
+@server.route('/api/settings/import_db', methods=['POST'])
+def import_database():
+    """
+    Bulk-imports an exported whitelist (multipart form: file, password, and
+    optionally mode=upsert|skip|replace and format=ndjson|csv). The upload is
+    parsed as it is read and written in one transaction.
+    """
+    # Validate admin password
+    ADMIN_PASSWORD = "admin123"
+    if not request.form.get('password') or request.form.get('password') != ADMIN_PASSWORD:
+        return jsonify({'success': False, 'error': 'Invalid admin password'})
+    
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'success': False, 'error': 'No file uploaded'})
+    mode = request.form.get('mode', IMPORT_UPSERT)
+    if mode not in IMPORT_MODES:
+        return jsonify({'success': False, 'error': f"Unknown import mode '{mode}'"})
+    fmt = request.form.get('format') or whitelist_io.detect_format(upload.filename)
+    
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        counts = db.import_devices(whitelist_io.read_rows(stream, fmt), mode=mode)
+        if counts is None:
+            return jsonify({'success': False, 'error': 'Import failed; no devices were changed'})
+        log.info(f"Whitelist imported by administrator: {counts}")
+        return jsonify({'success': True, **counts})
+        
+    except Exception as e:
+        log.error(f"Error importing database: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 @server.route('/api/settings/clear_db', methods=['POST'])
 def clear_database():
     """Clear all devices from database"""
@@ -192,7 +449,7 @@ def clear_database():
         return jsonify({'success': False, 'error': 'Invalid admin password'})
     
     try:
-        success = db._create_table()  # This will recreate the table
+        success = db.clear_devices()
         if success:
             log.info("Database cleared by administrator")
             return jsonify({'success': True, 'message': 'All devices cleared from database'})
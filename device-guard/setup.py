@@ -46,6 +46,6 @@ setup(
     },
     include_package_data=True,
     package_data={
-        "": ["*.bat", "*.html", "*.js", "*.css", "*.md", "*.txt"],
+        "": ["*.bat", "*.html", "*.js", "*.css", "*.md", "*.txt", "*.json"],
     },
 )
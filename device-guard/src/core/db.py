@@ -1,12 +1,235 @@
 import sqlite3
 import os
+import time
+import queue
 import datetime
+import threading
+import contextlib
+from src.core.rules import RuleMatcher, validate_rule
 from src.utils.logger import log
+from src.utils import metrics
 
 # Define the path to your SQLite database file
 # It will be created in the data directory
 DB_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "whitelist.db")
 
+# Minimum seconds between PRAGMA data_version checks for writes made by other
+# processes (the UI and the Windows service each have their own WhitelistDB).
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+# Connection pool tuning. WAL lets the Flask threads read while the monitor
+# thread (or the Windows service process) writes; synchronous=NORMAL is safe in
+# WAL mode and avoids an fsync on every commit.
+POOL_SIZE = 4
+BUSY_TIMEOUT = 5.0  # Seconds to wait on a locked database or an exhausted pool
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS = "NORMAL"
+
+# Columns of whitelisted_devices, in export order
+DEVICE_COLUMNS = ("canonical_id", "friendly_name", "device_type", "added_on", "structural_fingerprint", "lockfile_signature")
+# Rows fetched per round trip when streaming an export, and rows per executemany() when importing
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+# Per-connection TEMP table an import is staged in before it is merged under the write lock
+IMPORT_STAGING_TABLE = "import_staging"
+
+# Bulk import conflict modes for devices that are already registered
+IMPORT_SKIP = "skip"        # keep the existing entry
+IMPORT_UPSERT = "upsert"    # update it with the imported fields (fingerprints only if the import has them)
+IMPORT_REPLACE = "replace"  # replace the whole entry
+IMPORT_MODES = (IMPORT_SKIP, IMPORT_UPSERT, IMPORT_REPLACE)
+
+# Page sizes for keyset-paginated listings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS whitelisted_devices (
+            canonical_id TEXT PRIMARY KEY,
+            friendly_name TEXT NOT NULL,
+            device_type TEXT,
+            added_on TEXT NOT NULL,
+            structural_fingerprint TEXT, -- SHA-256 hash of MBR/GPT
+            lockfile_signature TEXT      -- Signature of the hidden lock file
+        )
+    """)
+    # Databases created before fingerprinting lack its columns
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(whitelisted_devices)")}
+    for column in ("structural_fingerprint", "lockfile_signature"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE whitelisted_devices ADD COLUMN {column} TEXT")
+    # Pattern rules that whitelist whole groups of devices (see src/core/rules.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS whitelist_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            vid TEXT,
+            pid TEXT,
+            pid_max TEXT,  -- Upper bound of pid_range rules
+            pattern TEXT,  -- Canonical ID, serial prefix or serial glob
+            friendly_name TEXT NOT NULL,
+            device_type TEXT,
+            added_on TEXT NOT NULL
+        )
+    """)
+
+
+def _create_listing_indexes(conn):
+    # Each index ends in canonical_id so list_devices' keyset (friendly_name,
+    # canonical_id) is an index range scan, also within one device_type
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_name ON whitelisted_devices (friendly_name, canonical_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_type ON whitelisted_devices (device_type, friendly_name, canonical_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_added_on ON whitelisted_devices (added_on)")
+
+
+def _create_content_trees(conn):
+    # Optional content-integrity Merkle trees (see src/security/content_integrity.py),
+    # kept out of whitelisted_devices so listings and snapshots don't load them
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_trees (
+            canonical_id TEXT PRIMARY KEY,
+            tree BLOB NOT NULL,
+            updated_on TEXT NOT NULL
+        )
+    """)
+
+
+# Schema migrations as (version, description, apply(conn)), applied in order
+# inside one transaction and recorded in PRAGMA user_version. Append new
+# steps; never change one that has shipped.
+SCHEMA_MIGRATIONS = (
+    (1, "device and rule tables", _create_base_tables),
+    (2, "indexes for listing by name, type and date", _create_listing_indexes),
+    (3, "content integrity trees", _create_content_trees),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+def migrate(conn):
+    """Brings a database up to SCHEMA_VERSION. Returns the resulting schema version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        log.warning(f"Whitelist database schema {version} is newer than this version supports ({SCHEMA_VERSION}).")
+    if version >= SCHEMA_VERSION:
+        return version
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock: another process may have just migrated
+        start = version = conn.execute("PRAGMA user_version").fetchone()[0]
+        applied = []
+        for target, description, apply in SCHEMA_MIGRATIONS:
+            if target > version:
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                version = target
+                applied.append(f"{target} ({description})")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if applied:
+        log.info(f"Whitelist database migrated from schema {start}: {', '.join(applied)}")
+    return version
+
+
+# Merges the staged rows in input order. "WHERE true" keeps the upsert's ON CONFLICT from parsing as a join
+_IMPORT_SELECT = "SELECT {columns} FROM temp.{staging} WHERE true ORDER BY rowid"
+_IMPORT_SQL = {
+    IMPORT_SKIP: "INSERT OR IGNORE INTO whitelisted_devices ({columns}) " + _IMPORT_SELECT,
+    IMPORT_REPLACE: "INSERT OR REPLACE INTO whitelisted_devices ({columns}) " + _IMPORT_SELECT,
+    IMPORT_UPSERT: "INSERT INTO whitelisted_devices ({columns}) " + _IMPORT_SELECT + """
+                      ON CONFLICT(canonical_id) DO UPDATE SET
+                          friendly_name = excluded.friendly_name,
+                          device_type = excluded.device_type,
+                          structural_fingerprint = COALESCE(excluded.structural_fingerprint, structural_fingerprint),
+                          lockfile_signature = COALESCE(excluded.lockfile_signature, lockfile_signature)""",
+}
+
+
+def connect(db_path, busy_timeout=BUSY_TIMEOUT):
+    """Opens a connection configured for concurrent use of the whitelist database."""
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False)
+    conn.row_factory = sqlite3.Row # Allows accessing columns by name
+    try:
+        conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+    except sqlite3.Error as e:
+        # e.g. a read-only location; the connection still works in the default mode
+        log.warning(f"Could not apply SQLite pragmas to '{db_path}': {e}")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQLite connections. Connections are created
+    lazily up to `size` and handed out one thread at a time.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, busy_timeout=BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self._idle = queue.LifoQueue()  # LIFO keeps the hottest connections in use
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.db_path, self.busy_timeout)
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"connection pool exhausted ({self.size} connections busy)")
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always returns it to the pool."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        """Closes all idle connections."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def _rule_details(canonical_id, rule):
+    """Device details for a device whitelisted by a rule rather than its own entry."""
+    return {
+        "canonical_id": canonical_id,
+        "friendly_name": rule["friendly_name"],
+        "device_type": rule["device_type"],
+        "added_on": rule["added_on"],
+        "structural_fingerprint": None,
+        "lockfile_signature": None,
+        "rule_id": rule["id"],
+    }
+
+
 class WhitelistDB:
     def __init__(self, db_path=None):
         """
@@ -18,38 +241,144 @@ class WhitelistDB:
         else:
             self.db_path = db_path
             
+        # In-memory snapshot of whitelisted_devices (canonical_id -> row dict).
+        # It is loaded on first lookup, updated write-through by this instance and
+        # reloaded when PRAGMA data_version shows a commit from another connection.
+        # Whitelist rules (id -> row dict) are loaded with it and compiled into a
+        # RuleMatcher on the first lookup that misses the exact entries.
+        self._lock = threading.RLock()
+        self._conn = None
+        self._snapshot = None
+        self._rules = {}
+        self._matcher = None
+        self._data_version = None
+        self._next_version_check = 0.0
+        self.snapshot_version = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._pool = ConnectionPool(self.db_path)
+        
         self._create_table()
 
     def _get_connection(self):
-        """Helper to get a database connection."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row # Allows accessing columns by name
-        return conn
+        """Helper to borrow a pooled database connection (use as a context manager)."""
+        return self._pool.connection()
+
+    def close(self):
+        """Closes all pooled and shared connections."""
+        self._pool.close()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _shared_connection(self):
+        """
+        Long-lived connection used for the snapshot and for writes. data_version
+        only changes for commits made by *other* connections, so routing our own
+        writes through it keeps the write-through snapshot valid.
+        Callers must hold self._lock.
+        """
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        return self._conn
+
+    def _get_snapshot(self):
+        """Returns the current snapshot, reloading it only if another connection committed."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_version_check:
+            return snapshot
+        with self._lock:
+            try:
+                conn = self._shared_connection()
+                data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if self._snapshot is None or data_version != self._data_version:
+                    rows = conn.execute("SELECT * FROM whitelisted_devices").fetchall()
+                    self._snapshot = {row['canonical_id']: dict(row) for row in rows}
+                    self._load_rules(conn)
+                    self._data_version = data_version
+                    self.snapshot_version += 1
+                    self.cache_misses += 1
+                self._next_version_check = time.monotonic() + SNAPSHOT_CHECK_INTERVAL
+            except sqlite3.Error as e:
+                log.error(f"DATABASE ERROR loading whitelist snapshot: {e}")
+                if self._snapshot is None:
+                    return {}
+            return self._snapshot
+
+    def _load_rules(self, conn):
+        """Reloads the rule rows; the matcher is recompiled lazily. Callers must hold self._lock."""
+        rows = conn.execute("SELECT * FROM whitelist_rules").fetchall()
+        self._rules = {row['id']: dict(row) for row in rows}
+        self._matcher = None
+
+    def _get_matcher(self):
+        """Returns the compiled rule matcher for the current snapshot."""
+        self._get_snapshot()
+        matcher = self._matcher
+        if matcher is None:
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = RuleMatcher(self._rules.values())
+                matcher = self._matcher
+        return matcher
+
+    def invalidate_snapshot(self):
+        """Forces the next lookup to reload the snapshot from disk."""
+        with self._lock:
+            self._snapshot = None
+
+    def current_version(self):
+        """
+        Returns the snapshot version, after picking up commits from other connections.
+        It changes whenever the whitelist does, so it can key HTTP ETags and caches.
+        """
+        self._get_snapshot()
+        return self.snapshot_version
+
+    def cache_stats(self):
+        """Returns snapshot counters: hits are lookups answered without any disk I/O."""
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "version": self.snapshot_version,
+            "size": len(self._snapshot) if self._snapshot is not None else 0,
+            "rules": len(self._rules),
+        }
 
     def _create_table(self):
-        """Creates or updates the whitelisted_devices table schema."""
-        conn = self._get_connection()
+        """
+        Creates the schema or migrates it to SCHEMA_VERSION (see SCHEMA_MIGRATIONS).
+        Returns True on success, False on error.
+        """
         try:
-            cursor = conn.cursor()
-            # Added new nullable columns for fingerprinting
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS whitelisted_devices (
-                    canonical_id TEXT PRIMARY KEY,
-                    friendly_name TEXT NOT NULL,
-                    device_type TEXT,
-                    added_on TEXT NOT NULL,
-                    structural_fingerprint TEXT, -- SHA-256 hash of MBR/GPT
-                    lockfile_signature TEXT      -- Signature of the hidden lock file
-                )
-            """)
-            # TODO: In a real production app, you would handle migrations here
-            # to add the columns if the table already exists. For our purposes,
-            # starting with a fresh DB is fine.
-            conn.commit()
+            with self._get_connection() as conn:
+                migrate(conn)
+            return True
         except sqlite3.Error as e:
-            print(f"Error creating table: {e}")
+            log.error(f"DATABASE ERROR creating or migrating the schema: {e}")
+            return False
         finally:
-            conn.close()
+            self.invalidate_snapshot()
+
+    def clear_devices(self):
+        """
+        Removes every device from the whitelist (rules are kept).
+        Returns True on success, False on error.
+        """
+        with self._lock:
+            conn = self._shared_connection()
+            try:
+                count = conn.execute("DELETE FROM whitelisted_devices").rowcount
+                conn.execute("DELETE FROM content_trees")
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error(f"DATABASE ERROR while clearing the whitelist: {e}")
+                conn.rollback()
+                return False
+            self._snapshot = None  # Reloaded on the next lookup
+        log.info(f"SUCCESS: Cleared {count} device(s) from the whitelist.")
+        return True
 
     def register_device(self, canonical_id, friendly_name, device_type="unknown", structural_fingerprint=None, lockfile_signature=None):
         """
@@ -60,7 +389,11 @@ class WhitelistDB:
             log.error("Failed to register device: canonical_id and friendly_name cannot be empty.")
             return False
 
-        conn = self._get_connection()
+        with self._lock:
+            return self._register_device(canonical_id, friendly_name, device_type, structural_fingerprint, lockfile_signature)
+
+    def _register_device(self, canonical_id, friendly_name, device_type, structural_fingerprint, lockfile_signature):
+        conn = self._shared_connection()
         try:
             cursor = conn.cursor()
             added_on = datetime.datetime.now().isoformat()
@@ -72,6 +405,16 @@ class WhitelistDB:
             )
             if cursor.rowcount > 0:
                 conn.commit()
+                if self._snapshot is not None:
+                    self._snapshot[canonical_id] = {
+                        "canonical_id": canonical_id,
+                        "friendly_name": friendly_name,
+                        "device_type": device_type,
+                        "added_on": added_on,
+                        "structural_fingerprint": structural_fingerprint,
+                        "lockfile_signature": lockfile_signature,
+                    }
+                    self.snapshot_version += 1
                 log.info(f"SUCCESS: Device '{canonical_id}' ({friendly_name}) registered in whitelist.")
                 return True
             else:
@@ -79,16 +422,19 @@ class WhitelistDB:
                 return False
         except sqlite3.Error as e:
             log.error(f"DATABASE ERROR while registering device '{canonical_id}': {e}")
+            conn.rollback()
             return False
-        finally:
-            conn.close()
 
     def remove_device(self, canonical_id):
         """
         Removes a device from the whitelist.
         Returns True on success, False if not found or on error.
         """
-        conn = self._get_connection()
+        with self._lock:
+            return self._remove_device(canonical_id)
+
+    def _remove_device(self, canonical_id):
+        conn = self._shared_connection()
         try:
             cursor = conn.cursor()
             cursor.execute(
@@ -96,7 +442,11 @@ class WhitelistDB:
                 (canonical_id,)
             )
             if cursor.rowcount > 0:
+                cursor.execute("DELETE FROM content_trees WHERE canonical_id = ?", (canonical_id,))
                 conn.commit()
+                if self._snapshot is not None:
+                    self._snapshot.pop(canonical_id, None)
+                    self.snapshot_version += 1
                 log.info(f"SUCCESS: Device '{canonical_id}' removed from whitelist.")
                 return True
             else:
@@ -104,45 +454,281 @@ class WhitelistDB:
                 return False
         except sqlite3.Error as e:
             log.error(f"DATABASE ERROR while removing device '{canonical_id}': {e}")
+            conn.rollback()
             return False
-        finally:
-            conn.close()
 
     def get_device_details(self, canonical_id):
         """
         Retrieves all details for a device from the whitelist, including fingerprints.
         Returns the device details (as a dict) if found, None otherwise.
+        Served from the in-memory snapshot; see _get_snapshot.
         """
-        conn = self._get_connection()
+        misses = self.cache_misses
+        details = self._get_snapshot().get(canonical_id)
+        if misses == self.cache_misses:
+            self.cache_hits += 1
+        if details:
+            return dict(details)
+        rule = self._get_matcher().match(canonical_id) if self._rules else None
+        return _rule_details(canonical_id, rule) if rule else None
+
+    def get_many_device_details(self, canonical_ids):
+        """
+        Resolves a whole scan's worth of devices in one snapshot pass.
+        Returns a dict of canonical_id -> device details for the registered ones;
+        unregistered IDs are simply absent.
+        """
+        started = time.perf_counter()
+        misses = self.cache_misses
+        snapshot = self._get_snapshot()
+        matcher = self._get_matcher() if self._rules else None
+        found = {}
+        for canonical_id in canonical_ids:
+            details = snapshot.get(canonical_id)
+            if details:
+                found[canonical_id] = dict(details)
+            elif matcher is not None:
+                rule = matcher.match(canonical_id)
+                if rule:
+                    found[canonical_id] = _rule_details(canonical_id, rule)
+        if misses == self.cache_misses:
+            self.cache_hits += 1
+        metrics.DB_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        return found
+
+    def add_rule(self, kind, friendly_name, vid=None, pid=None, pid_max=None, pattern=None, device_type="unknown"):
+        """
+        Adds a whitelist rule (kinds in src/core/rules.py).
+        Returns the new rule's id, or None if the rule is invalid or on error.
+        """
+        rule = {"kind": kind, "friendly_name": friendly_name, "vid": vid, "pid": pid,
+                "pid_max": pid_max, "pattern": pattern, "device_type": device_type}
+        added = self.add_rules([rule])
+        return added[0] if added else None
+
+    def add_rules(self, rules):
+        """
+        Adds many rules (dicts with the add_rule arguments) in one transaction.
+        Invalid rules are logged and skipped. Returns the ids of the added rules.
+        """
+        rows = []
+        added_on = datetime.datetime.now().isoformat()
+        for rule in rules:
+            error = validate_rule(rule.get("kind"), rule.get("vid"), rule.get("pid"), rule.get("pid_max"), rule.get("pattern"))
+            if error or not rule.get("friendly_name"):
+                log.error(f"Failed to add whitelist rule {rule}: {error or 'friendly_name cannot be empty.'}")
+                continue
+            rows.append({
+                "kind": rule["kind"],
+                "vid": (rule.get("vid") or "").upper() or None,
+                "pid": (rule.get("pid") or "").upper() or None,
+                "pid_max": (rule.get("pid_max") or "").upper() or None,
+                "pattern": rule.get("pattern"),
+                "friendly_name": rule["friendly_name"],
+                "device_type": rule.get("device_type", "unknown"),
+                "added_on": added_on,
+            })
+        if not rows:
+            return []
+        with self._lock:
+            conn = self._shared_connection()
+            try:
+                ids = []
+                for row in rows:
+                    cursor = conn.execute(
+                        """INSERT INTO whitelist_rules (kind, vid, pid, pid_max, pattern, friendly_name, device_type, added_on)
+                           VALUES (:kind, :vid, :pid, :pid_max, :pattern, :friendly_name, :device_type, :added_on)""",
+                        row
+                    )
+                    row["id"] = cursor.lastrowid
+                    ids.append(row["id"])
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error(f"DATABASE ERROR while adding whitelist rules: {e}")
+                conn.rollback()
+                return []
+            if self._snapshot is not None:
+                for row in rows:
+                    self._rules[row["id"]] = row
+                    if self._matcher is not None:
+                        self._matcher.add(row)
+                self.snapshot_version += 1
+        log.info(f"SUCCESS: Added {len(ids)} whitelist rule(s).")
+        return ids
+
+    def remove_rule(self, rule_id):
+        """
+        Removes a whitelist rule.
+        Returns True on success, False if not found or on error.
+        """
+        with self._lock:
+            conn = self._shared_connection()
+            try:
+                cursor = conn.execute("DELETE FROM whitelist_rules WHERE id = ?", (rule_id,))
+                if cursor.rowcount == 0:
+                    log.warning(f"IGNORED: Attempt to remove non-existent whitelist rule {rule_id}.")
+                    return False
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error(f"DATABASE ERROR while removing whitelist rule {rule_id}: {e}")
+                conn.rollback()
+                return False
+            if self._snapshot is not None:
+                self._rules.pop(rule_id, None)
+                self._matcher = None  # Recompiled on the next lookup
+                self.snapshot_version += 1
+        log.info(f"SUCCESS: Whitelist rule {rule_id} removed.")
+        return True
+
+    def list_rules(self):
+        """Lists all whitelist rules."""
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM whitelisted_devices WHERE canonical_id = ?",
-                (canonical_id,)
-            )
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            else:
-                return None
+            with self._get_connection() as conn:
+                cursor = conn.execute("SELECT * FROM whitelist_rules ORDER BY id")
+                return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            log.error(f"DATABASE ERROR checking device '{canonical_id}': {e}")
+            log.error(f"DATABASE ERROR listing whitelist rules: {e}")
+            return []
+
+    def iter_devices(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every whitelist entry as a sqlite3.Row (columns as in DEVICE_COLUMNS),
+        fetching batch_size rows at a time from one cursor, so memory use does not
+        grow with the table. The pooled connection is held until the generator
+        is exhausted or closed.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.execute(f"SELECT {', '.join(DEVICE_COLUMNS)} FROM whitelisted_devices ORDER BY canonical_id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def import_devices(self, devices, mode=IMPORT_UPSERT, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Registers many devices in one transaction. `devices` is any iterable of
+        dicts with DEVICE_COLUMNS keys (canonical_id and friendly_name required),
+        e.g. rows streamed from an upload. It is consumed in batches of
+        batch_size into a TEMP staging table on a pooled connection, so memory
+        use does not grow with the input and a slow upload never holds up
+        other writers; only the final merge into whitelisted_devices (one
+        INSERT ... SELECT) and its commit run under the write lock.
+        `mode` (IMPORT_MODES) decides what happens to devices already registered.
+        Returns {"imported": rows written, "invalid": rows skipped as invalid},
+        or None if the import failed and was rolled back.
+        """
+        if mode not in IMPORT_MODES:
+            log.error(f"Failed to import devices: unknown mode '{mode}'.")
             return None
-        finally:
-            conn.close()
+        columns = ", ".join(DEVICE_COLUMNS)
+        stage_sql = f"INSERT INTO temp.{IMPORT_STAGING_TABLE} ({columns}) VALUES ({', '.join('?' * len(DEVICE_COLUMNS))})"
+        merge_sql = _IMPORT_SQL[mode].format(columns=columns, staging=IMPORT_STAGING_TABLE)
+        added_on = datetime.datetime.now().isoformat()
+        counts = {"imported": 0, "invalid": 0}
+
+        def rows():
+            for device in devices:
+                if not device.get("canonical_id") or not device.get("friendly_name"):
+                    counts["invalid"] += 1
+                    continue
+                yield (device["canonical_id"], device["friendly_name"], device.get("device_type") or "unknown",
+                       device.get("added_on") or added_on, device.get("structural_fingerprint") or None,
+                       device.get("lockfile_signature") or None)
 
-    def list_devices(self):
-        """Lists all devices currently in the whitelist."""
-        conn = self._get_connection()
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM whitelisted_devices ORDER BY friendly_name")
-            return [dict(row) for row in cursor.fetchall()]
+            with self._get_connection() as conn:
+                try:
+                    conn.execute(f"DROP TABLE IF EXISTS temp.{IMPORT_STAGING_TABLE}")
+                    conn.execute(f"CREATE TEMP TABLE {IMPORT_STAGING_TABLE} ({columns})")
+                    batch = []
+                    for row in rows():
+                        batch.append(row)
+                        if len(batch) >= batch_size:
+                            conn.executemany(stage_sql, batch)
+                            batch = []
+                    if batch:
+                        conn.executemany(stage_sql, batch)
+                    with self._lock:
+                        counts["imported"] = conn.execute(merge_sql).rowcount
+                        conn.commit()
+                        self._snapshot = None  # Reloaded on the next lookup
+                finally:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    conn.execute(f"DROP TABLE IF EXISTS temp.{IMPORT_STAGING_TABLE}")
+        except Exception as e:  # Includes parse errors raised by a streaming `devices`
+            log.error(f"DATABASE ERROR while importing devices (rolled back): {e}")
+            return None
+        log.info(f"SUCCESS: Imported {counts['imported']} device(s) into the whitelist ({mode}); {counts['invalid']} invalid row(s) skipped.")
+        return counts
+
+    def list_devices(self, after=None, limit=None, filter=None, device_type=None):
+        """
+        Lists whitelisted devices ordered by friendly_name, then canonical_id.
+        Without `limit` all of them are returned. For keyset pagination pass
+        the last device of a page as `after` (a (friendly_name, canonical_id)
+        pair) to get the next one; each page is an index range scan however
+        deep it is. `filter` matches part of the name or canonical_id
+        (case-insensitive), `device_type` matches exactly.
+        """
+        clauses, params = [], []
+        if device_type is not None:
+            clauses.append("device_type = ?")
+            params.append(device_type)
+        if filter:
+            pattern = "%" + filter.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(friendly_name LIKE ? ESCAPE '\\' OR canonical_id LIKE ? ESCAPE '\\')")
+            params.extend((pattern, pattern))
+        if after is not None:
+            clauses.append("(friendly_name, canonical_id) > (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM whitelisted_devices {where} ORDER BY friendly_name, canonical_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(1, min(int(limit), MAX_PAGE_SIZE)))
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(sql, params)
+                return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
             log.error(f"DATABASE ERROR listing devices: {e}")
             return []
-        finally:
-            conn.close()
+
+    def save_content_tree(self, canonical_id, tree):
+        """
+        Stores (or replaces) a registered device's serialized content tree.
+        Returns True on success, False if the device isn't registered or on error.
+        """
+        with self._lock:
+            conn = self._shared_connection()
+            try:
+                cursor = conn.execute(
+                    """INSERT OR REPLACE INTO content_trees (canonical_id, tree, updated_on)
+                       SELECT canonical_id, ?, ? FROM whitelisted_devices WHERE canonical_id = ?""",
+                    (sqlite3.Binary(tree), datetime.datetime.now().isoformat(), canonical_id)
+                )
+                if cursor.rowcount == 0:
+                    log.warning(f"IGNORED: Content tree for unregistered device '{canonical_id}'.")
+                    return False
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error(f"DATABASE ERROR while saving the content tree of '{canonical_id}': {e}")
+                conn.rollback()
+                return False
+        log.info(f"SUCCESS: Content tree of '{canonical_id}' saved ({len(tree)} bytes).")
+        return True
+
+    def get_content_tree(self, canonical_id):
+        """Returns a device's serialized content tree (bytes), or None if it has none."""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute("SELECT tree FROM content_trees WHERE canonical_id = ?", (canonical_id,)).fetchone()
+                return bytes(row["tree"]) if row else None
+        except sqlite3.Error as e:
+            log.error(f"DATABASE ERROR reading the content tree of '{canonical_id}': {e}")
+            return None
 
 # --- Test / Example Usage (for development) ---
 if __name__ == "__main__":
@@ -205,4 +791,126 @@ if __name__ == "__main__":
     else:
         print("Could not find the simple device!")
 
+    # 6. Repeated lookups are served from the snapshot without disk I/O
+    print("\n--- Checking Snapshot Cache ---")
+    misses = db.cache_stats()['misses']
+    for _ in range(100):
+        db.get_device_details("VID_046D&PID_C077&SN_NO_SERIAL")
+    print(f"Cache stats: {db.cache_stats()}")
+    assert db.cache_stats()['misses'] == misses
+
+    # 7. A whole scan resolves in one pass
+    print("\n--- Checking Batch Lookup ---")
+    found = db.get_many_device_details(["VID_046D&PID_C077&SN_NO_SERIAL", "VID_0781&PID_5591&SN_ABCDEF123456", "VID_DEAD&PID_BEEF&SN_NONE"])
+    print(f"Found: {sorted(found)}")
+    assert len(found) == 2 and "VID_DEAD&PID_BEEF&SN_NONE" not in found
+
+    # 8. A write from another process/instance invalidates the snapshot
+    print("\n--- Checking Cross-Process Invalidation ---")
+    other = WhitelistDB(db.db_path)
+    other.remove_device("VID_046D&PID_C077&SN_NO_SERIAL")
+    db._next_version_check = 0  # Skip the check interval for the test
+    assert db.get_device_details("VID_046D&PID_C077&SN_NO_SERIAL") is None
+    print(f"Cache stats: {db.cache_stats()}")
+    assert db.cache_stats()['misses'] == misses + 1
+
+    # 9. Rules whitelist whole groups of devices without per-device entries
+    print("\n--- Checking Whitelist Rules ---")
+    vendor_rule = db.add_rule("vid", "All Logitech devices", vid="046d", device_type="peripheral")
+    assert db.add_rule("pid_range", "Bad range", vid="413C", pid="21FF", pid_max="2000") is None
+    db.add_rules([
+        {"kind": "pid_range", "friendly_name": "Approved keyboards", "vid": "413C", "pid": "2000", "pid_max": "20FF"},
+        {"kind": "serial_prefix", "friendly_name": "Corporate sticks", "vid": "0781", "pattern": "XYZ"},
+    ])
+    details = db.get_device_details("VID_046D&PID_C077&SN_NO_SERIAL")
+    print(f"Matched by rule: {details}")
+    assert details['rule_id'] == vendor_rule
+    found = db.get_many_device_details(["VID_413C&PID_2010&SN_1", "VID_0781&PID_5591&SN_XYZ42", "VID_413C&PID_2200&SN_1"])
+    assert sorted(found) == ["VID_0781&PID_5591&SN_XYZ42", "VID_413C&PID_2010&SN_1"]
+    assert db.remove_rule(vendor_rule) and db.get_device_details("VID_046D&PID_C077&SN_NO_SERIAL") is None
+    other._next_version_check = 0
+    assert len(other.list_rules()) == 2 and other.get_device_details("VID_413C&PID_2010&SN_1")
+
+    # 10. Bulk import in one transaction, with conflict modes, and a streamed export
+    print("\n--- Checking Bulk Import/Export ---")
+    batch = [{"canonical_id": f"VID_1234&PID_0001&SN_{i:06d}", "friendly_name": f"Bulk {i}"} for i in range(2500)]
+    counts = db.import_devices(iter(batch + [{"friendly_name": "No ID"}]), mode=IMPORT_SKIP, batch_size=1000)
+    print(f"Imported: {counts}")
+    assert counts == {"imported": 2500, "invalid": 1}
+    assert db.import_devices([{"canonical_id": batch[0]["canonical_id"], "friendly_name": "Renamed"}], mode=IMPORT_SKIP)["imported"] == 0
+    db.import_devices([{"canonical_id": batch[0]["canonical_id"], "friendly_name": "Renamed"}], mode=IMPORT_UPSERT)
+    assert db.get_device_details(batch[0]["canonical_id"])["friendly_name"] == "Renamed"
+    fingerprinted = "VID_0781&PID_5591&SN_ABCDEF123456"
+    db.import_devices([{"canonical_id": fingerprinted, "friendly_name": "Stick"}], mode=IMPORT_UPSERT)
+    assert db.get_device_details(fingerprinted)["structural_fingerprint"] == dummy_fingerprint
+    db.import_devices([{"canonical_id": fingerprinted, "friendly_name": "Stick"}], mode=IMPORT_REPLACE)
+    assert db.get_device_details(fingerprinted)["structural_fingerprint"] is None
+    assert db.import_devices([{"canonical_id": "VID_X&PID_Y&SN_Z", "friendly_name": "Bad", "device_type": {"not": "a string"}}]) is None
+
+    def slow_upload(serial, cut_off):
+        # Another writer gets through while the upload is still being staged
+        yield {"canonical_id": f"VID_1234&PID_0002&SN_{serial}", "friendly_name": "Slow"}
+        writer = threading.Thread(target=lambda: writes.append(db.register_device(f"VID_1234&PID_0003&SN_{serial}", "Beside")))
+        writer.start()
+        writer.join(5)
+        if cut_off:
+            raise ValueError("upload cut off")
+        yield {"canonical_id": f"VID_1234&PID_0004&SN_{serial}", "friendly_name": "Slow"}
+    writes = []
+    assert db.import_devices(slow_upload("CUT", True), batch_size=1) is None and writes == [True]
+    assert db.get_device_details("VID_1234&PID_0002&SN_CUT") is None  # Nothing staged is kept
+    assert db.import_devices(slow_upload("OK", False), batch_size=1) == {"imported": 2, "invalid": 0} and writes == [True, True]
+    for canonical_id in ("VID_1234&PID_0003&SN_CUT", "VID_1234&PID_0002&SN_OK", "VID_1234&PID_0003&SN_OK", "VID_1234&PID_0004&SN_OK"):
+        assert db.remove_device(canonical_id)
+    exported = [row["canonical_id"] for row in db.iter_devices(batch_size=100)]
+    assert len(exported) == 2501 and exported == sorted(exported)
+
+    # 11. Keyset pages walk the whole list in name order, served by the index
+    print("\n--- Checking Keyset Pagination ---")
+    pages, after = [], None
+    while True:
+        page = db.list_devices(after=after, limit=1000, filter="bulk")
+        if not page:
+            break
+        pages.append(page)
+        after = (page[-1]['friendly_name'], page[-1]['canonical_id'])
+    listed = [device['canonical_id'] for page in pages for device in page]
+    print(f"{len(pages)} pages, {len(listed)} devices")
+    assert len(pages) == 3 and len(listed) == len(set(listed)) == 2499
+    assert [d['friendly_name'] for d in db.list_devices(limit=2, filter="Renamed")] == ["Renamed"]
+    assert db.list_devices(filter="%") == [] and len(db.list_devices(device_type="unknown", limit=10)) == 10
+    with db._get_connection() as conn:
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM whitelisted_devices WHERE (friendly_name, canonical_id) > (?, ?) "
+            "ORDER BY friendly_name, canonical_id LIMIT 100", ("Bulk 1", "")))
+    print(f"Query plan: {plan}")
+    assert "idx_devices_name" in plan and "TEMP B-TREE" not in plan
+
+    # 12. A database from before versioning is migrated in place
+    print("\n--- Checking Schema Migration ---")
+    legacy_path = db.db_path + ".legacy"
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    legacy = sqlite3.connect(legacy_path)
+    legacy.execute("CREATE TABLE whitelisted_devices (canonical_id TEXT PRIMARY KEY, friendly_name TEXT NOT NULL, device_type TEXT, added_on TEXT NOT NULL)")
+    legacy.execute("INSERT INTO whitelisted_devices VALUES ('VID_0001&PID_0001&SN_OLD', 'Old Device', 'peripheral', '2024-01-01')")
+    legacy.commit()
+    legacy.close()
+    migrated = WhitelistDB(legacy_path)
+    assert migrated.get_device_details("VID_0001&PID_0001&SN_OLD")['structural_fingerprint'] is None
+    with migrated._get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert migrate(conn) == SCHEMA_VERSION  # Idempotent
+    migrated.close()
+    os.remove(legacy_path)
+
+    # 13. Content trees live beside the device record and go when it does
+    print("\n--- Checking Content Trees ---")
+    assert db.register_device("VID_0781&PID_5591&SN_TREE", "Tree Stick", "storage")
+    assert not db.save_content_tree("VID_0781&PID_5591&SN_NONE", b"tree")
+    assert db.save_content_tree("VID_0781&PID_5591&SN_TREE", b"\x00tree") and db.save_content_tree("VID_0781&PID_5591&SN_TREE", b"\x01tree")
+    assert db.get_content_tree("VID_0781&PID_5591&SN_TREE") == b"\x01tree"
+    assert db.remove_device("VID_0781&PID_5591&SN_TREE") and db.get_content_tree("VID_0781&PID_5591&SN_TREE") is None
+    assert db.clear_devices() and db.list_devices() == []
+
     print("\nDatabase schema update and tests complete.")
\ No newline at end of file
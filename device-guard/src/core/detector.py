@@ -1,104 +1,434 @@
-import wmi
+import os
+import time
+import threading
+from functools import lru_cache
+from collections import namedtuple
+from src.core.device_id import parse_device_id, PARSE_CACHE_SIZE
+from src.core.device_record import DeviceRecord
 from src.utils.logger import log
+from src.utils import metrics
 
-def get_separated_usb_devices():
+# Only USB and USBSTOR entities are of interest; filtering in WQL keeps WMI from
+# marshalling every PnP device on the machine.
+USB_PNP_QUERY = (
+    "SELECT DeviceID, Caption FROM Win32_PnPEntity "
+    "WHERE DeviceID LIKE 'USB\\\\%' OR DeviceID LIKE 'USBSTOR\\\\%'"
+)
+USB_DISK_QUERY = "SELECT DeviceID, PNPDeviceID FROM Win32_DiskDrive WHERE InterfaceType = 'USB'"
+
+# Default locations read by the Linux backend
+SYSFS_USB_DEVICES = "sys/bus/usb/devices"
+SYSFS_BLOCK = "sys/block"
+PROC_MOUNTS = "proc/self/mounts"
+
+InventoryDelta = namedtuple("InventoryDelta", ["added", "removed", "changed"])
+
+# WMI connections are bound to the thread (COM apartment) that created them
+_thread_state = threading.local()
+
+
+def _thread_connection():
+    """Returns a WMI connection owned by the calling thread, creating it once."""
+    conn = getattr(_thread_state, 'wmi_conn', None)
+    if conn is None:
+        import wmi
+        conn = _thread_state.wmi_conn = wmi.WMI()
+    return conn
+
+
+def _pnp_entity_path(device_id):
+    """Builds the WMI object path of a Win32_PnPEntity, which is keyed by DeviceID."""
+    escaped = device_id.replace('\\', '\\\\').replace('"', '\\"')
+    return f'Win32_PnPEntity.DeviceID="{escaped}"'
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_pnp_device(device_id, caption):
     """
-    Detects all connected USB devices and separates them into storage and other categories.
-    This is a more robust version based on the original detection logic.
+    Parses a USB or USBSTOR PnP DeviceID into a DeviceRecord (without drive letter).
+    Returns None for entries that are not USB devices or carry no VID/PID.
+    Records are immutable, so one instance per (DeviceID, caption) is shared.
     """
-    storage_devices, other_devices = [], []
-    try:
-        wmi_conn = wmi.WMI()
+    parsed = parse_device_id(device_id)
+    if parsed is None:
+        return None
+    return DeviceRecord(caption or "Unknown USB Device", parsed.vid, parsed.pid,
+                        parsed.serial_number, parsed.canonical_id, device_id, None)
+
+
+class DetectionBackend:
+    """
+    Source of the connected USB devices. refresh() rescans and returns an
+    InventoryDelta; `devices` then maps the backend's native device ID to a
+    DeviceRecord. drive_letter is the drive or mount point of a storage
+    device, else None. Records keep the seen_at of the scan that first found
+    the device.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.devices = {}
+        self.entity_paths = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, full=False):
+        raise NotImplementedError
+
+    def separated(self):
+        """Returns the current devices split into (storage, other) lists of immutable records."""
+        storage_devices, other_devices = [], []
+        for device_info in self.devices.values():
+            if device_info.drive_letter:
+                storage_devices.append(device_info)
+            else:
+                other_devices.append(device_info)
+        return storage_devices, other_devices
+
+    def _apply(self, devices, seen_at):
+        """Replaces `devices` with a fresh scan (started at `seen_at`) and returns what changed."""
+        added, changed = [], []
+        for device_id, device_info in devices.items():
+            previous = self.devices.get(device_id)
+            if previous is None:
+                device_info = devices[device_id] = device_info.first_seen(seen_at)
+                added.append(device_info)
+            elif previous != device_info:
+                device_info = devices[device_id] = device_info.first_seen(previous.seen_at)
+                changed.append(device_info)
+            else:
+                devices[device_id] = previous
+        removed = [info for device_id, info in self.devices.items() if device_id not in devices]
+        self.devices = devices
+        return InventoryDelta(added, removed, changed)
+
+
+class WMIDetectionBackend(DetectionBackend):
+    """
+    Windows backend. Keeps a persistent view keyed by the raw WMI DeviceID;
+    each refresh() re-parses only entities whose identity changed and walks the
+    disk -> partition -> logical disk associators only for disks without a
+    known drive letter (new ones, or ones Windows had not mounted yet).
+    """
+
+    name = "wmi"
+
+    def __init__(self):
+        super().__init__()
+        self._parsed = {}        # DeviceID -> (caption, parsed dict or None)
+        # Win32_DiskDrive.PNPDeviceID -> (serial, drive letter); lettered disks only. Keyed by the
+        # PNPDeviceID (which carries the serial) because Windows reuses \\.\PHYSICALDRIVEn numbers
+        self._disk_letters = {}
+        # self.entity_paths: DeviceID -> WMI object path, for O(1) lookups by enforcement
+
+    def refresh(self, full=False, wmi_conn=None):
+        """
+        Re-reads the USB entities and returns an InventoryDelta of device dicts.
+        With full=True all cached parse and drive letter state is discarded first.
+        """
+        if wmi_conn is None:
+            wmi_conn = _thread_connection()
+        with self._lock:
+            seen_at = time.monotonic()
+            if full:
+                self._parsed.clear()
+                self._disk_letters.clear()
+            drive_map = self._refresh_drive_map(wmi_conn)
+            return self._refresh_devices(wmi_conn, drive_map, seen_at)
+
+    def _refresh_drive_map(self, wmi_conn):
+        """
+        Maps USB storage serial numbers to drive letters. Only disks that
+        resolved to a letter are cached; a disk scanned before Windows mounted
+        its volume is walked again on every refresh until the letter shows up,
+        and a new stick is walked even if it took over a removed stick's
+        PHYSICALDRIVE number. A full refresh re-walks every disk (e.g. after a
+        letter was reassigned).
+        """
+        disk_letters = {}
+        for disk in wmi_conn.query(USB_DISK_QUERY):
+            known = self._disk_letters.get(disk.PNPDeviceID)
+            if known is None:
+                # The PNPDeviceID contains the serial number in the last part
+                serial = disk.PNPDeviceID.split('\\')[-1]
+                drive_letter = None
+                if '&' not in serial:  # A simple check for a valid serial
+                    for partition in disk.associators("Win32_DiskDriveToDiskPartition"):
+                        for logical_disk in partition.associators("Win32_LogicalDiskToPartition"):
+                            drive_letter = logical_disk.DeviceID
+                if not drive_letter:
+                    continue
+                known = (serial, drive_letter)
+            disk_letters[disk.PNPDeviceID] = known
+        self._disk_letters = disk_letters
+        return dict(disk_letters.values())
+
+    def _refresh_devices(self, wmi_conn, drive_map, seen_at):
+        parsed_cache = {}
+        devices = {}
         processed_ids = set()
+        added, changed = [], []
 
-        # Step 1: Create a map of USB storage serial numbers to drive letters
-        drive_map = {}
-        for disk in wmi_conn.Win32_DiskDrive(InterfaceType="USB"):
-            # The PNPDeviceID contains the serial number in the last part
-            serial = disk.PNPDeviceID.split('\\')[-1]
-            if '&' not in serial:  # A simple check for a valid serial
-                for partition in disk.associators("Win32_DiskDriveToDiskPartition"):
-                    for logical_disk in partition.associators("Win32_LogicalDiskToPartition"):
-                        drive_map[serial] = logical_disk.DeviceID
-        
-        # Step 2: Iterate through all USB PnP devices and USBSTOR devices
-        for device in wmi_conn.Win32_PnPEntity():
-            # Check for both USB\ and USBSTOR\ devices
-            if not device.DeviceID:
-                continue
-                
-            is_usb = device.DeviceID.startswith("USB\\")
-            is_usbstor = device.DeviceID.startswith("USBSTOR\\")
-            
-            if not (is_usb or is_usbstor):
-                continue
-            
-            # Parse VID, PID, and Serial from the DeviceID
-            vid_pid_part = None
-            vid, pid = "", ""
-            
-            if is_usb:
-                # Regular USB PnP device
-                vid_pid_part = next((p for p in device.DeviceID.split('\\') if 'VID_' in p and 'PID_' in p), None)
-                if vid_pid_part:
-                    vid = vid_pid_part.split('VID_')[1].split('&')[0]
-                    pid = vid_pid_part.split('PID_')[1].split('&')[0]
-            elif is_usbstor:
-                # USB Storage device - extract VID/PID from VEN_ and PROD_ fields
-                parts = device.DeviceID.split('\\')
-                if len(parts) >= 2:
-                    ven_prod = parts[1]
-                    # Extract VID from VEN_ field
-                    if 'VEN_' in ven_prod:
-                        ven_part = ven_prod.split('VEN_')[1].split('&')[0]
-                        # SanDisk shows as '_USB' which means VID_0781, handle this mapping
-                        if ven_part == '_USB':
-                            vid = '0781'  # SanDisk's VID
-                        else:
-                            vid = ven_part.replace('_', '')
-                    # Extract PID from PROD_ field
-                    if 'PROD_' in ven_prod:
-                        prod_part = ven_prod.split('PROD_')[1].split('&')[0]
-                        # For SanDisk 3.2Gen1, the actual PID is 5591
-                        if prod_part == '_SANDISK_3.2GEN1':
-                            pid = '5591'  # SanDisk USB Drive PID
-                        else:
-                            pid = prod_part.replace('_', '')
-            
-            if not vid or not pid:
+        for entity in wmi_conn.query(USB_PNP_QUERY):
+            device_id = entity.DeviceID
+            caption = entity.Caption
+            cached = self._parsed.get(device_id)
+            if cached is None or cached[0] != caption:
+                cached = (caption, _parse_pnp_device(device_id, caption))
+            parsed_cache[device_id] = cached
+            parsed = cached[1]
+            if parsed is None:
                 continue
-            
-            # Extract serial number
-            parts = device.DeviceID.split('\\')
-            serial = parts[-1] if len(parts) > 2 and '&' not in parts[-1] else "NO_SERIAL"
-            
-            canonical_id = f"VID_{vid}&PID_{pid}&SN_{serial if serial != 'NO_SERIAL' else 'NO_SERIAL'}"
 
             # Avoid duplicate entries
-            if canonical_id in processed_ids:
+            if parsed.canonical_id in processed_ids:
                 continue
-            processed_ids.add(canonical_id)
-
-            device_info = {
-                "friendly_name": device.Caption or "Unknown USB Device",
-                "vid": vid,
-                "pid": pid,
-                "serial_number": serial,
-                "canonical_id": canonical_id,
-                "device_id_wmi": device.DeviceID
-            }
-
-            # Step 3: Separate devices based on the drive map
-            drive_letter = drive_map.get(serial)
-            if drive_letter:
-                device_info['drive_letter'] = drive_letter
-                storage_devices.append(device_info)
+            processed_ids.add(parsed.canonical_id)
+
+            drive_letter = drive_map.get(parsed.serial_number)
+            previous = self.devices.get(device_id)
+            if previous is None:
+                device_info = parsed.with_drive_letter(drive_letter).first_seen(seen_at)
+                added.append(device_info)
+            elif previous.drive_letter != drive_letter or previous.friendly_name != parsed.friendly_name:
+                device_info = parsed.with_drive_letter(drive_letter).first_seen(previous.seen_at)
+                changed.append(device_info)
             else:
-                device_info['drive_letter'] = None
-                other_devices.append(device_info)
-                
+                device_info = previous
+            devices[device_id] = device_info
+
+        removed = [info for device_id, info in self.devices.items() if device_id not in devices]
+        self._parsed = parsed_cache
+        self.entity_paths = {device_id: self.entity_paths.get(device_id) or _pnp_entity_path(device_id) for device_id in parsed_cache}
+        self.devices = devices
+        return InventoryDelta(added, removed, changed)
+
+
+def _read_attr(path):
+    """Reads a one-line sysfs attribute, or returns None if the device lacks it."""
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            return f.read(256).strip().decode('utf-8', 'replace') or None
+    except OSError:
+        return None
+
+
+class SysfsDetectionBackend(DetectionBackend):
+    """
+    Linux backend reading sysfs directly. One refresh lists /sys/bus/usb/devices
+    once, reads each device's idVendor/idProduct/serial/product attributes,
+    resolves USB disks from the /sys/block symlinks and takes mount points from
+    a single read of /proc/self/mounts. `root` may point at a fake tree.
+    """
+
+    name = "sysfs"
+
+    def __init__(self, root="/"):
+        super().__init__()
+        self.usb_dir = os.path.join(root, SYSFS_USB_DEVICES)
+        self.block_dir = os.path.join(root, SYSFS_BLOCK)
+        self.mounts_file = os.path.join(root, PROC_MOUNTS)
+
+    def refresh(self, full=False):
+        with self._lock:
+            seen_at = time.monotonic()
+            mount_points = self._block_mount_points()
+            devices = {}
+            processed_ids = set()
+            with os.scandir(self.usb_dir) as entries:
+                for entry in entries:
+                    name = entry.name
+                    # Interfaces ("1-1:1.0") and root hubs ("usb1") are not devices
+                    if ':' in name or name.startswith('usb'):
+                        continue
+                    device_info = self._read_device(entry.path, name, mount_points.get(name))
+                    if device_info is None or device_info.canonical_id in processed_ids:
+                        continue
+                    processed_ids.add(device_info.canonical_id)
+                    devices[name] = device_info
+            return self._apply(devices, seen_at)
+
+    def _read_device(self, path, name, drive_letter):
+        vid = _read_attr(os.path.join(path, "idVendor"))
+        pid = _read_attr(os.path.join(path, "idProduct"))
+        if not vid or not pid:
+            return None
+        vid, pid = vid.upper(), pid.upper()
+        serial = _read_attr(os.path.join(path, "serial")) or "NO_SERIAL"
+        return DeviceRecord(_read_attr(os.path.join(path, "product")) or "Unknown USB Device",
+                            vid, pid, serial, f"VID_{vid}&PID_{pid}&SN_{serial}", name, drive_letter)
+
+    def _block_mount_points(self):
+        """Maps USB device names ("1-1.2") to the mount point of their disk, if mounted."""
+        usb_disks = {}
+        try:
+            with os.scandir(self.block_dir) as entries:
+                for entry in entries:
+                    # /sys/block/sdX -> ../devices/pci.../usb1/1-1/1-1:1.0/host0/.../block/sdX
+                    parts = os.readlink(entry.path).split('/')
+                    usb_device = None
+                    for part in parts[next((i for i, p in enumerate(parts) if p.startswith('usb')), len(parts)) + 1:]:
+                        if ':' in part:
+                            break
+                        usb_device = part
+                    if usb_device:
+                        usb_disks[f"/dev/{entry.name}"] = usb_device
+        except OSError:
+            return {}
+        if not usb_disks:
+            return {}
+
+        mount_points = {}
+        try:
+            with open(self.mounts_file, 'rb') as f:
+                for line in f.read().split(b'\n'):
+                    fields = line.split(b' ', 2)
+                    if len(fields) < 2:
+                        continue
+                    source = fields[0].decode('utf-8', 'replace')
+                    # Partitions (sdb1) belong to the disk (sdb)
+                    disk = source.rstrip('0123456789') if source not in usb_disks else source
+                    usb_device = usb_disks.get(disk)
+                    if usb_device and usb_device not in mount_points:
+                        mount_points[usb_device] = fields[1].decode('utf-8', 'replace').replace('\\040', ' ')
+        except OSError:
+            pass
+        return mount_points
+
+
+# Kept for callers that still use the old name
+DeviceInventory = WMIDetectionBackend
+
+
+def create_default_backend():
+    """WMI where it is importable (Windows, or the benchmark fakes), sysfs on Linux."""
+    try:
+        import wmi  # noqa: F401
+        return WMIDetectionBackend()
+    except ImportError:
+        pass
+    if os.path.isdir(os.path.join("/", SYSFS_USB_DEVICES)):
+        return SysfsDetectionBackend()
+    return WMIDetectionBackend()
+
+
+# Shared backend so repeated scans from the monitor and the API reuse parsed state.
+# Created on first use; set_backend() swaps it (e.g. for a fake sysfs tree).
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_backend():
+    global _inventory
+    if _inventory is None:
+        with _inventory_lock:
+            if _inventory is None:
+                _inventory = create_default_backend()
+    return _inventory
+
+
+def set_backend(backend):
+    global _inventory
+    _inventory = backend
+    return backend
+
+
+def get_separated_usb_devices(full=False):
+    """
+    Detects all connected USB devices and separates them into storage and other categories.
+    This is a more robust version based on the original detection logic.
+    With full=True the backend discards its cached state and rescans from scratch.
+    A failed scan raises rather than reporting no devices, so callers never
+    mistake it for every device having been unplugged.
+    """
+    try:
+        started = time.perf_counter()
+        backend = get_backend()
+        backend.refresh(full=full)
+        storage_devices, other_devices = backend.separated()
+        metrics.SCAN_SECONDS.observe(time.perf_counter() - started)
     except Exception as e:
-        log.error(f"An error occurred in the USB detection logic: {e}")
-        
-    log.info(f"Detector found {len(storage_devices)} storage devices and {len(other_devices)} other devices.")
-    return storage_devices, other_devices
\ No newline at end of file
+        metrics.ERRORS_TOTAL.inc("detector")
+        log.error("An error occurred in the USB detection logic: %s", e)
+        raise
+
+    log.info("Detector found %s storage devices and %s other devices.", len(storage_devices), len(other_devices))
+    return storage_devices, other_devices
+
+
+def get_pnp_entity(device_id, wmi_conn=None):
+    """
+    Fetches a single Win32_PnPEntity by DeviceID without enumerating all entities.
+    Object paths are indexed by the last scan; unknown IDs fall back to a keyed query.
+    Entity handles are COM objects tied to one thread, so only paths are shared and
+    each thread resolves them on its own connection. Returns None if not found.
+    """
+    if not device_id:
+        return None
+    if wmi_conn is None:
+        wmi_conn = _thread_connection()
+    path = get_backend().entity_paths.get(device_id) or _pnp_entity_path(device_id)
+    try:
+        return wmi_conn.get(path)
+    except Exception:
+        pass
+    escaped = device_id.replace('\\', '\\\\').replace("'", "\\'")
+    try:
+        matches = wmi_conn.query(f"SELECT * FROM Win32_PnPEntity WHERE DeviceID = '{escaped}'")
+        return matches[0] if matches else None
+    except Exception as e:
+        log.error("Failed to look up PnP entity '%s': %s", device_id, e)
+        return None
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    from benchmarks import fakes
+    provider = fakes.install()
+
+    print("\n--- A drive letter assigned after the first scan is picked up ---")
+    provider.add_entity("USB\\VID_0781&PID_5591\\SN000000000001", "USB Mass Storage Device")
+    disk = provider.add_disk("SN000000000001", "E:")
+    partition = disk.associators("Win32_DiskDriveToDiskPartition")[0]
+    logical_disks = partition._associations.pop("Win32_LogicalDiskToPartition")  # Not mounted yet
+    backend = WMIDetectionBackend()
+    delta = backend.refresh()
+    storage, other = backend.separated()
+    print(f"before mount: {len(storage)} storage, {len(other)} other")
+    assert len(delta.added) == 1 and not storage
+
+    partition._associations["Win32_LogicalDiskToPartition"] = logical_disks
+    delta = backend.refresh()
+    storage, other = backend.separated()
+    print(f"after mount: {[(d.friendly_name, d.drive_letter) for d in storage]}")
+    assert [d.drive_letter for d in delta.changed] == ["E:"] and len(storage) == 1 and not other
+
+    print("\n--- Lettered disks are not walked again ---")
+    partition._associations["Win32_LogicalDiskToPartition"] = []
+    assert not backend.refresh().changed and backend.separated()[0][0].drive_letter == "E:"
+    assert backend.refresh(full=True).changed[0].drive_letter is None  # A full refresh re-walks
+    print("ok")
+
+    print("\n--- A stick that takes over a removed stick's PHYSICALDRIVE number gets its letter ---")
+    partition._associations["Win32_LogicalDiskToPartition"] = logical_disks
+    assert backend.refresh().changed[0].drive_letter == "E:"
+    provider.remove_entity("USB\\VID_0781&PID_5591\\SN000000000001")
+    provider.remove_disk("SN000000000001")
+    provider.add_entity("USB\\VID_0781&PID_5591\\SN000000000002", "USB Mass Storage Device")
+    assert provider.add_disk("SN000000000002", "E:").DeviceID == disk.DeviceID
+    delta = backend.refresh()
+    print(f"swapped: {[(d.canonical_id, d.drive_letter) for d in delta.added]}")
+    assert [d.drive_letter for d in delta.added] == ["E:"] and len(delta.removed) == 1
+    assert backend.refresh().added == [] and backend.separated()[0][0].drive_letter == "E:"
+
+    print("\n--- A failed scan raises instead of reporting no devices ---")
+    set_backend(backend)
+    provider.query = lambda wql: (_ for _ in ()).throw(RuntimeError("RPC server unavailable"))
+    try:
+        get_separated_usb_devices()
+        raise AssertionError("the scan error was swallowed")
+    except RuntimeError:
+        pass
+    assert backend.separated()[0][0].drive_letter == "E:"  # The last good view is kept
+    print("ok")
+
+    print("\nDetector tests complete.")
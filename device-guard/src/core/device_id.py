@@ -0,0 +1,112 @@
+import os
+import re
+import json
+from functools import lru_cache
+from collections import namedtuple
+from src.utils.logger import log
+
+# Vendor quirk table: USBSTOR VEN_/PROD_ values that don't carry the real VID/PID
+QUIRKS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config", "vendor_quirks.json")
+# Distinct DeviceIDs remembered by parse_device_id; a machine sees only a few hundred
+PARSE_CACHE_SIZE = 4096
+
+# The common shape, USB\VID_xxxx&PID_xxxx[&...]\SERIAL, in one match. Hex-only
+# fields can't contain "PID_", so this agrees with the general path below.
+_USB_SIMPLE = re.compile(r"USB\\VID_([0-9A-Fa-f]+)&PID_([0-9A-Fa-f]+)[^\\]*\\([^\\&]*)$")
+# Field values run to the next '&' (or the end of the path segment)
+_VID = re.compile(r"VID_([^&]*)")
+_PID = re.compile(r"PID_([^&]*)")
+_VEN = re.compile(r"VEN_([^&]*)")
+_PROD = re.compile(r"PROD_([^&]*)")
+
+ParsedDeviceID = namedtuple("ParsedDeviceID", ["vid", "pid", "serial_number", "canonical_id"])
+# Skips namedtuple's Python-level __new__ on the hot path
+_new_parsed = tuple.__new__
+
+
+def load_quirks(path=QUIRKS_FILE):
+    """Loads the quirk table as (vendors, products) dicts keyed by raw VEN_/PROD_ value."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return dict(data.get("vendors", {})), dict(data.get("products", {}))
+    except (OSError, ValueError) as e:
+        log.warning("Could not load vendor quirks from %s: %s", path, e)
+        return {}, {}
+
+
+VENDOR_QUIRKS, PRODUCT_QUIRKS = load_quirks()
+
+
+def set_quirks(vendors, products):
+    """Replaces the quirk table and drops parse results computed with the old one."""
+    global VENDOR_QUIRKS, PRODUCT_QUIRKS
+    VENDOR_QUIRKS, PRODUCT_QUIRKS = dict(vendors), dict(products)
+    parse_device_id.cache_clear()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_device_id(device_id):
+    """
+    Parses a USB or USBSTOR PnP DeviceID into a ParsedDeviceID, or None for
+    entries that are not USB devices or carry no VID/PID. The DeviceID is
+    matched by one precompiled regex when it has the common shape, otherwise
+    split once; results are memoized per DeviceID.
+    """
+    if not device_id:
+        return None
+    match = _USB_SIMPLE.match(device_id)
+    if match:
+        vid, pid, serial = match.groups()
+        return _new_parsed(ParsedDeviceID, (vid, pid, serial, f"VID_{vid}&PID_{pid}&SN_{serial}"))
+
+    parts = device_id.split('\\')
+    vid, pid = "", ""
+    if parts[0] == "USB":
+        # Regular USB PnP device: the segment holding both VID_ and PID_
+        for part in parts:
+            if 'VID_' in part and 'PID_' in part:
+                vid = _VID.search(part).group(1)
+                pid = _PID.search(part).group(1)
+                break
+    elif parts[0] == "USBSTOR":
+        # USB Storage device: VEN_/PROD_ fields, mapped through the quirk table
+        if len(parts) >= 2:
+            match = _VEN.search(parts[1])
+            if match:
+                vid = VENDOR_QUIRKS.get(match.group(1)) or match.group(1).replace('_', '')
+            match = _PROD.search(parts[1])
+            if match:
+                pid = PRODUCT_QUIRKS.get(match.group(1)) or match.group(1).replace('_', '')
+    else:
+        return None
+
+    if not vid or not pid:
+        return None
+
+    serial = parts[-1] if len(parts) > 2 and '&' not in parts[-1] else "NO_SERIAL"
+    return ParsedDeviceID(vid, pid, serial, f"VID_{vid}&PID_{pid}&SN_{serial}")
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    print("\n--- USB and USBSTOR IDs ---")
+    usb = parse_device_id("USB\\VID_0781&PID_5591\\4C530001234567891234")
+    print(usb)
+    assert usb == ("0781", "5591", "4C530001234567891234", "VID_0781&PID_5591&SN_4C530001234567891234")
+    composite = parse_device_id("USB\\VID_046D&PID_C52B&MI_00\\7&2A1D2B5E&0&0000")
+    assert composite.canonical_id == "VID_046D&PID_C52B&SN_NO_SERIAL"
+
+    print("\n--- Quirk table ---")
+    sandisk = parse_device_id("USBSTOR\\DISK&VEN__USB&PROD__SANDISK_3.2GEN1&REV_1.00\\0401A1B2C3D4&0")
+    print(sandisk)
+    assert (sandisk.vid, sandisk.pid) == ("0781", "5591")
+    assert parse_device_id("USBSTOR\\DISK&VEN_KINGSTON&PROD_DT_100_G2\\X").canonical_id == "VID_KINGSTON&PID_DT100G2&SN_X"
+
+    print("\n--- Non-USB and malformed IDs ---")
+    assert parse_device_id("PCI\\VEN_8086&DEV_A36D\\3&11583659&0&A0") is None
+    assert parse_device_id("USB\\ROOT_HUB30\\4&1D2B5E&0&0") is None
+    assert parse_device_id("") is None
+
+    print(f"\nCache: {parse_device_id.cache_info()}")
+    print("\nDeviceID parser tests complete.")
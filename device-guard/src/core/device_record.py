@@ -0,0 +1,153 @@
+import sys
+from json.encoder import encode_basestring_ascii
+from dataclasses import dataclass, fields, replace
+
+
+@dataclass(frozen=True, eq=False)
+class DeviceRecord:
+    """
+    One detected USB device, as passed between the detector, the service and the API.
+
+    Records are immutable and slotted. canonical_id, vid and pid are interned,
+    so the same device seen by every scan shares one string and sets/dicts keyed
+    by canonical_id compare by identity first. Hashing uses canonical_id only
+    (its str hash is cached); equality compares every field.
+    device_id_wmi holds the backend's native ID (PnP DeviceID or sysfs name).
+    seen_at is the monotonic time the device arrived (its event, or the first
+    scan that found it), or None; it is not compared or serialized.
+    """
+    __slots__ = ("friendly_name", "vid", "pid", "serial_number", "canonical_id", "device_id_wmi", "drive_letter", "_json",
+                 "seen_at")
+
+    friendly_name: str
+    vid: str
+    pid: str
+    serial_number: str
+    canonical_id: str
+    device_id_wmi: str
+    drive_letter: str
+
+    def __post_init__(self):
+        object.__setattr__(self, "canonical_id", sys.intern(self.canonical_id))
+        object.__setattr__(self, "vid", sys.intern(self.vid))
+        object.__setattr__(self, "pid", sys.intern(self.pid))
+        object.__setattr__(self, "_json", None)
+        object.__setattr__(self, "seen_at", None)
+
+    def __hash__(self):
+        return hash(self.canonical_id)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, DeviceRecord):
+            return NotImplemented
+        return (self.canonical_id is other.canonical_id or self.canonical_id == other.canonical_id) and \
+            self.drive_letter == other.drive_letter and self.friendly_name == other.friendly_name and \
+            self.device_id_wmi == other.device_id_wmi and self.serial_number == other.serial_number and \
+            self.vid == other.vid and self.pid == other.pid
+
+    @property
+    def is_storage(self):
+        return bool(self.drive_letter)
+
+    def with_drive_letter(self, drive_letter):
+        """Returns this record with another drive letter (itself if unchanged)."""
+        if drive_letter == self.drive_letter:
+            return self
+        return replace(self, drive_letter=drive_letter).first_seen(self.seen_at)
+
+    def first_seen(self, seen_at):
+        """Returns this record with another arrival time (itself if unchanged)."""
+        if seen_at == self.seen_at:
+            return self
+        record = replace(self)
+        object.__setattr__(record, "seen_at", seen_at)
+        return record
+
+    def to_dict(self, **extra):
+        """Plain dict of the fields, plus any extra keys (e.g. registration flags)."""
+        data = {name: getattr(self, name) for name in _FIELD_NAMES}
+        data.update(extra)
+        return data
+
+    def json_fields(self):
+        """The record's JSON object members (without braces), encoded once and cached."""
+        encoded = self._json
+        if encoded is None:
+            encoded = ",".join(
+                f'"{name}":{"null" if value is None else encode_basestring_ascii(value)}'
+                for name, value in ((name, getattr(self, name)) for name in _FIELD_NAMES)
+            )
+            object.__setattr__(self, "_json", encoded)
+        return encoded
+
+
+_FIELD_NAMES = tuple(field.name for field in fields(DeviceRecord))
+
+
+def serialize_devices(records, annotations=None):
+    """
+    Encodes records as a JSON array string, reusing each record's cached fields.
+    `annotations` maps canonical_id to a pre-encoded suffix such as
+    ',"is_registered":true'; it is appended inside the object.
+    """
+    annotations = annotations or {}
+    return "[" + ",".join(
+        "{" + record.json_fields() + annotations.get(record.canonical_id, "") + "}" for record in records
+    ) + "]"
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import json
+    import tracemalloc
+
+    def make(i, drive_letter=None):
+        serial = f"4C530001{i:012d}" + "A" * 100  # Real SanDisk serials run past 100 chars
+        return DeviceRecord("SanDisk 3.2Gen1", "0781", "5591", serial, f"VID_0781&PID_5591&SN_{serial}",
+                            f"USB\\VID_0781&PID_5591\\{serial}", drive_letter)
+
+    print("\n--- Interning, equality and hashing ---")
+    a, b = make(1), make(1)
+    assert a.canonical_id is b.canonical_id and a == b and hash(a) == hash(b)
+    assert a != a.with_drive_letter("E:") and a.with_drive_letter(None) is a
+    try:
+        a.drive_letter = "F:"
+        raise AssertionError("DeviceRecord must be immutable")
+    except AttributeError:
+        pass
+
+    print("\n--- Serializer matches json.dumps ---")
+    records = [make(i, "E:" if i % 4 == 0 else None) for i in range(50)]
+    body = serialize_devices(records, {records[0].canonical_id: ',"is_registered":true'})
+    expected = [r.to_dict() for r in records]
+    expected[0]["is_registered"] = True
+    assert json.loads(body) == expected
+
+    print("\n--- Memory: records vs dicts, 1000 devices ---")
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    as_dicts = [make(i).to_dict() for i in range(1000)]
+    dict_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    del as_dicts
+    before = tracemalloc.take_snapshot()
+    as_records = [make(i) for i in range(1000)]
+    record_bytes = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    print(f"dicts: {dict_bytes / 1000:.0f} B/device, records: {record_bytes / 1000:.0f} B/device")
+    assert record_bytes < dict_bytes
+
+    print("\n--- Allocations per API serialization cycle (cached fields) ---")
+    serialize_devices(as_records)
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.clear_traces()  # Python 3.8 has no reset_peak; clearing resets the peak too
+    current = tracemalloc.get_traced_memory()[0]
+    body = serialize_devices(as_records)
+    peak = tracemalloc.get_traced_memory()[1] - current
+    print(f"peak {peak / 1024:.0f} KiB for a {len(body) / 1024:.0f} KiB body")
+    assert peak < 3 * len(body)
+    tracemalloc.stop()
+
+    print("\nDevice record tests complete.")
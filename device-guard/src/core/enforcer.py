@@ -1,12 +1,26 @@
+import time
+import heapq
+import itertools
+import threading
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
 from src.utils.logger import log
+from src.utils import metrics
 
-def block_device(device_id_wmi):
+# Worker threads running enforcement actions; enough to block a hub's worth of devices at once
+ENFORCEMENT_WORKERS = 10
+# Seconds each action is allowed to take; passed to the executor and enforced by the queue's watchdog
+ACTION_TIMEOUT = 15
+
+ACTION_TIMED_OUT = "timeout"
+ACTION_FAILED = "error"
+
+def block_device(device_id_wmi, timeout=None):
     """
     Disables a PnP device using PowerShell. Requires Administrator rights.
     """
     try:
-        log.warning(f"ENFORCEMENT: Blocking unregistered device: {device_id_wmi}")
+        log.warning("ENFORCEMENT: Blocking unregistered device: %s", device_id_wmi)
         # Sanitize the ID for the command line
         safe_device_id = device_id_wmi.replace("'", "''")
         
@@ -21,13 +35,240 @@ def block_device(device_id_wmi):
         # We use powershell.exe -Command for this complex command
         result = subprocess.run(
             ["powershell.exe", "-Command", command],
-            capture_output=True, text=True, check=True
+            capture_output=True, text=True, check=True, timeout=timeout
         )
-        log.info(f"Block command for '{device_id_wmi}' executed successfully.")
+        log.info("Block command for '%s' executed successfully.", device_id_wmi)
         return True
     except subprocess.CalledProcessError as e:
-        log.error(f"Failed to block device '{device_id_wmi}'. Error: {e.stderr}")
+        log.error("Failed to block device '%s'. Error: %s", device_id_wmi, e.stderr)
+        return False
+    except subprocess.TimeoutExpired:
+        log.error("Timed out after %ss blocking device '%s'.", timeout, device_id_wmi)
         return False
     except Exception as e:
-        log.error(f"An unexpected error occurred while blocking device: {e}")
-        return False
\ No newline at end of file
+        log.error("An unexpected error occurred while blocking device: %s", e)
+        return False
+
+
+class _Job:
+    __slots__ = ("key", "device", "actions", "callback", "queued_at", "results", "step", "future")
+
+    def __init__(self, key, device, actions, callback):
+        self.key = key
+        self.device = device
+        self.actions = actions
+        self.callback = callback
+        self.queued_at = time.perf_counter()
+        self.results = {}
+        self.step = 0  # Index of the action running (or queued) now
+        self.future = Future()
+
+
+class EnforcementQueue:
+    """
+    Runs enforcement actions for devices on a bounded worker pool so a slow
+    block never stalls detection.
+
+    Actions are looked up by name in `executors`, a dict of callables taking
+    (device, timeout) and returning True/False. A device (keyed by its WMI
+    DeviceID) has at most one job in flight; submitting it again while the
+    first job runs is a no-op. Every finished job reports a dict of
+    action -> result to the job's callback and to `on_result`.
+
+    Actions run directly on the pool's workers, which are set up once with
+    `initializer` (e.g. COM), so each worker keeps its WMI connection. A job's
+    actions run one after another, each as its own pool task. A watchdog gives
+    each action `action_timeout` seconds from when a worker picked it up: an
+    action still running then is recorded as ACTION_TIMED_OUT and the job moves
+    on, so a hung DeviceIoControl or WMI call never holds the device's key.
+    Python can't stop the hung worker itself; its late result is dropped.
+    """
+
+    def __init__(self, executors, max_workers=ENFORCEMENT_WORKERS, action_timeout=ACTION_TIMEOUT,
+                 initializer=None, on_result=None):
+        self.executors = dict(executors)
+        self.max_workers = max_workers
+        self.action_timeout = action_timeout
+        self.initializer = initializer
+        self.on_result = on_result
+        self._pool = None
+        self._in_flight = set()
+        self._deadlines = []  # heap of (deadline, seq, job, step)
+        self._seq = itertools.count()
+        self._lock = threading.Condition()
+        self._watchdog = None
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="enforcement",
+                    initializer=self.initializer
+                )
+                self._watchdog = threading.Thread(target=self._watch, name="enforcement-watchdog", daemon=True)
+                self._watchdog.start()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._lock.notify_all()
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    @staticmethod
+    def device_key(device):
+        return device.device_id_wmi or device.canonical_id
+
+    def in_flight(self, device):
+        with self._lock:
+            return self.device_key(device) in self._in_flight
+
+    def submit(self, device, actions, callback=None):
+        """
+        Queues the named actions for a device. Returns a Future for the job's
+        result dict, or None if the device already has a job in flight.
+        """
+        unknown = [action for action in actions if action not in self.executors]
+        if unknown:
+            raise ValueError(f"No executor registered for enforcement actions: {unknown}")
+        self.start()
+        key = self.device_key(device)
+        job = _Job(key, device, tuple(actions), callback)
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            self._in_flight.add(key)
+        try:
+            self._pool.submit(self._run_action, job, 0)
+        except Exception:
+            with self._lock:
+                self._in_flight.discard(key)
+            raise
+        return job.future
+
+    def _run_action(self, job, step):
+        """Runs one of the job's actions on this worker; the watchdog holds its deadline."""
+        action = job.actions[step]
+        with self._lock:
+            if job.step != step:
+                return
+            started = time.monotonic()
+            heapq.heappush(self._deadlines, (started + self.action_timeout, next(self._seq), job, step))
+            self._lock.notify_all()
+        try:
+            result = bool(self.executors[action](job.device, self.action_timeout))
+            if not result and time.monotonic() - started >= self.action_timeout:
+                result = ACTION_TIMED_OUT  # The executor gave up at its own timeout
+        except Exception as e:
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Enforcement action '%s' failed for %s: %s", action, job.device.friendly_name, e)
+            result = ACTION_FAILED
+        self._finish_action(job, step, result)
+
+    def _watch(self):
+        """Times out actions whose deadline passed (one thread for all jobs)."""
+        with self._lock:
+            while self._pool is not None:
+                while self._deadlines and self._deadlines[0][2].step != self._deadlines[0][3]:
+                    heapq.heappop(self._deadlines)  # Finished in time
+                if not self._deadlines:
+                    self._lock.wait()
+                    continue
+                deadline, _, job, step = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+                self._lock.release()
+                try:
+                    metrics.ERRORS_TOTAL.inc("enforcement")
+                    log.error("Enforcement action '%s' for %s timed out after %ss.",
+                              job.actions[step], job.device.friendly_name, self.action_timeout)
+                    self._finish_action(job, step, ACTION_TIMED_OUT)
+                finally:
+                    self._lock.acquire()
+
+    def _finish_action(self, job, step, result):
+        """Records an action's result, then queues the job's next action or completes the job."""
+        with self._lock:
+            if job.step != step:
+                return  # Already timed out; the first result stands
+            job.results[job.actions[step]] = result
+            job.step = next_step = step + 1
+            pool = self._pool if next_step < len(job.actions) else None
+            self._lock.notify_all()
+        if pool is not None:
+            try:
+                pool.submit(self._run_action, job, next_step)
+                return
+            except RuntimeError:  # Shut down meanwhile; the remaining actions are skipped
+                pass
+        self._complete(job)
+
+    def _complete(self, job):
+        with self._lock:
+            self._in_flight.discard(job.key)
+        metrics.ENFORCEMENT_SECONDS.observe(time.perf_counter() - job.queued_at)
+        results = dict(job.results)
+        for listener in (job.callback, self.on_result):
+            if listener is not None:
+                try:
+                    listener(job.device, results)
+                except Exception as e:
+                    log.error("Enforcement result callback failed: %s", e)
+        job.future.set_result(results)
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    from src.core.device_record import DeviceRecord
+
+    def slow_action(device, timeout):
+        time.sleep(0.2)
+        return True
+
+    queue = EnforcementQueue({"disable_device": slow_action}, max_workers=10)
+    devices = [DeviceRecord(f"Device {i}", "0001", f"{i:04d}", "X", f"VID_0001&PID_{i:04d}&SN_X", f"USB\\DEV{i}", None) for i in range(10)]
+
+    print("\n--- Ten devices blocked in parallel ---")
+    started = time.monotonic()
+    futures = [queue.submit(device, ["disable_device"]) for device in devices]
+    assert queue.submit(devices[0], ["disable_device"]) is None  # deduplicated while in flight
+    results = [future.result() for future in futures]
+    elapsed = time.monotonic() - started
+    print(f"Handled {len(results)} devices in {elapsed:.2f}s")
+    assert all(r == {"disable_device": True} for r in results)
+    assert elapsed < 1.0
+
+    print("\n--- A hung action times out and releases the device ---")
+    def hung_action(device, timeout):
+        time.sleep(2.0)
+        return True
+
+    queue = EnforcementQueue({"eject_drive": hung_action, "disable_device": slow_action}, action_timeout=0.3)
+    started = time.monotonic()
+    result = queue.submit(devices[0], ["eject_drive", "disable_device"]).result(timeout=2)
+    elapsed = time.monotonic() - started
+    print(f"{result} in {elapsed:.2f}s")
+    assert result == {"eject_drive": ACTION_TIMED_OUT, "disable_device": True} and elapsed < 1.0
+    assert not queue.in_flight(devices[0])
+
+    print("\n--- Actions run on the pool's initialized workers ---")
+    initialized, action_threads = [], set()
+
+    def thread_action(device, timeout):
+        action_threads.add(threading.get_ident())
+        return True
+
+    queue.shutdown(wait=False)
+    queue = EnforcementQueue({"hide_drive": thread_action, "disable_device": thread_action}, max_workers=2,
+                             initializer=lambda: initialized.append(threading.get_ident()))
+    for device in devices:
+        queue.submit(device, ["hide_drive", "disable_device"]).result(timeout=2)
+    print(f"{len(devices) * 2} actions on {len(action_threads)} worker(s), {len(initialized)} initializer call(s)")
+    assert action_threads <= set(initialized) and len(initialized) <= 2
+
+    queue.shutdown()
+    print("\nEnforcement queue tests complete.")
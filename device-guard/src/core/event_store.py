@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from src.core.db import connect
+from src.utils.logger import log
+
+# Security events live in their own file so appends never invalidate the
+# whitelist snapshot (PRAGMA data_version is per database file).
+EVENTS_DB_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "events.db")
+
+# Event types written by the service
+DEVICE_CONNECTED = "device_connected"
+DEVICE_DISCONNECTED = "device_disconnected"
+DEVICE_BLOCKED = "device_blocked"
+VERIFICATION_PASSED = "verification_passed"
+VERIFICATION_FAILED = "verification_failed"
+ENFORCEMENT_COMPLETED = "enforcement_completed"
+ENFORCEMENT_INCOMPLETE = "enforcement_incomplete"
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Retention: events older than EVENTS_MAX_AGE seconds are dropped, and only the
+# newest EVENTS_MAX_ROWS are kept. Checked every PRUNE_EVERY appends (and on open).
+EVENTS_MAX_AGE = 90 * 86400
+EVENTS_MAX_ROWS = 200000
+PRUNE_EVERY = 1000
+
+
+class EventStore:
+    """
+    Append-only store of typed security events in SQLite.
+
+    Rows are indexed by time, by level and by canonical_id, so a device's
+    history or a time range is an index lookup. Pages are returned
+    newest first and continue with keyset pagination on the row id.
+    Old events are pruned (see EVENTS_MAX_AGE / EVENTS_MAX_ROWS), so the
+    file stops growing.
+    """
+
+    def __init__(self, db_path=None, max_age=EVENTS_MAX_AGE, max_rows=EVENTS_MAX_ROWS):
+        self.db_path = db_path or EVENTS_DB_FILE
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = None
+        self._appended = 0
+        self._create_table()
+        self.prune()
+
+    def _connection(self):
+        """Single long-lived connection; callers must hold self._lock."""
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        return self._conn
+
+    def _create_table(self):
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS security_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ts REAL NOT NULL,            -- Unix time (seconds)
+                        level TEXT NOT NULL,
+                        event_type TEXT NOT NULL,
+                        canonical_id TEXT,
+                        message TEXT NOT NULL,
+                        details TEXT                 -- JSON object, optional
+                    );
+                    -- Secondary indexes end in the rowid (id), so per-device and
+                    -- per-level pages come out in id order without a sort.
+                    CREATE INDEX IF NOT EXISTS idx_events_ts ON security_events (ts);
+                    CREATE INDEX IF NOT EXISTS idx_events_level ON security_events (level);
+                    CREATE INDEX IF NOT EXISTS idx_events_device ON security_events (canonical_id);
+                """)
+                conn.commit()
+            except sqlite3.Error as e:
+                log.error("DATABASE ERROR creating event store: %s", e)
+
+    def record(self, event_type, message, level="INFO", canonical_id=None, details=None, ts=None):
+        """Appends one event. Returns its id, or None on error."""
+        with self._lock:
+            try:
+                conn = self._connection()
+                cursor = conn.execute(
+                    "INSERT INTO security_events (ts, level, event_type, canonical_id, message, details) VALUES (?, ?, ?, ?, ?, ?)",
+                    (ts if ts is not None else time.time(), level, event_type, canonical_id, message,
+                     json.dumps(details, default=str) if details else None)
+                )
+                conn.commit()
+                self._appended += 1
+                if self._appended % PRUNE_EVERY == 0:
+                    self._prune(conn)
+                return cursor.lastrowid
+            except sqlite3.Error as e:
+                log.error("DATABASE ERROR recording event '%s': %s", event_type, e)
+                return None
+
+    def prune(self):
+        """Applies the retention limits now. Returns the number of events deleted (0 on error)."""
+        with self._lock:
+            try:
+                return self._prune(self._connection())
+            except sqlite3.Error as e:
+                log.error("DATABASE ERROR pruning events: %s", e)
+                return 0
+
+    def _prune(self, conn):
+        """Deletes events past max_age, then all but the newest max_rows; callers must hold self._lock."""
+        deleted = 0
+        if self.max_age:
+            deleted += conn.execute("DELETE FROM security_events WHERE ts < ?", (time.time() - self.max_age,)).rowcount
+        if self.max_rows:
+            deleted += conn.execute(
+                "DELETE FROM security_events WHERE id < (SELECT id FROM security_events ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_rows - 1,)
+            ).rowcount
+        conn.commit()
+        return deleted
+
+    def query(self, canonical_id=None, level=None, event_type=None, since=None, until=None,
+              before_id=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns up to `limit` matching events, newest first, as dicts.
+        `since`/`until` are Unix times; pass the last id of a page as
+        `before_id` to fetch the next one.
+        """
+        clauses, params = [], []
+        for column, value in (("canonical_id", canonical_id), ("level", level), ("event_type", event_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(max(1, min(int(limit), MAX_PAGE_SIZE)))
+        with self._lock:
+            try:
+                rows = self._connection().execute(
+                    f"SELECT * FROM security_events {where} ORDER BY id DESC LIMIT ?", params
+                ).fetchall()
+            except sqlite3.Error as e:
+                log.error("DATABASE ERROR querying events: %s", e)
+                return []
+        events = []
+        for row in rows:
+            event = dict(row)
+            event['details'] = json.loads(event['details']) if event['details'] else None
+            events.append(event)
+        return events
+
+    def clear(self):
+        """Deletes all events. Returns True on success."""
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute("DELETE FROM security_events")
+                conn.commit()
+                return True
+            except sqlite3.Error as e:
+                log.error("DATABASE ERROR clearing events: %s", e)
+                return False
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def format_event_time(ts):
+    """Formats a stored Unix time like the rest of the Logs tab ('YYYY-MM-DD HH:MM:SS')."""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EventStore(os.path.join(tmp, "events.db"))
+        device = "VID_0781&PID_5591&SN_ABCDEF123456"
+
+        print("\n--- Recording a month of events ---")
+        start = time.time() - 30 * 86400
+        for i in range(3000):
+            store.record(DEVICE_CONNECTED, f"Device {i % 50} connected", canonical_id=f"VID_0001&PID_{i % 50:04d}&SN_X", ts=start + i * 864)
+        first = store.record(DEVICE_BLOCKED, "Unauthorized device blocked", "WARNING", device, {"drive_letter": "E:"}, ts=start + 10)
+        store.record(VERIFICATION_FAILED, "Fingerprint mismatch", "WARNING", device, ts=start + 20)
+
+        print("\n--- Device history is an index lookup ---")
+        plan = store._connection().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM security_events WHERE canonical_id = ? ORDER BY id DESC LIMIT 100", (device,)
+        ).fetchall()
+        print([tuple(row)[-1] for row in plan])
+        assert any("USING INDEX" in tuple(row)[-1] for row in plan)
+        assert not any("TEMP B-TREE" in tuple(row)[-1] for row in plan)
+        history = store.query(canonical_id=device)
+        assert [e['event_type'] for e in history] == [VERIFICATION_FAILED, DEVICE_BLOCKED]
+        assert history[1]['details'] == {"drive_letter": "E:"} and history[1]['id'] == first
+
+        print("\n--- Keyset pagination and time ranges ---")
+        page1 = store.query(limit=10)
+        page2 = store.query(limit=10, before_id=page1[-1]['id'])
+        assert page2[0]['id'] < page1[-1]['id'] and len(page2) == 10
+        week = store.query(since=start, until=start + 7 * 86400, level="INFO", limit=1000)
+        print(f"Events in first week: {len(week)}")
+        assert all(start <= e['ts'] < start + 7 * 86400 for e in week)
+
+        print("\n--- Retention drops old events and caps the row count ---")
+        store.max_age = 20 * 86400
+        store.max_rows = 500
+        deleted = store.prune()
+        remaining = store._connection().execute("SELECT COUNT(*), MIN(ts) FROM security_events").fetchone()
+        print(f"Pruned {deleted} events, {remaining[0]} left")
+        assert remaining[0] == 500 and remaining[1] >= time.time() - 20 * 86400
+        assert store.query(canonical_id=device) == []  # Recorded a month ago
+        assert store.query(limit=1)[0]['message'] == "Device 49 connected"  # The newest are kept
+
+        store.close()
+    print("\nEvent store tests complete.")
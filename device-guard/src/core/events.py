@@ -0,0 +1,381 @@
+import os
+import sys
+import time
+import socket
+import threading
+from datetime import datetime, timezone
+from src.utils.logger import log
+
+DEVICE_ARRIVAL = "arrival"
+DEVICE_REMOVAL = "removal"
+# Pushed once by a source that failed more often than it may be restarted
+SOURCE_FAILED = "source_failed"
+
+# Linux netlink protocol number for kernel uevents (linux/netlink.h)
+NETLINK_KOBJECT_UEVENT = 15
+
+# A source that fails is restarted this many times in a row before it gives up
+SOURCE_MAX_RESTARTS = 5
+# Seconds before the first restart; doubled after each further failure
+SOURCE_RESTART_DELAY = 1
+# A source that ran at least this long before failing starts counting afresh
+SOURCE_HEALTHY_SECONDS = 60
+
+# One watcher for both arrivals and removals of USB entities. WMI polls for
+# intrinsic events every WITHIN seconds, which bounds the detection latency.
+USB_PNP_EVENT_QUERY = (
+    "SELECT * FROM __InstanceOperationEvent WITHIN {within} "
+    "WHERE (__CLASS = '__InstanceCreationEvent' OR __CLASS = '__InstanceDeletionEvent') "
+    "AND TargetInstance ISA 'Win32_PnPEntity' AND TargetInstance.DeviceID LIKE 'USB%'"
+)
+WMI_EVENT_ACTIONS = {"creation": DEVICE_ARRIVAL, "deletion": DEVICE_REMOVAL}
+
+
+class DeviceEvent:
+    """A single device arrival or removal notification pushed by an event source."""
+
+    __slots__ = ("action", "device", "source_id", "timestamp")
+
+    def __init__(self, action, device=None, source_id=None, timestamp=None):
+        self.action = action
+        # Fully parsed DeviceRecord (same as the detector output), or None
+        # when the source only knows that *something* changed.
+        self.device = device
+        # Raw identifier from the source (WMI DeviceID, sysfs devpath...)
+        self.source_id = source_id
+        self.timestamp = timestamp if timestamp is not None else time.monotonic()
+
+    def __repr__(self):
+        return f"DeviceEvent({self.action!r}, source_id={self.source_id!r})"
+
+
+class DeviceEventSource:
+    """
+    Base class for pluggable device event sources.
+    A source pushes DeviceEvent objects into the callback given to start().
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._callback = None
+
+    def start(self, callback):
+        """Starts delivering events to callback. Returns True if the source is live."""
+        self._callback = callback
+        return True
+
+    def stop(self):
+        """Stops delivering events."""
+        self._callback = None
+
+    def _emit(self, event):
+        callback = self._callback
+        if callback is not None:
+            callback(event)
+
+
+class SyntheticEventSource(DeviceEventSource):
+    """In-process event source for tests: events are injected by calling arrive()/remove()."""
+
+    name = "synthetic"
+
+    def arrive(self, device):
+        event = DeviceEvent(DEVICE_ARRIVAL, device=device, source_id=device.device_id_wmi)
+        self._emit(event)
+        return event
+
+    def remove(self, device):
+        event = DeviceEvent(DEVICE_REMOVAL, device=device, source_id=device.device_id_wmi)
+        self._emit(event)
+        return event
+
+
+class _ThreadedEventSource(DeviceEventSource):
+    """
+    Shared start/stop plumbing for sources that block on an OS notification API.
+    If _run() fails (raises, or returns while running) the source is reopened
+    after a growing delay; after `max_restarts` failures in a row it stops and
+    pushes one SOURCE_FAILED event so the service can fall back to polling.
+    """
+
+    def __init__(self, max_restarts=SOURCE_MAX_RESTARTS, restart_delay=SOURCE_RESTART_DELAY):
+        super().__init__()
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self._running = False
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self, callback):
+        super().start(callback)
+        if not self._open():
+            super().stop()
+            return False
+        self._running = True
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._supervise, name=f"{self.name}-events", daemon=True)
+        self._thread.start()
+        log.info("Device event source '%s' started", self.name)
+        return True
+
+    def stop(self):
+        self._running = False
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._close()
+        super().stop()
+
+    def _open(self):
+        return True
+
+    def _close(self):
+        pass
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _supervise(self):
+        failures = 0
+        opened = True  # By start()
+        while self._running:
+            started = time.monotonic()
+            if opened:
+                try:
+                    self._run()
+                except Exception as e:
+                    log.error("Device event source '%s' stopped unexpectedly: %s", self.name, e)
+                if not self._running:
+                    return
+                self._close()
+            if time.monotonic() - started >= SOURCE_HEALTHY_SECONDS:
+                failures = 0
+            failures += 1
+            if failures > self.max_restarts:
+                log.error("Device event source '%s' failed %d times in a row; giving up", self.name, failures)
+                self._running = False
+                self._emit(DeviceEvent(SOURCE_FAILED))
+                return
+            delay = self.restart_delay * 2 ** (failures - 1)
+            log.warning("Restarting device event source '%s' in %ss (attempt %d of %d)",
+                        self.name, delay, failures, self.max_restarts)
+            if self._stopped.wait(delay):
+                return
+            opened = self._open()
+
+
+class WMIEventSource(_ThreadedEventSource):
+    """
+    Windows source built on a single WMI __InstanceOperationEvent watcher
+    for the creation and deletion of USB Win32_PnPEntity instances. Events are
+    stamped with WMI's TIME_CREATED, so latency measured from them includes
+    the WITHIN polling delay.
+    """
+
+    name = "wmi"
+
+    def __init__(self, delay_secs=0.5, timeout_ms=500, **kwargs):
+        super().__init__(**kwargs)
+        # WITHIN clause used by WMI to poll intrinsic events internally
+        self.delay_secs = delay_secs
+        # How long each watcher call blocks, so stop() is honoured quickly
+        self.timeout_ms = timeout_ms
+
+    def _open(self):
+        try:
+            import wmi  # noqa: F401
+            import pythoncom  # noqa: F401
+            return True
+        except ImportError as e:
+            log.warning("WMI event source unavailable: %s", e)
+            return False
+
+    def _run(self):
+        import wmi
+        import pythoncom
+
+        # COM is initialized once per run of this thread; failures propagate to _supervise
+        pythoncom.CoInitialize()
+        try:
+            conn = wmi.WMI()
+            watcher = conn.watch_for(raw_wql=USB_PNP_EVENT_QUERY.format(within=self.delay_secs))
+            while self._running:
+                try:
+                    instance = watcher(timeout_ms=self.timeout_ms)
+                except wmi.x_wmi_timed_out:
+                    continue
+                action = WMI_EVENT_ACTIONS.get(getattr(instance, 'event_type', None))
+                device_id = getattr(instance, 'DeviceID', None) or ""
+                if action and device_id.startswith(("USB\\", "USBSTOR\\")):
+                    self._emit(DeviceEvent(action, source_id=device_id, timestamp=self._created_at(instance)))
+        finally:
+            pythoncom.CoUninitialize()
+
+    @staticmethod
+    def _created_at(instance):
+        """Monotonic time of the event's TIME_CREATED (a naive UTC datetime in the wmi module), or now."""
+        now = time.monotonic()
+        created = getattr(instance, 'timestamp', None)
+        if created is None:
+            return now
+        age = (datetime.now(timezone.utc).replace(tzinfo=None) - created).total_seconds()
+        return now - max(age, 0.0)
+
+
+class UdevEventSource(_ThreadedEventSource):
+    """
+    Linux source reading kernel uevents straight from the netlink socket,
+    so it needs neither udevd nor pyudev.
+    """
+
+    name = "udev"
+    SUBSYSTEMS = ("usb", "block")
+
+    def __init__(self, timeout=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+        self._sock = None
+
+    def _open(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.bind((os.getpid(), 1))  # group 1 = kernel uevents
+            sock.settimeout(self.timeout)
+            self._sock = sock
+            return True
+        except (AttributeError, OSError) as e:
+            log.warning("udev event source unavailable: %s", e)
+            return False
+
+    def _close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    @staticmethod
+    def parse_uevent(data):
+        """Parses a raw kernel uevent datagram into a dict of its KEY=VALUE fields."""
+        fields = {}
+        for item in data.split(b'\0')[1:]:
+            key, sep, value = item.partition(b'=')
+            if sep:
+                fields[key.decode('ascii', 'replace')] = value.decode('utf-8', 'replace')
+        return fields
+
+    def _run(self):
+        while self._running:
+            try:
+                data = self._sock.recv(16384)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._running:
+                    raise  # Reopened by _supervise
+                break
+            fields = self.parse_uevent(data)
+            if fields.get('SUBSYSTEM') not in self.SUBSYSTEMS:
+                continue
+            action = {'add': DEVICE_ARRIVAL, 'remove': DEVICE_REMOVAL}.get(fields.get('ACTION'))
+            if action:
+                self._emit(DeviceEvent(action, source_id=fields.get('DEVPATH')))
+
+
+def create_default_event_source():
+    """Returns the native event source for the running platform, or None if there is none."""
+    if sys.platform == "win32":
+        return WMIEventSource()
+    if sys.platform.startswith("linux"):
+        return UdevEventSource()
+    return None
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import queue
+    import tempfile
+    from benchmarks import fakes
+    provider = fakes.install()  # Before anything imports wmi or pythoncom
+    from src.core.device_record import DeviceRecord
+
+    source = SyntheticEventSource()
+    received = queue.Queue()
+    source.start(received.put)
+
+    print("\n--- Synthetic arrival/removal round trip ---")
+    device = DeviceRecord("Test Stick", "0781", "5591", "TEST", "VID_0781&PID_5591&SN_TEST",
+                          "USB\\VID_0781&PID_5591\\TEST", None)
+    sent = source.arrive(device)
+    got = received.get(timeout=1)
+    assert got is sent and got.action == DEVICE_ARRIVAL
+    print(f"Delivered {got} in {(time.monotonic() - got.timestamp) * 1000:.3f} ms")
+    source.remove(device)
+    assert received.get(timeout=1).action == DEVICE_REMOVAL
+
+    print("\n--- uevent parsing ---")
+    raw = b"add@/devices/pci0000:00/usb1/1-1\0ACTION=add\0DEVPATH=/devices/pci0000:00/usb1/1-1\0SUBSYSTEM=usb\0"
+    fields = UdevEventSource.parse_uevent(raw)
+    print(fields)
+    assert fields['ACTION'] == 'add' and fields['SUBSYSTEM'] == 'usb'
+    source.stop()
+
+    def wait_for(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.005)
+
+    print("\n--- WMI source restarts after its connection drops ---")
+    source = WMIEventSource(delay_secs=0.05, timeout_ms=50, restart_delay=0.05)
+    assert source.start(received.put)
+    wait_for(lambda: provider.watchers)
+    provider.fail_watchers(RuntimeError("The RPC server is unavailable"))
+    wait_for(lambda: provider.watchers)
+    provider.add_entity("USB\\VID_0781&PID_5591\\RESTART", "USB Mass Storage Device")
+    got = received.get(timeout=1)
+    print(got)
+    assert got.action == DEVICE_ARRIVAL and got.source_id.endswith("RESTART")
+    source.stop()
+
+    print("\n--- A source that keeps failing gives up ---")
+    provider.watch_error = RuntimeError("Access denied")
+    source = WMIEventSource(max_restarts=2, restart_delay=0.01)
+    assert source.start(received.put)
+    got = received.get(timeout=1)
+    print(got)
+    assert got.action == SOURCE_FAILED
+    source.stop()
+    provider.watch_error = None
+
+    print("\n--- Insert-to-decision latency through the service (WITHIN 0.5) ---")
+    from src.core import detector
+    from src.core.db import WhitelistDB
+    from src.core.event_store import EventStore
+    from src.services.usb_guard_service import USBGuardService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fakes.use_provider(fakes.FakeWMIProvider())
+        provider = fakes.FakeWMI.provider
+        detector.set_backend(detector.WMIDetectionBackend())
+        service = USBGuardService(event_source=WMIEventSource(), db=WhitelistDB(os.path.join(tmp, "whitelist.db")),
+                                  events=EventStore(os.path.join(tmp, "events.db")))
+        service.start()
+        wait_for(lambda: provider.watchers)
+        latencies = []
+        for i in range(3):
+            time.sleep(0.2 * i)  # Land at different points of the WITHIN interval
+            service.last_decision_latency_ms = None
+            inserted = time.monotonic()
+            provider.add_usb_devices(1, storage_every=1, start=i)  # USB, USBSTOR and disk entities
+            wait_for(lambda: service.last_decision_latency_ms is not None)
+            measured = (time.monotonic() - inserted) * 1000
+            latencies.append(service.last_decision_latency_ms)
+            print(f"stick {i}: recorded {service.last_decision_latency_ms:.1f} ms, observed {measured:.1f} ms")
+            assert service.last_decision_latency_ms <= measured + 5
+        service.stop()
+        service.db.close()
+        service.events.close()
+        assert max(latencies) < 500 + 250 and min(latencies) > 0
+
+    print("\nEvent source tests complete.")
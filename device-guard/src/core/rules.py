@@ -0,0 +1,211 @@
+import re
+from bisect import bisect_right
+from fnmatch import translate
+
+# Whitelist rule kinds, from most to least specific. A device matching several
+# rules is attributed to the first kind in this order.
+RULE_EXACT = "exact"                  # canonical_id equals `pattern`
+RULE_SERIAL_PREFIX = "serial_prefix"  # serial starts with `pattern` (optionally scoped to vid / vid+pid)
+RULE_SERIAL_GLOB = "serial_glob"      # serial matches the glob `pattern` (* ? [..]), same scoping
+RULE_VID_PID = "vid_pid"              # vid and pid
+RULE_PID_RANGE = "pid_range"          # vid and a hex pid in [pid, pid_max]
+RULE_VID = "vid"                      # any product of the vendor
+RULE_KINDS = (RULE_EXACT, RULE_SERIAL_PREFIX, RULE_SERIAL_GLOB, RULE_VID_PID, RULE_PID_RANGE, RULE_VID)
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+# VID_xxxx&PID_xxxx&SN_serial, as built by parse_device_id
+_CANONICAL_ID = re.compile(r"VID_([^&]*)&PID_([^&]*)&SN_(.*)", re.S).fullmatch
+# Trie node key holding the rules that end at that node (single characters key the children)
+_RULES = ""
+
+
+def split_canonical_id(canonical_id):
+    """Splits VID_xxxx&PID_xxxx&SN_serial into (vid, pid, serial), or None if it has another shape."""
+    match = _CANONICAL_ID(canonical_id)
+    if match is None:
+        return None
+    vid, pid, serial = match.groups()
+    return vid.upper(), pid.upper(), serial
+
+
+def _hex(value):
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_rule(kind, vid=None, pid=None, pid_max=None, pattern=None):
+    """Returns an error message for an ill-formed rule, or None if it is valid."""
+    if kind not in RULE_KINDS:
+        return f"Unknown rule kind '{kind}'"
+    if kind == RULE_EXACT and not (pattern and split_canonical_id(pattern)):
+        return "Exact rules need a canonical ID (VID_xxxx&PID_xxxx&SN_serial) as the pattern"
+    if kind in (RULE_VID, RULE_VID_PID, RULE_PID_RANGE) and not vid:
+        return f"'{kind}' rules need a VID"
+    if kind == RULE_VID_PID and not pid:
+        return "'vid_pid' rules need a PID"
+    if kind == RULE_PID_RANGE:
+        low, high = _hex(pid), _hex(pid_max)
+        if low is None or high is None or low > high:
+            return "'pid_range' rules need hex PIDs with pid <= pid_max"
+    if kind in (RULE_SERIAL_PREFIX, RULE_SERIAL_GLOB):
+        if not pattern:
+            return f"'{kind}' rules need a serial pattern"
+        if pid and not vid:
+            return "Serial rules scoped to a PID also need its VID"
+    return None
+
+
+class RuleMatcher:
+    """
+    Whitelist rules compiled for per-device decisions that don't depend on the
+    number of rules: exact, VID and VID+PID rules are hash lookups, PID ranges
+    a bisect over the vendor's merged ranges, and serial prefixes/globs one walk
+    of a character trie per scope (global, VID, VID+PID), i.e. O(len(serial)).
+    Globs are filed under their literal prefix and confirmed by a regex only
+    when the walk reaches them.
+
+    Rules are dicts with at least id, kind, vid, pid, pid_max and pattern (the
+    rows of whitelist_rules); match() returns the matching rule dict or None.
+    """
+
+    def __init__(self, rules=()):
+        self._exact = {}
+        self._vid = {}
+        self._vid_pid = {}
+        self._ranges = {}   # vid -> [(low, high, rule)], merged when compiled
+        self._tries = {}    # (vid or None, pid or None) -> trie root
+        self._range_index = None
+        self.size = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        """Adds one rule. Invalid rules are ignored; returns whether it was added."""
+        kind = rule["kind"]
+        vid = (rule.get("vid") or "").upper() or None
+        pid = (rule.get("pid") or "").upper() or None
+        if validate_rule(kind, vid, pid, rule.get("pid_max"), rule.get("pattern")):
+            return False
+        if kind == RULE_EXACT:
+            self._exact.setdefault(rule["pattern"], rule)
+        elif kind == RULE_VID:
+            self._vid.setdefault(vid, rule)
+        elif kind == RULE_VID_PID:
+            self._vid_pid.setdefault((vid, pid), rule)
+        elif kind == RULE_PID_RANGE:
+            self._ranges.setdefault(vid, []).append((_hex(pid), _hex(rule["pid_max"]), rule))
+            self._range_index = None
+        else:
+            pattern = rule["pattern"]
+            glob = _GLOB_CHARS.search(pattern) if kind == RULE_SERIAL_GLOB else None
+            prefix = pattern[:glob.start()] if glob else pattern
+            regex = re.compile(translate(pattern)).match if glob else None
+            node = self._tries.setdefault((vid, pid), {})
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(_RULES, []).append((regex, rule))
+        self.size += 1
+        return True
+
+    def _compile_ranges(self):
+        # Per vendor: sorted, non-overlapping ranges, so one bisect finds the only candidate
+        index = {}
+        for vid, ranges in self._ranges.items():
+            merged = []
+            for low, high, rule in sorted(ranges, key=lambda r: (r[0], -r[1])):
+                if merged and low <= merged[-1][1]:
+                    if high > merged[-1][1]:
+                        merged.append((merged[-1][1] + 1, high, rule))
+                    continue
+                merged.append((low, high, rule))
+            index[vid] = ([low for low, _, _ in merged], merged)
+        self._range_index = index
+        return index
+
+    def _match_serial(self, scope, serial):
+        node = self._tries.get(scope)
+        if node is None:
+            return None
+        for char in serial:
+            entries = node.get(_RULES)
+            if entries:
+                for regex, rule in entries:
+                    if regex is None or regex(serial):
+                        return rule
+            node = node.get(char)
+            if node is None:
+                return None
+        for regex, rule in node.get(_RULES, ()):
+            if regex is None or regex(serial):
+                return rule
+        return None
+
+    def match(self, canonical_id):
+        """Returns the most specific rule matching the device, or None."""
+        rule = self._exact.get(canonical_id)
+        if rule is not None:
+            return rule
+        parts = split_canonical_id(canonical_id)
+        if parts is None:
+            return None
+        vid, pid, serial = parts
+        if self._tries:
+            rule = self._match_serial((vid, pid), serial) or self._match_serial((vid, None), serial)
+            if rule is not None:
+                return rule
+        rule = self._vid_pid.get((vid, pid))
+        if rule is not None:
+            return rule
+        if vid in self._ranges:
+            index = self._range_index if self._range_index is not None else self._compile_ranges()
+            number = _hex(pid)
+            if number is not None:
+                lows, merged = index[vid]
+                position = bisect_right(lows, number) - 1
+                if position >= 0 and number <= merged[position][1]:
+                    return merged[position][2]
+        rule = self._vid.get(vid)
+        if rule is not None:
+            return rule
+        if self._tries:
+            return self._match_serial((None, None), serial)
+        return None
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    rules = [
+        {"id": 1, "kind": RULE_EXACT, "pattern": "VID_0781&PID_5591&SN_4C5300012345"},
+        {"id": 2, "kind": RULE_VID, "vid": "046d"},
+        {"id": 3, "kind": RULE_VID_PID, "vid": "0951", "pid": "1666"},
+        {"id": 4, "kind": RULE_PID_RANGE, "vid": "413C", "pid": "2000", "pid_max": "20FF"},
+        {"id": 5, "kind": RULE_PID_RANGE, "vid": "413C", "pid": "2080", "pid_max": "21FF"},
+        {"id": 6, "kind": RULE_SERIAL_PREFIX, "vid": "0781", "pattern": "XYZ"},
+        {"id": 7, "kind": RULE_SERIAL_GLOB, "pattern": "CORP-??-*-A"},
+        {"id": 8, "kind": RULE_VID, "vid": None},  # Invalid: ignored
+    ]
+    matcher = RuleMatcher(rules)
+    assert matcher.size == 7
+
+    def matched(canonical_id):
+        rule = matcher.match(canonical_id)
+        return rule and rule["id"]
+
+    print("\n--- Rule kinds ---")
+    assert matched("VID_0781&PID_5591&SN_4C5300012345") == 1
+    assert matched("VID_046D&PID_C52B&SN_NO_SERIAL") == 2
+    assert matched("VID_0951&PID_1666&SN_ABC") == 3 and matched("VID_0951&PID_1667&SN_ABC") is None
+    assert matched("VID_413C&PID_2003&SN_1") == 4 and matched("VID_413C&PID_2150&SN_1") == 5
+    assert matched("VID_413C&PID_2200&SN_1") is None and matched("VID_413C&PID_KBD&SN_1") is None
+    assert matched("VID_0781&PID_5567&SN_XYZ0001") == 6 and matched("VID_0782&PID_5567&SN_XYZ0001") is None
+    assert matched("VID_1234&PID_0001&SN_CORP-07-99-A") == 7 and matched("VID_1234&PID_0001&SN_CORP-7-99-A") is None
+
+    print("\n--- Unknown and malformed IDs ---")
+    assert matched("VID_DEAD&PID_BEEF&SN_NONE") is None
+    assert matched("not a canonical id") is None
+    assert validate_rule(RULE_PID_RANGE, "413C", "21FF", "2000") is not None
+    assert validate_rule(RULE_SERIAL_PREFIX, None, "5591", None, "X") is not None
+
+    print("\nRule matcher tests complete.")
@@ -0,0 +1,101 @@
+import io
+import csv
+import json
+from itertools import islice
+from src.core.db import DEVICE_COLUMNS
+
+# Export/import formats: one JSON object per line, or CSV with a DEVICE_COLUMNS header
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+FORMATS = {
+    FORMAT_NDJSON: ("application/x-ndjson", "ndjson"),
+    FORMAT_CSV: ("text/csv", "csv"),
+}
+# Rows encoded per chunk of a streamed export
+CHUNK_ROWS = 500
+
+
+def _chunks(rows, size=CHUNK_ROWS):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_ndjson(rows):
+    """Encodes whitelist rows (sqlite3.Rows or dicts keyed by column) as NDJSON, yielding one text chunk per CHUNK_ROWS rows."""
+    for chunk in _chunks(rows):
+        yield "".join(json.dumps({column: row[column] for column in DEVICE_COLUMNS}) + "\n" for row in chunk)
+
+
+def export_csv(rows):
+    """Encodes whitelist rows as CSV with a header line, yielding one text chunk per CHUNK_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(DEVICE_COLUMNS)
+    for chunk in _chunks(rows):
+        writer.writerows([row[column] for column in DEVICE_COLUMNS] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header of an empty export
+
+
+def export_rows(rows, fmt=FORMAT_NDJSON):
+    return export_csv(rows) if fmt == FORMAT_CSV else export_ndjson(rows)
+
+
+def read_ndjson(stream):
+    """Yields one dict per non-blank line of a text stream. Also accepts a JSON array (older exports)."""
+    first = stream.readline()
+    while first and not first.strip():
+        first = stream.readline()
+    if first.lstrip().startswith("["):
+        # The previous export format: a single indented JSON array, loaded whole
+        yield from json.loads(first + stream.read())
+        return
+    if first:
+        yield json.loads(first)
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    """Yields one dict per CSV record; empty cells become None."""
+    for record in csv.DictReader(stream):
+        yield {key: value or None for key, value in record.items() if key}
+
+
+def read_rows(stream, fmt=FORMAT_NDJSON):
+    return read_csv(stream) if fmt == FORMAT_CSV else read_ndjson(stream)
+
+
+def detect_format(filename, default=FORMAT_NDJSON):
+    """Picks the import format from a file name's extension."""
+    return FORMAT_CSV if (filename or "").lower().endswith(".csv") else default
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    devices = [
+        {"canonical_id": "VID_046D&PID_C077&SN_NO_SERIAL", "friendly_name": "Logitech Mouse, \"M100\"", "device_type": "peripheral",
+         "added_on": "2025-01-01T00:00:00", "structural_fingerprint": None, "lockfile_signature": None},
+        {"canonical_id": "VID_0781&PID_5591&SN_ABC", "friendly_name": "Stick", "device_type": "storage",
+         "added_on": "2025-01-02T00:00:00", "structural_fingerprint": "f" * 64, "lockfile_signature": "a" * 140},
+    ] * 600
+
+    print("\n--- Round trips ---")
+    for fmt in (FORMAT_NDJSON, FORMAT_CSV):
+        chunks = list(export_rows(devices, fmt))
+        print(f"{fmt}: {len(chunks)} chunks, {sum(map(len, chunks))} chars")
+        assert list(read_rows(io.StringIO("".join(chunks)), fmt)) == devices
+
+    print("\n--- Legacy JSON array export ---")
+    assert list(read_ndjson(io.StringIO(json.dumps(devices[:2], indent=2)))) == devices[:2]
+    assert detect_format("whitelist.CSV") == FORMAT_CSV and detect_format("whitelist.json") == FORMAT_NDJSON
+
+    print("\nWhitelist import/export tests complete.")
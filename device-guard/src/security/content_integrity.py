@@ -0,0 +1,465 @@
+import os
+import time
+import errno
+import random
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from src.security.disk_structure import device_size
+from src.utils.logger import log
+from src.utils import metrics
+
+# Volume bytes covered by one Merkle leaf
+LEAF_BLOCK_SIZE = 1024 * 1024
+
+# Content modes: hash every block, or a fixed random sample of them (always including the first and last)
+MODE_FULL = "full"
+MODE_SAMPLED = "sampled"
+CONTENT_MODES = (MODE_FULL, MODE_SAMPLED)
+DEFAULT_SAMPLES = 256
+
+# Per-drive budget: read bandwidth (bytes/second) and share of one CPU core spent hashing
+DEFAULT_IO_RATE = 32 * 1024 * 1024
+DEFAULT_CPU_SHARE = 0.25
+# Longest a drive keeps the scheduler thread before the next drive gets a turn (seconds)
+SLICE_SECONDS = 0.2
+
+# Serialized tree: header, then one 32-byte digest per leaf (inner nodes are recomputed on load)
+_TREE_MAGIC = b"DGMT"
+_TREE_VERSION = 1
+_TREE_HEADER = struct.Struct("<4sBBHIQI16s32s")  # magic, version, mode, -, block size, volume size, leaves, salt, root
+_MODE_CODES = {MODE_FULL: 0, MODE_SAMPLED: 1}
+_DIGEST_SIZE = 32
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+_zero_states = {}
+
+
+def leaf_indices(volume_size, block_size=LEAF_BLOCK_SIZE, mode=MODE_SAMPLED, samples=DEFAULT_SAMPLES, salt=b""):
+    """Block numbers covered by a tree, in ascending order. The sample is derived from the salt, so it is reproducible."""
+    count = -(-volume_size // block_size)
+    if mode == MODE_FULL or count <= samples:
+        return list(range(count))
+    inner = random.Random(salt).sample(range(1, count - 1), max(samples - 2, 0))
+    return [0] + sorted(inner) + [count - 1]
+
+
+def _leaf_digest(data, block):
+    return hashlib.sha256(_LEAF_PREFIX + data + block.to_bytes(8, "little")).digest()
+
+
+def _zero_leaf_digest(block_size, block):
+    """Digest of an all-zero block without hashing it again: the zero prefix state is computed once per size."""
+    state = _zero_states.get(block_size)
+    if state is None:
+        state = _zero_states[block_size] = hashlib.sha256(_LEAF_PREFIX + bytes(block_size))
+    state = state.copy()
+    state.update(block.to_bytes(8, "little"))
+    return state.digest()
+
+
+def _node_digest(left, right):
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    """
+    Binary hash tree over the leaf digests of one volume. An odd node at the end
+    of a level is carried up unchanged. update() recomputes only the path from
+    one leaf to the root.
+    """
+
+    def __init__(self, leaves, volume_size, block_size=LEAF_BLOCK_SIZE, mode=MODE_SAMPLED, salt=b""):
+        self.volume_size = volume_size
+        self.block_size = block_size
+        self.mode = mode
+        self.salt = salt
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            below = self.levels[-1]
+            self.levels.append([_node_digest(below[i], below[i + 1]) if i + 1 < len(below) else below[i]
+                                for i in range(0, len(below), 2)])
+
+    @property
+    def leaves(self):
+        return self.levels[0]
+
+    @property
+    def root(self):
+        return self.levels[-1][0] if self.leaves else bytes(_DIGEST_SIZE)
+
+    def blocks(self):
+        """Block numbers of the leaves, in leaf order."""
+        return leaf_indices(self.volume_size, self.block_size, self.mode, len(self.leaves), self.salt)
+
+    def update(self, position, digest):
+        """Replaces one leaf and recomputes its path to the root (log2(leaves) hashes)."""
+        self.levels[0][position] = digest
+        for depth in range(1, len(self.levels)):
+            below = self.levels[depth - 1]
+            position //= 2
+            left = 2 * position
+            self.levels[depth][position] = (_node_digest(below[left], below[left + 1])
+                                            if left + 1 < len(below) else below[left])
+
+    def to_bytes(self):
+        header = _TREE_HEADER.pack(_TREE_MAGIC, _TREE_VERSION, _MODE_CODES[self.mode], 0, self.block_size,
+                                   self.volume_size, len(self.leaves), self.salt.ljust(16, b"\0")[:16], self.root)
+        return header + b"".join(self.leaves)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Loads a tree saved by to_bytes(). Raises ValueError if it is damaged."""
+        if len(blob) < _TREE_HEADER.size:
+            raise ValueError("content tree is truncated")
+        magic, version, mode, _, block_size, volume_size, count, salt, root = _TREE_HEADER.unpack_from(blob)
+        modes = {code: name for name, code in _MODE_CODES.items()}
+        if magic != _TREE_MAGIC or version != _TREE_VERSION or mode not in modes:
+            raise ValueError("not a content tree, or an unsupported version")
+        body = memoryview(blob)[_TREE_HEADER.size:]
+        if len(body) != count * _DIGEST_SIZE:
+            raise ValueError("content tree is truncated")
+        leaves = [bytes(body[i:i + _DIGEST_SIZE]) for i in range(0, len(body), _DIGEST_SIZE)]
+        tree = cls(leaves, volume_size, block_size, modes[mode], salt)
+        if tree.root != root:
+            raise ValueError("content tree root does not match its leaves")
+        return tree
+
+
+class Budget:
+    """
+    Paces the work on one drive to io_rate bytes/second and cpu_share of a core.
+    charge() returns how long the drive must now rest (0 if it is within budget).
+    """
+
+    def __init__(self, io_rate=DEFAULT_IO_RATE, cpu_share=DEFAULT_CPU_SHARE, clock=time.monotonic):
+        self.io_rate = io_rate
+        self.cpu_share = cpu_share
+        self.clock = clock
+        self.started = None
+        self.bytes = 0
+        self.cpu_seconds = 0.0
+
+    def charge(self, nbytes, cpu_seconds):
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        self.bytes += nbytes
+        self.cpu_seconds += cpu_seconds
+        due = max(self.bytes / self.io_rate if self.io_rate else 0.0,
+                  self.cpu_seconds / self.cpu_share if self.cpu_share else 0.0)
+        return max(0.0, due - (now - self.started))
+
+
+class ContentCheck:
+    """
+    Builds (tree=None) or verifies (tree given) the content tree of a volume or
+    image file, a few blocks at a time so it can be paced and interleaved with
+    other drives. Verification stops at the first changed leaf unless
+    stop_on_change is False; positions restricts it to some leaves (e.g. the
+    ones that changed last time). After a run: .tree (built), .changed (leaf
+    positions that differ), .error (exception, if the volume couldn't be read).
+    """
+
+    def __init__(self, path, tree=None, mode=MODE_SAMPLED, samples=DEFAULT_SAMPLES, block_size=LEAF_BLOCK_SIZE,
+                 budget=None, positions=None, stop_on_change=True):
+        self.path = path
+        self.tree = tree
+        self.building = tree is None
+        self.mode = mode if tree is None else tree.mode
+        self.samples = samples
+        self.block_size = block_size if tree is None else tree.block_size
+        self.budget = budget if budget is not None else Budget()
+        self.stop_on_change = stop_on_change
+        self.changed = []
+        self.error = None
+        self.bytes_read = 0
+        self.holes = 0
+        self.done = False
+        self._positions = positions
+        self._digests = []
+        self._blocks = None
+        self._cursor = 0
+        self._file = None
+        self._buffer = None
+        self._sparse = True
+
+    def _open(self):
+        size = device_size(self.path)
+        if self.building:
+            self._salt = os.urandom(16)
+            self.volume_size = size
+            self._blocks = leaf_indices(size, self.block_size, self.mode, self.samples, self._salt)
+        else:
+            if size != self.tree.volume_size:
+                raise OSError(f"{self.path}: volume size changed from {self.tree.volume_size} to {size}")
+            self.volume_size = size
+            self._blocks = self.tree.blocks()
+        if self._positions is None:
+            self._positions = range(len(self._blocks))
+        self._buffer = bytearray(self.block_size)
+        self._file = open(self.path, "rb", buffering=0)
+
+    def _read_block(self, block):
+        """Digest of one block and the bytes actually read (0 for a hole in a sparse file)."""
+        offset = block * self.block_size
+        length = min(self.block_size, self.volume_size - offset)
+        if self._sparse and length == self.block_size:
+            try:
+                data_at = os.lseek(self._file.fileno(), offset, os.SEEK_DATA)
+            except OSError as e:
+                data_at = None if e.errno == errno.ENXIO else -1  # ENXIO: no data after offset
+            except AttributeError:
+                data_at = -1  # No SEEK_DATA on this platform
+            if data_at == -1:
+                self._sparse = False
+            elif data_at is None or data_at >= offset + length:
+                self.holes += 1
+                return _zero_leaf_digest(self.block_size, block), 0
+        view = memoryview(self._buffer)[:length]
+        self._file.seek(offset)
+        total = 0
+        while total < length:
+            count = self._file.readinto(view[total:])
+            if not count:
+                raise OSError(f"{self.path}: short read at block {block}")
+            total += count
+        return _leaf_digest(view, block), total
+
+    def step(self, deadline=None):
+        """
+        Processes leaves until the check is done, the deadline (monotonic
+        seconds) passes or the budget runs out. Returns the seconds this drive
+        should rest before the next step.
+        """
+        if self.done:
+            return 0.0
+        try:
+            if self._file is None:
+                self._open()
+            while self._cursor < len(self._positions):
+                position = self._positions[self._cursor]
+                cpu_started = time.thread_time()
+                digest, nbytes = self._read_block(self._blocks[position])
+                rest = self.budget.charge(nbytes, time.thread_time() - cpu_started)
+                self._cursor += 1
+                self.bytes_read += nbytes
+                if self.building:
+                    self._digests.append(digest)
+                elif digest != self.tree.leaves[position]:
+                    self.changed.append(position)
+                    if self.stop_on_change:
+                        break
+                if self._cursor < len(self._positions) and (rest > 0 or (deadline is not None and time.monotonic() >= deadline)):
+                    return rest
+            if self.building:
+                self.tree = MerkleTree(self._digests, self.volume_size, self.block_size, self.mode, self._salt)
+        except Exception as e:
+            self.error = e
+        self._release()
+        self.done = True
+        return 0.0
+
+    def _release(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = self._buffer = None
+
+    def close(self):
+        """Stops an unfinished check and releases the volume; the check then counts as failed."""
+        if not self.done:
+            self.error = self.error or OSError(f"{self.path}: check cancelled")
+            self.done = True
+        self._release()
+
+    def accept_changes(self):
+        """Re-baselines a verified tree: re-reads only the changed leaves and recomputes their paths to the root."""
+        self._open()
+        try:
+            for position in self.changed:
+                self.tree.update(position, self._read_block(self._blocks[position])[0])
+        finally:
+            self._release()
+        self.changed = []
+        return self.tree
+
+    def run(self, sleep=time.sleep):
+        """Runs the whole check on the calling thread, resting as the budget requires."""
+        while not self.done:
+            rest = self.step()
+            if rest:
+                sleep(rest)
+        return self
+
+    @property
+    def passed(self):
+        return self.done and self.error is None and not self.changed
+
+
+class ContentScheduler:
+    """
+    Runs ContentChecks on one background thread. Drives take turns of at most
+    slice_seconds; a drive over its Budget is skipped until it has rested, so
+    one slow or throttled stick doesn't hold up the others. callback(check) is
+    called on the scheduler thread when a check is done.
+    """
+
+    def __init__(self, slice_seconds=SLICE_SECONDS):
+        self.slice_seconds = slice_seconds
+        self._jobs = OrderedDict()  # key -> [check, callback, ready_at]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self._active = None  # Job whose step is running right now
+
+    def submit(self, key, check, callback=None):
+        """Queues a check for one drive, replacing any check still pending for the same key."""
+        with self._lock:
+            self._jobs.pop(key, None)
+            self._jobs[key] = [check, callback, 0.0]
+            if self._thread is None or not self._thread.is_alive():
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name="ContentScheduler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def cancel(self, key):
+        """Drops a drive's pending check (e.g. the drive was removed); its callback is not called."""
+        with self._lock:
+            job = self._jobs.pop(key, None)
+            if job is None or job is self._active:
+                return  # A running step is closed by the scheduler thread when it returns
+        job[0].close()
+
+    def pending(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        for key in self.pending():
+            self.cancel(key)
+
+    def _next_job(self):
+        """The first drive that has rested long enough, moved to the back; else the time to wait."""
+        with self._lock:
+            if not self._jobs:
+                return None, None
+            now = time.monotonic()
+            for key, job in self._jobs.items():
+                if job[2] <= now:
+                    self._jobs.move_to_end(key)
+                    self._active = job
+                    return key, job
+            return None, min(job[2] for job in self._jobs.values()) - now
+
+    def _run(self):
+        while self._running:
+            key, job = self._next_job()
+            if key is None:
+                self._wake.wait(timeout=job)
+                self._wake.clear()
+                continue
+            check, callback, _ = job
+            rest = check.step(deadline=time.monotonic() + self.slice_seconds)
+            with self._lock:
+                self._active = None
+                if self._jobs.get(key) is not job:
+                    check.close()  # Cancelled or replaced meanwhile
+                    continue
+                if not check.done:
+                    job[2] = time.monotonic() + rest
+                    continue
+                del self._jobs[key]
+            if check.error is not None:
+                metrics.ERRORS_TOTAL.inc("content_integrity")
+            if callback:
+                try:
+                    callback(check)
+                except Exception as e:
+                    log.error("Content check callback for %s failed: %s", key, e)
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "stick.img")
+        with open(image, "wb") as f:
+            f.truncate(64 * LEAF_BLOCK_SIZE + 1000)  # Sparse, with a short last block
+            for block in (0, 7, 40):
+                f.seek(block * LEAF_BLOCK_SIZE + 123)
+                f.write(os.urandom(4096))
+
+        print("\n--- Build (full) and serialize ---")
+        built = ContentCheck(image, mode=MODE_FULL, budget=Budget(0, 0)).run()
+        assert built.passed and len(built.tree.leaves) == 65, built.error
+        blob = built.tree.to_bytes()
+        tree = MerkleTree.from_bytes(blob)
+        print(f"{len(tree.leaves)} leaves, {len(blob)} bytes stored, {built.holes} holes skipped, "
+              f"{built.bytes_read} bytes read, root {tree.root.hex()[:16]}...")
+        assert tree.root == built.tree.root and built.holes == 61
+        assert _zero_leaf_digest(LEAF_BLOCK_SIZE, 5) == _leaf_digest(bytes(LEAF_BLOCK_SIZE), 5)
+        try:
+            MerkleTree.from_bytes(blob[:-1] + bytes([blob[-1] ^ 1]))
+            raise AssertionError("damaged tree was loaded")
+        except ValueError:
+            pass
+
+        print("\n--- Verify unchanged, then after changing one block ---")
+        assert ContentCheck(image, tree=tree).run().passed
+        with open(image, "r+b") as f:
+            f.seek(40 * LEAF_BLOCK_SIZE + 200)
+            f.write(b"tampered")
+        check = ContentCheck(image, tree=tree, stop_on_change=False).run()
+        print(f"changed leaves: {check.changed}")
+        assert check.changed == [40]
+
+        print("\n--- Re-baseline only the changed leaf ---")
+        check.accept_changes()
+        rebuilt = ContentCheck(image, mode=MODE_FULL, budget=Budget(0, 0)).run().tree
+        assert ContentCheck(image, tree=tree).run().passed
+        assert tree.leaves == rebuilt.leaves and tree.root == rebuilt.root
+
+        print("\n--- Sampled tree ---")
+        sampled = ContentCheck(image, mode=MODE_SAMPLED, samples=8).run().tree
+        assert len(sampled.leaves) == 8 and sampled.blocks()[0] == 0 and sampled.blocks()[-1] == 64
+        assert MerkleTree.from_bytes(sampled.to_bytes()).blocks() == sampled.blocks()
+
+        print("\n--- Budget: 8 MiB at 16 MiB/s rests about half a second ---")
+        budget, slept = Budget(io_rate=16 * LEAF_BLOCK_SIZE, cpu_share=0), []
+        dense = os.path.join(tmp, "dense.img")
+        with open(dense, "wb") as f:
+            f.write(os.urandom(8 * LEAF_BLOCK_SIZE))
+        started = time.monotonic()
+        ContentCheck(dense, mode=MODE_FULL, budget=budget).run(sleep=lambda s: (slept.append(s), time.sleep(s)))
+        elapsed = time.monotonic() - started
+        print(f"{elapsed:.2f} s elapsed, {len(slept)} rests")
+        assert 0.4 <= elapsed < 2.0
+
+        print("\n--- Scheduler: two drives, one failing ---")
+        results = {}
+        done = threading.Event()
+        scheduler = ContentScheduler(slice_seconds=0.01)
+
+        def finished(key):
+            def callback(check):
+                results[key] = check
+                if len(results) == 2:
+                    done.set()
+            return callback
+        scheduler.submit("good", ContentCheck(image, tree=tree), finished("good"))
+        scheduler.submit("gone", ContentCheck(os.path.join(tmp, "missing.img"), tree=tree), finished("gone"))
+        assert done.wait(10)
+        scheduler.stop()
+        assert results["good"].passed and isinstance(results["gone"].error, OSError)
+        print("good: passed, gone: " + str(results["gone"].error))
+
+    print("\nContent integrity tests complete.")
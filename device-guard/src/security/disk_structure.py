@@ -0,0 +1,253 @@
+import os
+import sys
+import zlib
+import struct
+import hashlib
+import threading
+from collections import namedtuple
+
+# Fingerprints computed from the raw partition structures carry this prefix, so
+# they can be told apart from (and never compared with) older WMI-based ones
+RAW_FINGERPRINT_PREFIX = "raw1:"
+
+# First read: LBA0 and LBA1 for both 512- and 4096-byte sectors, in one aligned request
+HEAD_BYTES = 8192
+# Reused read buffer per thread; a multiple of every sector size
+CHUNK_BYTES = 64 * 1024
+# Upper bound on the partition entry array we are willing to read (the usual 128 x 128 B is 16 KiB)
+MAX_ENTRY_ARRAY_BYTES = 1024 * 1024
+
+GPT_SIGNATURE = b"EFI PART"
+MBR_BOOT_SIGNATURE = b"\x55\xaa"
+# GPT header fields up to the entry array CRC (UEFI spec 5.3.2)
+_GPT_HEADER = struct.Struct("<8sIIIIQQQQ16sQIII")
+_EMPTY_GUID = bytes(16)
+
+SCHEME_GPT = "gpt"
+SCHEME_MBR = "mbr"
+SCHEME_NONE = "none"         # no partition table (e.g. a superfloppy volume at LBA0)
+SCHEME_CORRUPT = "gpt-corrupt"
+
+# Result of one read: the hex fingerprint (with RAW_FINGERPRINT_PREFIX) and what it covers
+DiskStructure = namedtuple("DiskStructure", ["fingerprint", "scheme", "sector_size", "partitions", "bytes_read"])
+
+_buffers = threading.local()
+
+
+def _buffer():
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(CHUNK_BYTES)
+    return buffer
+
+
+def _read_at(f, offset, view):
+    """Fills `view` from `offset` with readinto; returns the number of bytes read (short at end of file)."""
+    f.seek(offset)
+    total = 0
+    while total < len(view):
+        count = f.readinto(view[total:])
+        if not count:
+            break
+        total += count
+    return total
+
+
+def _mbr_partitions(sector):
+    if sector[510:512] != MBR_BOOT_SIGNATURE:
+        return None
+    # Four 16-byte entries from offset 446; type byte at +4
+    return sum(1 for i in range(4) if sector[446 + 16 * i + 4])
+
+
+def read_structure(path):
+    """
+    Reads the partition structures of a raw disk or disk image and hashes them:
+    LBA0 (MBR / protective MBR), the GPT header and its partition entry array.
+    Only those sectors are read, with sector-aligned readinto() calls into a
+    reused per-thread buffer, and hashed as they arrive. Raises OSError if the
+    device can't be read.
+    """
+    buffer = _buffer()
+    view = memoryview(buffer)
+    digest = hashlib.sha256(RAW_FINGERPRINT_PREFIX.encode())
+    with open(path, "rb", buffering=0) as f:
+        head = _read_at(f, 0, view[:HEAD_BYTES])
+        if head < 512:
+            raise OSError(f"{path}: only {head} bytes readable, not a disk")
+        if head >= 1024 and buffer[512:520] == GPT_SIGNATURE:
+            sector_size = 512
+        elif head >= 4096 + 512 and buffer[4096:4104] == GPT_SIGNATURE:
+            sector_size = 4096
+        else:
+            # MBR or no partition table: LBA0 is the whole structure
+            partitions = _mbr_partitions(buffer)
+            digest.update(view[:512])
+            return DiskStructure(RAW_FINGERPRINT_PREFIX + digest.hexdigest(),
+                                 SCHEME_NONE if partitions is None else SCHEME_MBR, 512, partitions or 0, head)
+
+        digest.update(view[:sector_size])
+        header = bytes(view[sector_size:sector_size + _GPT_HEADER.size])
+        (_, _, header_size, header_crc, _, _, _, _, _, _, entry_lba, entry_count, entry_size,
+         entries_crc) = _GPT_HEADER.unpack(header)
+        array_bytes = entry_count * entry_size
+        valid = (_GPT_HEADER.size <= header_size <= sector_size and entry_size >= 128 and entry_size % 8 == 0
+                 and 0 < array_bytes <= MAX_ENTRY_ARRAY_BYTES and entry_lba >= 2)
+        if valid:
+            raw_header = bytearray(view[sector_size:sector_size + header_size])
+            raw_header[16:20] = bytes(4)
+            valid = zlib.crc32(raw_header) == header_crc
+        if not valid:
+            # Hash the sector as found; the fingerprint still changes if it is altered
+            digest.update(view[sector_size:2 * sector_size])
+            return DiskStructure(RAW_FINGERPRINT_PREFIX + digest.hexdigest(), SCHEME_CORRUPT, sector_size, 0, head)
+        digest.update(view[sector_size:sector_size + header_size])
+
+        # Stream the entry array in aligned chunks; only its used bytes are hashed
+        offset, remaining, bytes_read = entry_lba * sector_size, array_bytes, head
+        crc, partitions = 0, 0
+        while remaining > 0:
+            wanted = min(CHUNK_BYTES, -(-remaining // sector_size) * sector_size)
+            count = _read_at(f, offset, view[:wanted])
+            used = min(count, remaining)
+            if used <= 0:
+                break
+            chunk = view[:used]
+            digest.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            for start in range(0, used - entry_size + 1, entry_size):
+                if buffer[start:start + 16] != _EMPTY_GUID:
+                    partitions += 1
+            offset += count
+            remaining -= used
+            bytes_read += count
+        scheme = SCHEME_GPT if remaining == 0 and crc == entries_crc else SCHEME_CORRUPT
+        return DiskStructure(RAW_FINGERPRINT_PREFIX + digest.hexdigest(), scheme, sector_size, partitions, bytes_read)
+
+
+def _linux_mount_source(mount_point):
+    """/dev node mounted at mount_point (a /dev path is returned as is), or None."""
+    if mount_point.startswith("/dev/"):
+        return mount_point
+    source = None
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1 and fields[1] == mount_point.rstrip("/") and fields[0].startswith("/dev/"):
+                    source = fields[0]
+    except OSError:
+        return None
+    return source
+
+
+def _linux_block_device(mount_point):
+    """Whole-disk /dev node behind a mount point (or a partition node), or None."""
+    source = _linux_mount_source(mount_point)
+    if source is None:
+        return None
+    sys_path = os.path.realpath(os.path.join("/sys/class/block", os.path.basename(os.path.realpath(source))))
+    if os.path.exists(os.path.join(sys_path, "partition")):
+        sys_path = os.path.dirname(sys_path)
+    return os.path.join("/dev", os.path.basename(sys_path))
+
+
+def _windows_physical_drive(drive_letter):
+    """\\\\.\\PhysicalDriveN holding a drive letter, via IOCTL_STORAGE_GET_DEVICE_NUMBER (no WMI)."""
+    import win32file
+    IOCTL_STORAGE_GET_DEVICE_NUMBER = 0x2D1080
+    handle = win32file.CreateFile(f"\\\\.\\{drive_letter.rstrip(os.sep)[:2]}", 0,
+                                  win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE, None,
+                                  win32file.OPEN_EXISTING, 0, None)
+    try:
+        device_type, number, partition = struct.unpack("<III", win32file.DeviceIoControl(
+            handle, IOCTL_STORAGE_GET_DEVICE_NUMBER, None, 12))
+    finally:
+        handle.Close()
+    return f"\\\\.\\PhysicalDrive{number}"
+
+
+def raw_device_path(drive):
+    """
+    Resolves what to read for a drive: a disk image file as is, otherwise the
+    whole physical disk behind a Windows drive letter or a Linux mount point.
+    Returns None if it can't be resolved.
+    """
+    if os.path.isfile(drive):
+        return drive
+    try:
+        if sys.platform == "win32":
+            return _windows_physical_drive(drive)
+        return _linux_block_device(drive)
+    except Exception:
+        return None
+
+
+def raw_volume_path(drive):
+    """
+    Resolves the volume (partition) itself rather than its disk: a disk image
+    file as is, \\\\.\\E: for a Windows drive letter, or the /dev node mounted at
+    a Linux mount point. Returns None if it can't be resolved.
+    """
+    if os.path.isfile(drive):
+        return drive
+    if sys.platform == "win32":
+        return f"\\\\.\\{drive.rstrip(os.sep)[:2]}"
+    return _linux_mount_source(drive)
+
+
+def device_size(path):
+    """Size in bytes of an image file, block device or Windows volume. Raises OSError."""
+    with open(path, "rb", buffering=0) as f:
+        size = f.seek(0, os.SEEK_END)
+        if size <= 0 and sys.platform == "win32":
+            # Volume handles don't report their length through seek
+            import win32file
+            IOCTL_DISK_GET_LENGTH_INFO = 0x7405C
+            handle = win32file._get_osfhandle(f.fileno())
+            size = struct.unpack("<q", win32file.DeviceIoControl(handle, IOCTL_DISK_GET_LENGTH_INFO, None, 8))[0]
+    if size <= 0:
+        raise OSError(f"{path}: size unknown")
+    return size
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import time
+    import tempfile
+    from benchmarks.fakes import build_disk_image
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("\n--- GPT, 4K GPT, MBR and unpartitioned images ---")
+        results = {}
+        for name, kwargs in (("gpt", {}), ("gpt4k", {"sector_size": 4096}), ("mbr", {"scheme": "mbr"}),
+                             ("none", {"scheme": "none"})):
+            path = os.path.join(tmp, f"{name}.img")
+            build_disk_image(path, partitions=3, **kwargs)
+            results[name] = read_structure(path)
+            print(f"{name}: {results[name]}")
+            assert results[name].fingerprint == read_structure(path).fingerprint
+        assert results["gpt"].scheme == SCHEME_GPT and results["gpt"].partitions == 3
+        assert results["gpt4k"].sector_size == 4096 and results["gpt4k"].scheme == SCHEME_GPT
+        assert results["mbr"].scheme == SCHEME_MBR and results["mbr"].partitions == 3
+        assert results["none"].scheme == SCHEME_NONE
+        assert raw_device_path(os.path.join(tmp, "gpt.img")) == os.path.join(tmp, "gpt.img")
+
+        print("\n--- Tampering with a partition entry changes the fingerprint ---")
+        path = os.path.join(tmp, "gpt.img")
+        with open(path, "r+b") as f:
+            f.seek(2 * 512 + 40)  # First entry's starting LBA
+            f.write(b"\x01")
+        tampered = read_structure(path)
+        print(tampered)
+        assert tampered.fingerprint != results["gpt"].fingerprint and tampered.scheme == SCHEME_CORRUPT
+
+        print("\n--- Cost per fingerprint (page cache) ---")
+        path = os.path.join(tmp, "gpt4k.img")
+        n = 2000
+        started = time.perf_counter()
+        for _ in range(n):
+            read_structure(path)
+        print(f"{(time.perf_counter() - started) / n * 1e6:.1f} us")
+
+    print("\nDisk structure tests complete.")
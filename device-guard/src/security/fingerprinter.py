@@ -1,30 +1,113 @@
 import os
-import wmi
+import time
 import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.exceptions import InvalidSignature
+from src.security.disk_structure import RAW_FINGERPRINT_PREFIX, read_structure, raw_device_path
 from src.utils.logger import log
+from src.utils import metrics
 
 LOCK_FOLDER_NAME = ".device_guard"
 LOCK_FILE_NAME = "lockfile.bin"
 HOST_KEY_FILE = "host_key.pem"
 
+# Lockfiles whose signature already checked out with the host key (signature is a pure function of its bytes)
+VERIFIED_LOCKFILES_SIZE = 256
+# Successful verifications are remembered this long (seconds) and up to this many drives
+VERIFY_CACHE_TTL = 60
+VERIFY_CACHE_SIZE = 128
+
+_thread_state = threading.local()
+
+
+def _wmi_connection():
+    """WMI connection owned by the calling thread (verification workers each keep one); wmi is imported on first use."""
+    conn = getattr(_thread_state, 'wmi_conn', None)
+    if conn is None:
+        import wmi
+        conn = _thread_state.wmi_conn = wmi.WMI()
+    return conn
+
+class VerificationCache:
+    """
+    Bounded LRU of successful verifications with a TTL. Keys hold the device,
+    its registered fingerprint and signature, and the lockfile's mtime and
+    size. A hit is only consulted after the structural fingerprint was read
+    from the disk again and matched, so it can't be won with a spoofed volume
+    serial; it skips re-reading the lockfile and its ECDSA check.
+    """
+
+    def __init__(self, max_size=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> expiry (monotonic seconds)
+        self._lock = threading.Lock()
+
+    def contains(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.VERIFY_CACHE_TOTAL.inc("verification", "hit")
+                return True
+            if expires is not None:
+                del self._entries[key]
+            self.misses += 1
+            metrics.VERIFY_CACHE_TOTAL.inc("verification", "miss")
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, canonical_id=None):
+        """Drops cached results for one device, or for all devices when canonical_id is None."""
+        with self._lock:
+            if canonical_id is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == canonical_id]:
+                    del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
 class Fingerprinter:
     def __init__(self):
-        # NOTE: We no longer initialize wmi.WMI() here to ensure thread safety.
+        # NOTE: WMI connections are per thread (see _wmi_connection), never shared.
         self.host_key = self._manage_host_key()
+        # Derived once; verify() on it is safe to call from several threads
+        self.public_key = self.host_key.public_key() if self.host_key else None
+        self._verified_lockfiles = OrderedDict()  # lockfile content -> True, bounded LRU
+        self._verified_lock = threading.Lock()
+        self.verify_cache = VerificationCache()
 
     def _manage_host_key(self):
         key_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "config", HOST_KEY_FILE)
         try:
             if os.path.exists(key_path):
-                log.info(f"Loading existing host key from {key_path}")
+                log.info("Loading existing host key from %s", key_path)
                 with open(key_path, "rb") as f:
                     private_key = serialization.load_pem_private_key(f.read(), password=None)
             else:
-                log.info(f"No host key found. Generating and saving a new one at {key_path}")
+                log.info("No host key found. Generating and saving a new one at %s", key_path)
                 private_key = ec.generate_private_key(ec.SECP256R1())
                 with open(key_path, "wb") as f:
                     f.write(private_key.private_bytes(
@@ -34,13 +117,12 @@ class Fingerprinter:
                     ))
             return private_key
         except Exception as e:
-            log.error(f"Failed to load or generate host key: {e}")
+            log.error("Failed to load or generate host key: %s", e)
             return None
 
     def _get_physical_disk(self, drive_letter):
         try:
-            # Create a fresh WMI connection for the current thread
-            wmi_conn = wmi.WMI()
+            wmi_conn = _wmi_connection()
             query = f"ASSOCIATORS OF {{Win32_LogicalDisk.DeviceID='{drive_letter}'}} WHERE AssocClass = Win32_LogicalDiskToPartition"
             partitions = wmi_conn.query(query)
             if partitions:
@@ -49,22 +131,43 @@ class Fingerprinter:
                 if physical_disks:
                     return physical_disks[0]
         except Exception as e:
-            log.error(f"Failed to get physical disk for {drive_letter}: {e}")
+            log.error("Failed to get physical disk for %s: %s", drive_letter, e)
         return None
 
-    def calculate_structural_fingerprint(self, drive_letter):
+    def calculate_structural_fingerprint(self, drive_letter, legacy=False):
+        """
+        Hashes the partition structures (MBR, GPT header and entry array) read
+        straight from the physical disk behind drive_letter. Falls back to the
+        older WMI Model/Size/Signature hash when the raw disk can't be read, or
+        when legacy=True (to check fingerprints registered before raw reads).
+        """
+        if not legacy:
+            device_path = raw_device_path(drive_letter)
+            if device_path:
+                try:
+                    structure = read_structure(device_path)
+                    log.info("Calculated structural fingerprint from %s (%s, %s partitions, %s bytes read): %s...",
+                             device_path, structure.scheme, structure.partitions, structure.bytes_read, structure.fingerprint[:21])
+                    return structure.fingerprint
+                except OSError as e:
+                    log.warning("Could not read partition structures of %s, using WMI properties: %s", device_path, e)
+            else:
+                log.warning("Could not resolve the physical disk for %s, using WMI properties.", drive_letter)
+        return self._legacy_fingerprint(drive_letter)
+
+    def _legacy_fingerprint(self, drive_letter):
         disk = self._get_physical_disk(drive_letter)
         if not disk:
-            log.error(f"Cannot calculate fingerprint: Could not find physical disk for {drive_letter}.")
+            log.error("Cannot calculate fingerprint: Could not find physical disk for %s.", drive_letter)
             return None
         try:
             source_string = f"Model:{disk.Model}-Size:{disk.Size}-Signature:{disk.Signature}"
-            log.info(f"Generating fingerprint from source: {source_string}")
+            log.info("Generating fingerprint from source: %s", source_string)
             fingerprint = hashlib.sha256(source_string.encode('utf-8')).hexdigest()
-            log.info(f"Calculated stable fingerprint: {fingerprint[:16]}...")
+            log.info("Calculated stable fingerprint: %s...", fingerprint[:16])
             return fingerprint
         except Exception as e:
-            log.error(f"Failed to get hardware properties for fingerprint: {e}")
+            log.error("Failed to get hardware properties for fingerprint: %s", e)
             return None
 
     def create_signed_lockfile(self, drive_letter):
@@ -81,44 +184,121 @@ class Fingerprinter:
             signature = self.host_key.sign(payload, ec.ECDSA(hashes.SHA256()))
             with open(lockfile_path, "w") as f:
                 f.write(f"{signature.hex()}::{payload.decode('utf-8')}")
-            log.info(f"Successfully created lockfile. Signature: {signature.hex()[:16]}...")
+            log.info("Successfully created lockfile. Signature: %s...", signature.hex()[:16])
             return signature.hex()
         except Exception as e:
-            log.error(f"Failed to create signed lockfile on {drive_letter}: {e}")
+            log.error("Failed to create signed lockfile on %s: %s", drive_letter, e)
             return None
 
-    def verify_device(self, drive_letter, expected_fingerprint, expected_signature_hex):
-        log.info(f"Performing full verification on drive {drive_letter}.")
-        current_fingerprint = self.calculate_structural_fingerprint(drive_letter)
+    def _verify_lockfile_signature(self, content, signature_hex, payload_str):
+        """ECDSA-verifies a lockfile once per distinct content; raises InvalidSignature."""
+        with self._verified_lock:
+            if content in self._verified_lockfiles:
+                self._verified_lockfiles.move_to_end(content)
+                metrics.VERIFY_CACHE_TOTAL.inc("signature", "hit")
+                return
+        metrics.VERIFY_CACHE_TOTAL.inc("signature", "miss")
+        self.public_key.verify(bytes.fromhex(signature_hex), payload_str.encode('utf-8'), ec.ECDSA(hashes.SHA256()))
+        with self._verified_lock:
+            self._verified_lockfiles[content] = True
+            while len(self._verified_lockfiles) > VERIFIED_LOCKFILES_SIZE:
+                self._verified_lockfiles.popitem(last=False)
+
+    def invalidate_verification(self, canonical_id=None):
+        """Forgets cached verification results for one device (e.g. once it is removed) or for all devices."""
+        self.verify_cache.invalidate(canonical_id)
+
+    def verify_device(self, drive_letter, expected_fingerprint, expected_signature_hex, canonical_id=None):
+        """
+        Verifies the structural fingerprint and signed lockfile of a drive.
+        Every call re-reads the fingerprint from the drive (a few sector reads).
+        When canonical_id is given and the fingerprint matches, a successful
+        verification of the same, unchanged lockfile within VERIFY_CACHE_TTL
+        is reused; otherwise the lockfile's ECDSA check is still skipped for
+        content already verified.
+        """
+        started = time.perf_counter()
+        is_valid = self._verify_device(drive_letter, expected_fingerprint, expected_signature_hex, canonical_id)
+        metrics.VERIFICATIONS_TOTAL.inc("passed" if is_valid else "failed")
+        metrics.VERIFICATION_SECONDS.observe(time.perf_counter() - started)
+        return is_valid
+
+    def _verify_device(self, drive_letter, expected_fingerprint, expected_signature_hex, canonical_id=None):
+        log.info("Performing full verification on drive %s.", drive_letter)
+        # Compute the fingerprint the same way the registered one was computed
+        legacy = not (expected_fingerprint or "").startswith(RAW_FINGERPRINT_PREFIX)
+        current_fingerprint = self.calculate_structural_fingerprint(drive_letter, legacy=legacy)
         if not current_fingerprint or current_fingerprint != expected_fingerprint:
-            log.warning(f"Verification FAILED for {drive_letter}: Structural fingerprint mismatch.")
-            log.debug(f"  Expected: {expected_fingerprint}")
-            log.debug(f"  Got:      {current_fingerprint}")
+            log.warning("Verification FAILED for %s: Structural fingerprint mismatch.", drive_letter)
+            log.debug("  Expected: %s", expected_fingerprint)
+            log.debug("  Got:      %s", current_fingerprint)
             return False
-        log.info(f"Structural fingerprint for {drive_letter} is VALID.")
+        log.info("Structural fingerprint for %s is VALID.", drive_letter)
         if not self.host_key:
             log.error("Cannot verify lockfile: Host key is not available.")
             return False
         lockfile_path = os.path.join(drive_letter, LOCK_FOLDER_NAME, LOCK_FILE_NAME)
-        if not os.path.exists(lockfile_path):
-            log.warning(f"Verification FAILED for {drive_letter}: Lockfile not found at {lockfile_path}.")
+        try:
+            lock_stat = os.stat(lockfile_path)
+        except OSError:
+            log.warning("Verification FAILED for %s: Lockfile not found at %s.", drive_letter, lockfile_path)
             return False
+        cache_key = None
+        if canonical_id:
+            cache_key = (canonical_id, drive_letter, expected_fingerprint, expected_signature_hex,
+                         lock_stat.st_mtime_ns, lock_stat.st_size)
+            if self.verify_cache.contains(cache_key):
+                log.info("Lockfile of %s unchanged since its last verification; served from cache.", drive_letter)
+                return True
         try:
             with open(lockfile_path, "r") as f:
                 content = f.read()
-                signature_hex, payload_str = content.split("::", 1)
-            signature = bytes.fromhex(signature_hex)
-            payload = payload_str.encode('utf-8')
-            public_key = self.host_key.public_key()
-            public_key.verify(signature, payload, ec.ECDSA(hashes.SHA256()))
+            signature_hex, payload_str = content.split("::", 1)
+            self._verify_lockfile_signature(content, signature_hex, payload_str)
             if signature_hex != expected_signature_hex:
-                 log.warning(f"Verification FAILED for {drive_letter}: Lockfile signature does not match database record.")
+                 log.warning("Verification FAILED for %s: Lockfile signature does not match database record.", drive_letter)
                  return False
-            log.info(f"Lockfile signature for {drive_letter} is VALID.")
+            log.info("Lockfile signature for %s is VALID.", drive_letter)
+            if cache_key is not None:
+                self.verify_cache.add(cache_key)
             return True
         except InvalidSignature:
-            log.warning(f"Verification FAILED for {drive_letter}: Lockfile has an invalid signature (tampered).")
+            log.warning("Verification FAILED for %s: Lockfile has an invalid signature (tampered).", drive_letter)
             return False
         except Exception as e:
-            log.error(f"An error occurred during lockfile verification for {drive_letter}: {e}")
-            return False
\ No newline at end of file
+            log.error("An error occurred during lockfile verification for %s: %s", drive_letter, e)
+            return False
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import tempfile
+    from benchmarks import fakes
+    fakes.install().add_usb_devices(4)
+
+    fingerprinter = Fingerprinter()
+    drive = os.path.join(tempfile.mkdtemp(), "drive")
+    os.makedirs(os.path.join(drive, LOCK_FOLDER_NAME))  # Pre-created, so no attrib call
+    fingerprint = fingerprinter.calculate_structural_fingerprint(drive)
+    signature = fingerprinter.create_signed_lockfile(drive)
+    canonical_id = "VID_0781&PID_5591&SN_SELFCHECK"
+
+    print("\n--- An unchanged drive is served from the verification cache ---")
+    assert fingerprinter.verify_device(drive, fingerprint, signature, canonical_id=canonical_id)
+    assert fingerprinter.verify_device(drive, fingerprint, signature, canonical_id=canonical_id)
+    print(fingerprinter.verify_cache.stats())
+    assert fingerprinter.verify_cache.stats()["hits"] == 1
+    assert metrics.VERIFY_CACHE_TOTAL.value("verification", "hit") == 1
+
+    print("\n--- A changed fingerprint or lockfile is verified again ---")
+    assert not fingerprinter.verify_device(drive, "raw1:" + "0" * 64, signature, canonical_id=canonical_id)
+    with open(os.path.join(drive, LOCK_FOLDER_NAME, LOCK_FILE_NAME), "a") as f:
+        f.write("tampered")
+    assert not fingerprinter.verify_device(drive, fingerprint, signature, canonical_id=canonical_id)
+    assert fingerprinter.verify_cache.stats()["hits"] == 1
+
+    print("\n--- Removal drops the device's cached results ---")
+    fingerprinter.verify_cache.add((canonical_id, drive, fingerprint, signature, 0, 0))
+    fingerprinter.invalidate_verification(canonical_id)
+    assert fingerprinter.verify_cache.stats()["size"] == 0
+
+    print("\nFingerprinter tests complete.")
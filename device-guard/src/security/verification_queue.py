@@ -0,0 +1,220 @@
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.logger import log
+from src.utils import metrics
+
+# Worker threads verifying drives; enough for a hub's worth of sticks at once
+VERIFICATION_WORKERS = 16
+# Seconds a drive's verification may take before it counts as failed
+VERIFICATION_TIMEOUT = 20
+
+VERIFY_PASSED = "passed"
+VERIFY_FAILED = "failed"
+VERIFY_TIMED_OUT = "timeout"
+VERIFY_ERROR = "error"
+
+
+class _Job:
+    __slots__ = ("device", "details", "callback", "queued_at", "started_at", "outcome")
+
+    def __init__(self, device, details, callback):
+        self.device = device
+        self.details = details
+        self.callback = callback
+        self.queued_at = time.monotonic()
+        self.started_at = None  # Set when a worker picks the job up
+        self.outcome = None
+
+
+class VerificationQueue:
+    """
+    Verifies drives on a worker pool so that a hub full of sticks is checked in
+    about the time of the slowest one, and detection never waits on it.
+
+    `verifier(device, details)` does the fingerprint read and signature check
+    and returns True/False. A drive (keyed by canonical_id) has at most one job
+    in flight. Each job ends with exactly one outcome (VERIFY_*), reported to
+    its callback and to `on_result` as (device, details, outcome): a job still
+    running `timeout` seconds after a worker picked it up is reported as
+    VERIFY_TIMED_OUT by a watchdog, and its late result is dropped. Time spent
+    waiting for a free worker does not count against the timeout. Python can't stop the worker
+    itself, so a hung read keeps its thread until it returns.
+    """
+
+    def __init__(self, verifier, max_workers=VERIFICATION_WORKERS, timeout=VERIFICATION_TIMEOUT,
+                 initializer=None, on_result=None):
+        self.verifier = verifier
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.initializer = initializer
+        self.on_result = on_result
+        self._pool = None
+        self._in_flight = {}  # key -> _Job
+        self._deadlines = []  # heap of (deadline, seq, key, job)
+        self._seq = itertools.count()
+        self._lock = threading.Condition()
+        self._watchdog = None
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="verification",
+                    initializer=self.initializer
+                )
+                self._watchdog = threading.Thread(target=self._watch, name="verification-watchdog", daemon=True)
+                self._watchdog.start()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._lock.notify_all()
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    @staticmethod
+    def device_key(device):
+        return device.canonical_id
+
+    def in_flight(self, device):
+        with self._lock:
+            return self.device_key(device) in self._in_flight
+
+    def submit(self, device, details, callback=None):
+        """Queues a drive's verification. Returns False if it already has one in flight."""
+        self.start()
+        key = self.device_key(device)
+        job = _Job(device, details, callback)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight[key] = job
+        try:
+            self._pool.submit(self._run, key, job)
+        except Exception:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            raise
+        return True
+
+    def _run(self, key, job):
+        with self._lock:
+            if job.outcome is not None:
+                return
+            job.started_at = time.monotonic()
+            heapq.heappush(self._deadlines, (job.started_at + self.timeout, next(self._seq), key, job))
+            self._lock.notify_all()
+        try:
+            outcome = VERIFY_PASSED if self.verifier(job.device, job.details) else VERIFY_FAILED
+        except Exception as e:
+            metrics.ERRORS_TOTAL.inc("verification")
+            log.error("Verification of %s failed with an error: %s", job.device.friendly_name, e)
+            outcome = VERIFY_ERROR
+        self._complete(key, job, outcome)
+
+    def _watch(self):
+        """Times out jobs whose deadline passed (one thread for all drives)."""
+        with self._lock:
+            while self._pool is not None:
+                while self._deadlines and self._deadlines[0][3].outcome is not None:
+                    heapq.heappop(self._deadlines)  # Finished in time
+                if not self._deadlines:
+                    self._lock.wait()
+                    continue
+                deadline, _, key, job = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+                self._lock.release()
+                try:
+                    log.warning("Verification of %s timed out after %ss.", job.device.friendly_name, self.timeout)
+                    metrics.VERIFICATIONS_TOTAL.inc(VERIFY_TIMED_OUT)
+                    self._complete(key, job, VERIFY_TIMED_OUT)
+                finally:
+                    self._lock.acquire()
+
+    def _complete(self, key, job, outcome):
+        with self._lock:
+            if job.outcome is not None:
+                return  # Already timed out (or finished); the first outcome stands
+            job.outcome = outcome
+            if self._in_flight.get(key) is job:
+                del self._in_flight[key]
+            self._lock.notify_all()
+        for listener in (job.callback, self.on_result):
+            if listener is not None:
+                try:
+                    listener(job.device, job.details, outcome)
+                except Exception as e:
+                    log.error("Verification result callback failed: %s", e)
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    from src.core.device_record import DeviceRecord
+
+    delays = [0.05 * (i % 5 + 1) for i in range(16)]  # 0.05 to 0.25 s per drive
+
+    def slow_verifier(device, details):
+        time.sleep(details["delay"])
+        if details.get("raise"):
+            raise OSError("drive unreadable")
+        return details["valid"]
+
+    devices = [DeviceRecord(f"Stick {i}", "0781", "5591", f"SN{i}", f"VID_0781&PID_5591&SN_{i}", f"USBSTOR\\{i}", f"{chr(69 + i)}:")
+               for i in range(16)]
+    results = {}
+    finished = threading.Event()
+
+    def record(device, details, outcome):
+        results[device.canonical_id] = outcome
+        if len(results) == len(devices):
+            finished.set()
+
+    print("\n--- Sixteen drives verified concurrently ---")
+    queue = VerificationQueue(slow_verifier, on_result=record)
+    started = time.monotonic()
+    for i, device in enumerate(devices):
+        assert queue.submit(device, {"delay": delays[i], "valid": i != 3})
+    assert not queue.submit(devices[0], {"delay": 0, "valid": True})  # Deduplicated while in flight
+    assert finished.wait(5)
+    elapsed = time.monotonic() - started
+    print(f"{len(results)} drives in {elapsed:.2f}s (slowest {max(delays):.2f}s, sequential {sum(delays):.2f}s)")
+    assert elapsed < max(delays) * 2 and results[devices[3].canonical_id] == VERIFY_FAILED
+    assert sum(outcome == VERIFY_PASSED for outcome in results.values()) == 15
+
+    print("\n--- A hung drive times out; errors are reported ---")
+    results.clear()
+    finished.clear()
+    queue.timeout = 0.2
+    queue.submit(devices[0], {"delay": 1.0, "valid": True})
+    queue.submit(devices[1], {"delay": 0.01, "valid": True, "raise": True})
+    started = time.monotonic()
+    while len(results) < 2 and time.monotonic() - started < 2:
+        time.sleep(0.01)
+    print(results)
+    assert results[devices[0].canonical_id] == VERIFY_TIMED_OUT and results[devices[1].canonical_id] == VERIFY_ERROR
+    assert not queue.in_flight(devices[0])
+    time.sleep(1.0)  # The hung worker's late result is dropped
+    assert results[devices[0].canonical_id] == VERIFY_TIMED_OUT
+
+    print("\n--- Waiting for a free worker does not count against the timeout ---")
+    results.clear()
+    queue.shutdown()
+    queue = VerificationQueue(slow_verifier, max_workers=1, timeout=0.3, on_result=record)
+    for device in devices[:3]:
+        queue.submit(device, {"delay": 0.2, "valid": True})
+    started = time.monotonic()
+    while len(results) < 3 and time.monotonic() - started < 2:
+        time.sleep(0.01)
+    print(results)
+    assert list(results.values()) == [VERIFY_PASSED] * 3
+
+    queue.shutdown()
+    print("\nVerification queue tests complete.")
@@ -0,0 +1,138 @@
+import time
+import threading
+from collections import deque
+
+# Delta types pushed to UI clients
+DEVICE_ADDED = "added"
+DEVICE_REMOVED = "removed"
+DEVICE_BLOCKED = "blocked"
+DEVICE_VERIFIED = "verified"
+SNAPSHOT = "snapshot"
+
+# Number of recent deltas kept for reconnecting clients (SSE Last-Event-ID / long-poll cursor)
+HISTORY_SIZE = 256
+
+
+class DeviceEventBus:
+    """
+    In-process fan-out of device deltas from the monitor to any number of
+    web clients. Deltas get increasing ids and are kept in a bounded history,
+    so every client just waits for ids past its own cursor; a client that fell
+    too far behind gets a fresh snapshot instead. The bus also folds the deltas
+    into a current device map that serves as that snapshot.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._cond = threading.Condition()
+        self._history = deque(maxlen=history_size)
+        self._devices = {}
+        # Ids continue from this bus's creation time in microseconds, so a Last-Event-ID
+        # from a previous run is always older than this run's history and gets a
+        # snapshot instead of silence (ids stay integers below 2**53 for JavaScript)
+        self._last_id = time.time_ns() // 1000
+        # True once a monitor in this process publishes; until then the snapshot is meaningless
+        self.live = False
+
+    def publish(self, kind, device):
+        """Publishes one delta for a device payload (a dict with at least canonical_id)."""
+        with self._cond:
+            self.live = True
+            canonical_id = device['canonical_id']
+            if kind == DEVICE_REMOVED:
+                self._devices.pop(canonical_id, None)
+            else:
+                self._devices[canonical_id] = dict(self._devices.get(canonical_id, {}), **device)
+            self._last_id += 1
+            self._history.append({"id": self._last_id, "type": kind, "device": device, "time": time.time()})
+            self._cond.notify_all()
+            return self._last_id
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def snapshot(self):
+        """Returns the current device map as a snapshot message."""
+        with self._cond:
+            return {
+                "id": self._last_id,
+                "type": SNAPSHOT,
+                "live": self.live,
+                "devices": list(self._devices.values()),
+                "time": time.time()
+            }
+
+    def _events_after(self, after):
+        if after > self._last_id:
+            return None  # Not an id this bus handed out (e.g. the clock went back between runs)
+        if after == self._last_id:
+            return []
+        if not self._history or after < self._history[0]['id'] - 1:
+            return None  # Cursor fell out of the history window
+        return [event for event in self._history if event['id'] > after]
+
+    def wait(self, after, timeout=None):
+        """
+        Blocks until deltas newer than `after` exist or `timeout` expires.
+        Returns the list of deltas (possibly empty on timeout), or a one-item
+        list holding a snapshot if the cursor is too old to replay.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events = self._events_after(after)
+                if events is None:
+                    return [self.snapshot()]
+                if events:
+                    return events
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+
+# Shared bus: the monitor publishes, the Flask stream endpoints subscribe
+bus = DeviceEventBus()
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    test_bus = DeviceEventBus(history_size=4)
+    device = {"canonical_id": "VID_0781&PID_5591&SN_TEST", "friendly_name": "Test Stick"}
+
+    print("\n--- A waiting client wakes on publish ---")
+    received = []
+    cursor = test_bus.last_id
+    waiter = threading.Thread(target=lambda: received.extend(test_bus.wait(cursor, timeout=2)))
+    waiter.start()
+    time.sleep(0.05)
+    test_bus.publish(DEVICE_ADDED, device)
+    waiter.join()
+    print(received)
+    assert received[0]['type'] == DEVICE_ADDED and received[0]['id'] == test_bus.last_id
+
+    print("\n--- Snapshot folds deltas ---")
+    test_bus.publish(DEVICE_BLOCKED, dict(device, is_registered=False))
+    snapshot = test_bus.snapshot()
+    assert snapshot['live'] and snapshot['devices'][0]['is_registered'] is False
+    test_bus.publish(DEVICE_REMOVED, device)
+    assert test_bus.snapshot()['devices'] == []
+
+    print("\n--- Stale cursors get a snapshot ---")
+    for _ in range(5):
+        test_bus.publish(DEVICE_ADDED, device)
+    assert test_bus.wait(cursor, timeout=0)[0]['type'] == SNAPSHOT
+    assert test_bus.wait(test_bus.last_id, timeout=0.01) == []
+
+    print("\n--- Cursors from a previous run get a snapshot ---")
+    previous_run = DeviceEventBus()
+    for _ in range(3):
+        previous_run.publish(DEVICE_ADDED, device)
+    time.sleep(0.001)
+    restarted = DeviceEventBus()
+    assert restarted.wait(previous_run.last_id, timeout=0)[0]['type'] == SNAPSHOT
+    assert restarted.wait(restarted.last_id + 10, timeout=0)[0]['type'] == SNAPSHOT
+    restarted.publish(DEVICE_ADDED, device)
+    assert restarted.wait(previous_run.last_id, timeout=0)[0]['type'] == SNAPSHOT
+
+    print("\nEvent bus tests complete.")
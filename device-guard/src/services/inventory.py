@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from operator import attrgetter
+from collections import namedtuple
+from src.core.detector import get_separated_usb_devices
+from src.utils.logger import log
+
+# How old a snapshot may get before an API read triggers its own scan. Snapshots
+# published by the monitor stay valid longer: it rescans on every device event
+# and at least every RESCAN_INTERVAL seconds.
+API_MAX_AGE = 2.0
+MONITOR_MAX_AGE = 120.0
+
+SOURCE_API = "api"
+SOURCE_MONITOR = "monitor"
+
+# Immutable result of one USB scan. `version` only changes when the devices do.
+InventorySnapshot = namedtuple("InventorySnapshot", ["version", "storage_devices", "other_devices", "taken_at", "source"])
+
+
+def _freeze(devices):
+    # DeviceRecords are immutable, so the snapshot can hold the scanner's own objects
+    return tuple(sorted(devices, key=attrgetter('canonical_id')))
+
+
+class _Flight:
+    """One in-progress scan that concurrent callers wait on instead of starting their own."""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InventoryService:
+    """
+    Owns the latest USB scan for the whole process. The monitor thread and the
+    Flask routes read the same snapshot; when it is too old, the first caller
+    scans and everyone arriving meanwhile shares that scan (single-flight).
+    Snapshots hold tuples of immutable DeviceRecords.
+    """
+
+    def __init__(self, scan=get_separated_usb_devices):
+        self._scan = scan
+        self._lock = threading.Lock()
+        self._flight = None
+        self._snapshot = None
+        self._version = 0
+        self.scans = 0
+        # Distinguishes this process's versions from a previous run's in ETags
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+
+    def current(self):
+        """Returns the latest snapshot (possibly stale), or None before the first scan."""
+        return self._snapshot
+
+    def get(self, max_age=None):
+        """
+        Returns a snapshot no older than max_age seconds, scanning only if needed.
+        If that scan fails, the last snapshot is returned (raises if there is none).
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if max_age is None:
+                max_age = MONITOR_MAX_AGE if snapshot.source == SOURCE_MONITOR else API_MAX_AGE
+            if time.monotonic() - snapshot.taken_at <= max_age:
+                return snapshot
+        try:
+            return self.refresh(SOURCE_API)
+        except Exception:
+            if snapshot is None:
+                raise
+            return snapshot
+
+    def refresh(self, source=SOURCE_MONITOR, full=False):
+        """
+        Scans now (or joins a scan already running) and returns the resulting snapshot.
+        A full scan (the scanner drops its cached state) waits for a running scan and then runs its own.
+        """
+        while True:
+            with self._lock:
+                flight = self._flight
+                leader = flight is None
+                if leader:
+                    flight = self._flight = _Flight()
+            if leader:
+                break
+            flight.done.wait()
+            if full:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            storage_devices, other_devices = self._scan(full=True) if full else self._scan()
+            flight.result = self._publish(storage_devices, other_devices, source)
+            return flight.result
+        except Exception as e:
+            log.error("Inventory scan failed: %s", e)
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+
+    def _publish(self, storage_devices, other_devices, source):
+        storage_devices, other_devices = _freeze(storage_devices), _freeze(other_devices)
+        with self._lock:
+            self.scans += 1
+            previous = self._snapshot
+            if previous is None or (storage_devices, other_devices) != (previous.storage_devices, previous.other_devices):
+                self._version += 1
+            self._snapshot = InventorySnapshot(self._version, storage_devices, other_devices, time.monotonic(), source)
+            return self._snapshot
+
+
+# Shared by the monitor and the web API of this process
+inventory = InventoryService()
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    from src.core.device_record import DeviceRecord
+
+    calls = []
+
+    def slow_scan():
+        calls.append(1)
+        time.sleep(0.1)
+        return [DeviceRecord("Stick", "0781", "5591", "A", "VID_0781&PID_5591&SN_A", "USB\\VID_0781&PID_5591\\A", "E:")], []
+
+    service = InventoryService(scan=slow_scan)
+
+    print("\n--- Concurrent readers share one scan ---")
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(service.get())) for _ in range(20)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    print(f"{len(results)} readers, {len(calls)} scan(s)")
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+
+    print("\n--- Fresh snapshots are memory reads ---")
+    assert service.get() is results[0] and len(calls) == 1
+
+    print("\n--- Version changes only with the devices ---")
+    version = service.refresh().version
+    assert version == results[0].version and len(calls) == 2
+    service._scan = lambda: ([], [])
+    assert service.refresh().version == version + 1
+
+    print("\n--- A failed scan keeps the last snapshot instead of an empty one ---")
+    def failing_scan():
+        raise RuntimeError("WMI unavailable")
+    last = service.current()
+    service._scan = failing_scan
+    assert service.get(max_age=0) is last
+    try:
+        service.refresh()
+        raise AssertionError("the scan error was swallowed")
+    except RuntimeError:
+        pass
+    assert service.current() is last
+
+    print("\n--- A full scan is passed through to the scanner ---")
+    service._scan = lambda full=False: calls.append(full) or ([], [])
+    service.refresh(full=True)
+    assert calls[-1] is True
+
+    print("\nInventory service tests complete.")
@@ -0,0 +1,117 @@
+import random
+
+# Seconds between scans right after a device change, while more are likely
+# (a hub or composite device arrives as several entities over a few seconds)
+ACTIVE_INTERVAL = 0.5
+# Fast scans that follow a change before the scheduler relaxes again
+ACTIVE_SCANS = 6
+# Seconds between scans in normal operation
+BASE_INTERVAL = 2.0
+# Quiet scans at BASE_INTERVAL before backing off
+QUIET_SCANS = 15
+# Upper bound of the quiet-period backoff; an API "scan now" request bypasses it
+MAX_INTERVAL = 10.0
+# First and largest delays after a failed scan
+ERROR_INTERVAL = 5.0
+MAX_ERROR_INTERVAL = 60.0
+# Random spread applied to every delay (0.1 = +/-10%) so hosts don't scan in lockstep
+JITTER = 0.1
+
+
+class PollScheduler:
+    """
+    Decides how long the fallback polling loop sleeps before its next scan.
+
+    After a change it scans every ACTIVE_INTERVAL seconds for ACTIVE_SCANS
+    scans, then at BASE_INTERVAL. Once QUIET_SCANS scans in a row found
+    nothing, the interval doubles per scan up to MAX_INTERVAL. Failed scans
+    back off exponentially from ERROR_INTERVAL. Each delay gets +/-JITTER.
+    """
+
+    def __init__(self, active_interval=ACTIVE_INTERVAL, base_interval=BASE_INTERVAL, max_interval=MAX_INTERVAL,
+                 error_interval=ERROR_INTERVAL, max_error_interval=MAX_ERROR_INTERVAL, jitter=JITTER,
+                 active_scans=ACTIVE_SCANS, quiet_scans=QUIET_SCANS, rng=None):
+        self.active_interval = active_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.error_interval = error_interval
+        self.max_error_interval = max_error_interval
+        self.jitter = jitter
+        self.active_scans = active_scans
+        self.quiet_scans = quiet_scans
+        self._random = rng or random.Random()
+        self._active_left = 0
+        self._quiet = 0
+        self._failures = 0
+        self.interval = base_interval
+
+    def next_delay(self, changed):
+        """Records a completed scan (changed: whether devices came or went) and returns the delay."""
+        self._failures = 0
+        if changed:
+            self._active_left = self.active_scans
+            self._quiet = 0
+        if self._active_left:
+            self._active_left -= 1
+            self.interval = self.active_interval
+        else:
+            self._quiet += 1
+            if self._quiet <= self.quiet_scans:
+                self.interval = self.base_interval
+            else:
+                self.interval = min(max(self.interval, self.base_interval) * 2, self.max_interval)
+        return self._jittered(self.interval)
+
+    def failure_delay(self):
+        """Records a failed scan and returns the (exponentially growing) delay before retrying."""
+        self._failures += 1
+        self.interval = min(self.error_interval * 2 ** (self._failures - 1), self.max_error_interval)
+        return self._jittered(self.interval)
+
+    def reset(self):
+        """Treats the next scan as following activity (e.g. after an explicit scan request)."""
+        self._active_left = self.active_scans
+        self._quiet = 0
+
+    def _jittered(self, delay):
+        if not self.jitter:
+            return delay
+        return delay * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    scheduler = PollScheduler(jitter=0, rng=random.Random(1))
+
+    print("\n--- Quiet host backs off ---")
+    delays = [scheduler.next_delay(False) for _ in range(QUIET_SCANS + 5)]
+    print(delays)
+    assert delays[:QUIET_SCANS] == [BASE_INTERVAL] * QUIET_SCANS
+    assert delays[QUIET_SCANS:] == [4.0, 8.0, MAX_INTERVAL, MAX_INTERVAL, MAX_INTERVAL]
+
+    print("\n--- A change switches to fast scans, then relaxes ---")
+    delays = [scheduler.next_delay(True)] + [scheduler.next_delay(False) for _ in range(ACTIVE_SCANS)]
+    print(delays)
+    assert delays[:ACTIVE_SCANS] == [ACTIVE_INTERVAL] * ACTIVE_SCANS and delays[-1] == BASE_INTERVAL
+
+    print("\n--- Failures back off exponentially, success resets ---")
+    delays = [scheduler.failure_delay() for _ in range(6)]
+    print(delays)
+    assert delays == [5.0, 10.0, 20.0, 40.0, 60.0, 60.0]
+    assert scheduler.next_delay(False) == BASE_INTERVAL
+
+    print("\n--- Jitter stays within bounds ---")
+    jittered = PollScheduler(rng=random.Random(1))
+    delays = [jittered.next_delay(False) for _ in range(QUIET_SCANS)]
+    assert all(BASE_INTERVAL * 0.9 <= d <= BASE_INTERVAL * 1.1 for d in delays) and len(set(delays)) > 1
+
+    print("\n--- Wakeups per idle hour ---")
+    idle = PollScheduler(jitter=0)
+    elapsed, wakeups = 0.0, 0
+    while elapsed < 3600:
+        elapsed += idle.next_delay(False)
+        wakeups += 1
+    print(f"adaptive: {wakeups}, fixed {BASE_INTERVAL:g}s: {int(3600 / BASE_INTERVAL)}")
+    assert wakeups < 3600 / BASE_INTERVAL / 4
+
+    print("\nPoll scheduler tests complete.")
@@ -1,9 +1,10 @@
 import os
 import sys
 import time
+import queue
 import threading
-import wmi
-import pythoncom
+import contextlib
+import subprocess
 from datetime import datetime
 
 # Add project root to path
@@ -12,19 +13,102 @@ if APP_ROOT not in sys.path:
     sys.path.append(APP_ROOT)
 
 from src.core.db import WhitelistDB
-from src.core.detector import get_separated_usb_devices
+from src.core.detector import get_pnp_entity
+from src.core.enforcer import EnforcementQueue
+from src.core import event_store
+from src.core.event_store import EventStore
+from src.core.events import DEVICE_ARRIVAL, DEVICE_REMOVAL, SOURCE_FAILED, create_default_event_source
+from src.services import event_bus
+from src.services import inventory as inventory_service
+from src.services.poll_scheduler import PollScheduler
 from src.security.fingerprinter import Fingerprinter
+from src.security.content_integrity import ContentCheck, ContentScheduler, MerkleTree
+from src.security.disk_structure import raw_volume_path
+from src.security.verification_queue import VerificationQueue, VERIFY_PASSED
 from src.utils.logger import log
+from src.utils import metrics
+
+# Seconds between full rescans when an event source is live (safety net only)
+RESCAN_INTERVAL = 60
+# Enforcement actions applied to unauthorized devices, in order
+STORAGE_BLOCK_ACTIONS = ("hide_drive", "eject_drive", "disable_device")
+PERIPHERAL_BLOCK_ACTIONS = ("disable_device",)
+# Explorer policy key whose NoDrives bitmask (bit 0 = A:) hides drive letters
+EXPLORER_POLICY_KEY = r"Software\Microsoft\Windows\CurrentVersion\Policies\Explorer"
+
+
+def _com_initialize():
+    """Initializes COM for WMI on the calling thread; pythoncom is imported here, as it only exists on Windows."""
+    try:
+        import pythoncom
+    except ImportError:
+        return False  # Linux: the sysfs/udev backends don't use COM
+    pythoncom.CoInitialize()
+    return True
+
+
+@contextlib.contextmanager
+def _com_apartment():
+    """COM for the duration of a long-running loop on this thread (a no-op without pythoncom)."""
+    initialized = _com_initialize()
+    try:
+        yield
+    finally:
+        if initialized:
+            import pythoncom
+            pythoncom.CoUninitialize()
 
 class USBGuardService:
     """Background service that monitors USB devices and blocks unauthorized ones"""
     
-    def __init__(self):
-        self.db = WhitelistDB()
-        self.fingerprinter = Fingerprinter()
+    def __init__(self, event_source=None, rescan_interval=RESCAN_INTERVAL, bus=None, inventory=None,
+                 db=None, events=None, fingerprinter=None, content_scheduler=None):
+        self.db = db if db is not None else WhitelistDB()
+        self.fingerprinter = fingerprinter if fingerprinter is not None else Fingerprinter()
+        self.events = events if events is not None else EventStore()
+        # Background, budgeted content checks of drives registered with a content tree
+        self.content = content_scheduler if content_scheduler is not None else ContentScheduler()
+        # Live deltas for the web UI (Server-Sent Events / long-poll)
+        self.bus = bus if bus is not None else event_bus.bus
+        # Scans are published as snapshots that the web API serves without rescanning
+        self.inventory = inventory if inventory is not None else inventory_service.inventory
         self.running = False
         self.monitor_thread = None
         self.last_known_devices = set()
+        # canonical_id -> drive letter last seen, so a drive mounted after its first scan is still verified
+        self.last_known_letters = {}
+        self.event_source = event_source if event_source is not None else create_default_event_source()
+        self.rescan_interval = rescan_interval
+        self._events = queue.Queue()
+        # Paces the fallback polling loop when there is no event source
+        self.scheduler = PollScheduler()
+        # Milliseconds from the last event's arrival to the service's decision on it
+        self.last_decision_latency_ms = None
+        # Devices whose arrival-to-block latency was recorded (only the first block after arrival counts)
+        self._block_timed = set()
+        # canonical_id -> last enforcement results recorded in the event store; an attached
+        # device is re-blocked on every scan, but only a changed outcome is worth a row
+        self._enforcement_outcomes = {}
+        # Blocking runs off the monitor thread; workers need COM for WMI
+        self.enforcement = EnforcementQueue(
+            {
+                "hide_drive": lambda device, timeout: self._hide_drive(device.drive_letter, timeout),
+                "eject_drive": lambda device, timeout: self._eject_drive(device.drive_letter, timeout),
+                "disable_device": lambda device, timeout: self._disable_wmi_device(device, timeout),
+            },
+            initializer=_com_initialize,
+            on_result=self._on_enforcement_result
+        )
+        # Drives are verified concurrently, off the monitor thread. Until then they are
+        # quarantined: hidden from Explorer, and shown again only if verification passes
+        self.quarantine = {}  # canonical_id -> DeviceRecord awaiting verification
+        self._quarantine_lock = threading.Lock()
+        self._no_drives_lock = threading.Lock()  # NoDrives is read-modify-written from several threads
+        self.verification = VerificationQueue(
+            self._run_verification,
+            initializer=_com_initialize,
+            on_result=self._on_verification_result
+        )
         
     def start(self):
         """Start the USB monitoring service"""
@@ -33,135 +117,339 @@ class USBGuardService:
             return
             
         self.running = True
+        self.enforcement.start()
         self.monitor_thread = threading.Thread(target=self._monitor_devices, daemon=True)
         self.monitor_thread.start()
         log.info("USB Guard Service started - monitoring USB devices")
         
+    def request_scan(self):
+        """Asks the monitor thread to rescan right away; False if the service isn't running"""
+        if not self.running:
+            return False
+        self._events.put(None)
+        return True
+        
     def stop(self):
         """Stop the USB monitoring service"""
         self.running = False
+        self._events.put(None)  # Wake the event loop
         if self.monitor_thread:
             self.monitor_thread.join(timeout=5)
+        self.enforcement.shutdown(wait=False)
+        self.verification.shutdown(wait=False)
+        self.content.stop()
         log.info("USB Guard Service stopped")
         
     def _monitor_devices(self):
-        """Main monitoring loop"""
-        log.info("Starting USB device monitoring loop")
-        
-        while self.running:
+        """Main monitoring loop: event driven when possible, polling otherwise (or once the source gives up)"""
+        if self.event_source is not None and self.event_source.start(self._events.put):
             try:
-                pythoncom.CoInitialize()  # Initialize COM for WMI
-                self._check_device_changes()
-                pythoncom.CoUninitialize()
-                time.sleep(2)  # Check every 2 seconds
-                
-            except Exception as e:
-                log.error(f"Error in monitoring loop: {e}")
-                time.sleep(5)  # Wait longer on error
+                self._process_events()
+            finally:
+                self.event_source.stop()
+        if self.running:
+            self._poll_devices()
+
+    def _process_events(self):
+        """Reacts to pushed device events, with a periodic full rescan as a safety net; returns if the source fails"""
+        log.info("Starting event-driven USB monitoring (source: %s)", self.event_source.name)
+        with _com_apartment():  # Initialize COM for WMI once for this thread
+            next_rescan = 0
+            while self.running:
+                timeout = next_rescan - time.monotonic()
+                rescan_due = timeout <= 0
+                try:
+                    event = None if rescan_due else self._events.get(timeout=timeout)
+                except queue.Empty:
+                    event, rescan_due = None, True
+                if not self.running:
+                    break
+                if event is not None and event.action == SOURCE_FAILED:
+                    log.warning("Device event source '%s' failed; falling back to polling", self.event_source.name)
+                    return
+                try:
+                    if event is None:
+                        # The periodic safety net also drops the detector's caches (drive letters)
+                        self._check_device_changes(full=rescan_due)
+                        if rescan_due:
+                            next_rescan = time.monotonic() + self.rescan_interval
+                    else:
+                        self._handle_event(event)
+                except Exception as e:
+                    metrics.ERRORS_TOTAL.inc("monitor")
+                    log.error("Error in monitoring loop: %s", e)
+
+    def _poll_devices(self):
+        """
+        Fallback polling loop for hosts without a device event source. The
+        scheduler picks each delay; request_scan() and stop() cut it short.
+        """
+        log.info("Starting adaptive USB device polling")
+        with _com_apartment():  # Once for this thread, so its WMI connection is reused across scans
+            delay = 0
+            next_full = 0
+            while self.running:
+                if delay > 0:
+                    try:
+                        self._events.get(timeout=delay)
+                        # Woken early by a scan request: someone expects a change, so scan
+                        # fast for a while, and coalesce any queued requests into this scan
+                        self.scheduler.reset()
+                        while True:
+                            self._events.get_nowait()
+                    except queue.Empty:
+                        pass
+                if not self.running:
+                    break
+                try:
+                    # Every rescan_interval, drop the detector's caches (drive letters) as a safety net
+                    full = time.monotonic() >= next_full
+                    changed = self._check_device_changes(full=full)
+                    if full and changed is not None:
+                        next_full = time.monotonic() + self.rescan_interval
+                except Exception as e:
+                    metrics.ERRORS_TOTAL.inc("monitor")
+                    log.error("Error in monitoring loop: %s", e)
+                    changed = None
+                delay = self.scheduler.failure_delay() if changed is None else self.scheduler.next_delay(changed)
                 
-    def _check_device_changes(self):
-        """Check for device changes and take action"""
+    def _check_device_changes(self, arrived_at=None, full=False):
+        """
+        Check for device changes and take action; returns whether devices came or went (None on error).
+        `arrived_at` is the time of the event that triggered the scan, if earlier than the scan itself.
+        With full=True the detector rescans without its cached state.
+        """
+        started = time.perf_counter()
         try:
-            # Get current devices
-            storage_devices, other_devices = get_separated_usb_devices()
-            all_devices = storage_devices + other_devices
+            # Get current devices (shared with any API request scanning at the same moment).
+            # A failed scan raises, so it is never diffed into spurious disconnects
+            snapshot = self.inventory.refresh(full=full)
+            all_devices = snapshot.storage_devices + snapshot.other_devices
             
             current_device_ids = set()
             unauthorized_devices = []
             
+            # Resolve every detected device against the whitelist in one pass
+            registered = self.db.get_many_device_details([device.canonical_id for device in all_devices])
+            
             for device in all_devices:
-                device_id = device['canonical_id']
+                device_id = device.canonical_id
                 current_device_ids.add(device_id)
                 
-                # Check if device is registered
-                is_registered = self.db.get_device_details(device_id) is not None
-                
-                if not is_registered:
+                details = registered.get(device_id)
+                is_new = device_id not in self.last_known_devices
+                if is_new and arrived_at is not None and (device.seen_at is None or arrived_at < device.seen_at):
+                    device = device.first_seen(arrived_at)
+                self._evaluate_device(device, is_new, details)
+                if details is None:
                     unauthorized_devices.append(device)
-                    
-                    # Block the device if it's storage
-                    if device.get('drive_letter'):
-                        self._block_storage_device(device)
-                    else:
-                        self._block_peripheral_device(device)
-                        
-                # Check if device is newly connected
-                if device_id not in self.last_known_devices:
-                    if is_registered:
-                        log.info(f"Authorized device connected: {device['friendly_name']} ({device_id})")
-                        
-                        # Verify fingerprint for storage devices
-                        if device.get('drive_letter'):
-                            self._verify_device_fingerprint(device)
-                    else:
-                        log.warning(f"Unauthorized device blocked: {device['friendly_name']} ({device_id})")
                         
             # Check for disconnected devices
             disconnected_devices = self.last_known_devices - current_device_ids
             for device_id in disconnected_devices:
-                log.info(f"Device disconnected: {device_id}")
+                self._on_device_disconnected(device_id)
                 
+            changed = current_device_ids != self.last_known_devices
             self.last_known_devices = current_device_ids
+            metrics.MONITOR_CYCLE_SECONDS.observe(time.perf_counter() - started)
+            return changed
             
         except Exception as e:
-            log.error(f"Error checking device changes: {e}")
+            metrics.ERRORS_TOTAL.inc("monitor")
+            log.error("Error checking device changes: %s", e)
+            return None
+            
+    def _evaluate_device(self, device, is_new, details):
+        """Blocks or verifies a single connected device; `details` is its whitelist entry or None"""
+        device_id = device.canonical_id
+        is_registered = details is not None
+        gained_letter = bool(device.drive_letter) and self.last_known_letters.get(device_id) != device.drive_letter
+        if device.drive_letter:
+            self.last_known_letters[device_id] = device.drive_letter
+        
+        if not is_registered:
+            # Block the device if it's storage
+            if device.drive_letter:
+                self._block_storage_device(device)
+            else:
+                self._block_peripheral_device(device)
+                
+        # Check if device is newly connected
+        if is_new:
+            if is_registered:
+                via_rule = f", rule {details['rule_id']}" if details.get('rule_id') else ""
+                log.info("Authorized device connected: %s (%s%s)", device.friendly_name, device_id, via_rule)
+                self.events.record(event_store.DEVICE_CONNECTED, f"Authorized device connected: {device.friendly_name}",
+                                   canonical_id=device_id, details={"drive_letter": device.drive_letter})
+                self._publish(event_bus.DEVICE_ADDED, device, details)
+                
+                # Verify fingerprint for storage devices
+                if device.drive_letter:
+                    self._verify_device_fingerprint(device, details)
+            else:
+                log.warning("Unauthorized device blocked: %s (%s)", device.friendly_name, device_id)
+                self.events.record(event_store.DEVICE_BLOCKED, f"Unauthorized device blocked: {device.friendly_name}", "WARNING",
+                                   canonical_id=device_id, details={"drive_letter": device.drive_letter, "device_id_wmi": device.device_id_wmi})
+                self._publish(event_bus.DEVICE_BLOCKED, device, details)
+            if device.seen_at is not None:
+                metrics.DECISION_SECONDS.observe(time.monotonic() - device.seen_at)
+        elif is_registered and gained_letter:
+            # First scanned before Windows assigned the letter (or the letter changed)
+            log.info("Authorized device mounted as %s: %s (%s)", device.drive_letter, device.friendly_name, device_id)
+            self._publish(event_bus.DEVICE_ADDED, device, details)
+            self._verify_device_fingerprint(device, details)
+        
+    def _on_device_disconnected(self, device_id):
+        """Records a device that is no longer present"""
+        log.info("Device disconnected: %s", device_id)
+        self.content.cancel(device_id)
+        self.fingerprinter.invalidate_verification(device_id)
+        self.last_known_letters.pop(device_id, None)
+        self._block_timed.discard(device_id)
+        self._enforcement_outcomes.pop(device_id, None)
+        with self._quarantine_lock:
+            self.quarantine.pop(device_id, None)
+        self.events.record(event_store.DEVICE_DISCONNECTED, "Device disconnected", canonical_id=device_id)
+        self.bus.publish(event_bus.DEVICE_REMOVED, {"canonical_id": device_id})
+        
+    def _publish(self, kind, device, details, **extra):
+        """Pushes a device delta to UI clients, shaped like an /api/usb_devices entry"""
+        try:
+            self.bus.publish(kind, device.to_dict(is_registered=details is not None,
+                                                  is_fingerprinted=bool(details and details.get('structural_fingerprint')),
+                                                  **extra))
+        except Exception as e:
+            metrics.ERRORS_TOTAL.inc("events")
+            log.error("Error publishing device event: %s", e)
+            
+
+    def _handle_event(self, event):
+        """Applies a single arrival/removal event pushed by the event source"""
+        device = event.device
+        if device is None:
+            # The source only knows that something changed; a scan resolves what.
+            # One scan covers every event queued behind this one, e.g. the burst
+            # of USB, USBSTOR and disk entities created by a single stick.
+            self._check_device_changes(self._drain_pending_events(event.timestamp))
+        elif event.action == DEVICE_ARRIVAL:
+            if device.seen_at is None:
+                device = device.first_seen(event.timestamp)
+            device_id = device.canonical_id
+            is_new = device_id not in self.last_known_devices
+            self.last_known_devices.add(device_id)
+            self._evaluate_device(device, is_new, self.db.get_device_details(device_id))
+        elif event.action == DEVICE_REMOVAL:
+            device_id = device.canonical_id
+            if device_id in self.last_known_devices:
+                self.last_known_devices.discard(device_id)
+                self._on_device_disconnected(device_id)
+                
+        self.last_decision_latency_ms = (time.monotonic() - event.timestamp) * 1000
+        log.debug("Handled %s event in %.2f ms", event.action, self.last_decision_latency_ms)
+            
+    def _drain_pending_events(self, earliest):
+        """Discards queued events that a full scan is about to supersede; returns the earliest event time"""
+        try:
+            while True:
+                event = self._events.get_nowait()
+                if event is None:
+                    self._events.put(None)  # Keep the stop signal
+                    break
+                earliest = min(earliest, event.timestamp)
+        except queue.Empty:
+            pass
+        return earliest
             
     def _block_storage_device(self, device):
-        """Block a USB storage device"""
+        """Queue blocking of a USB storage device: hide, eject, then disable via WMI"""
         try:
-            drive_letter = device.get('drive_letter')
+            drive_letter = device.drive_letter
             if not drive_letter:
                 return
                 
-            log.warning(f"Blocking unauthorized storage device: {device['friendly_name']} ({drive_letter})")
-            
-            # Method 1: Hide the drive
-            self._hide_drive(drive_letter)
-            
-            # Method 2: Eject the drive
-            self._eject_drive(drive_letter)
-            
-            # Method 3: Disable the device via WMI
-            self._disable_wmi_device(device)
+            if self.enforcement.submit(device, STORAGE_BLOCK_ACTIONS):
+                metrics.BLOCKS_TOTAL.inc("storage")
+                log.warning("Blocking unauthorized storage device: %s (%s)", device.friendly_name, drive_letter)
             
         except Exception as e:
-            log.error(f"Error blocking storage device: {e}")
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error blocking storage device: %s", e)
             
     def _block_peripheral_device(self, device):
-        """Block a USB peripheral device"""
+        """Queue blocking of a USB peripheral device via WMI"""
         try:
-            log.warning(f"Blocking unauthorized peripheral device: {device['friendly_name']}")
-            
-            # Disable the device via WMI
-            self._disable_wmi_device(device)
+            if self.enforcement.submit(device, PERIPHERAL_BLOCK_ACTIONS):
+                metrics.BLOCKS_TOTAL.inc("peripheral")
+                log.warning("Blocking unauthorized peripheral device: %s", device.friendly_name)
             
         except Exception as e:
-            log.error(f"Error blocking peripheral device: {e}")
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error blocking peripheral device: %s", e)
+            
+    def _on_enforcement_result(self, device, results):
+        """Logs the outcome of a finished enforcement job"""
+        results = dict(results)  # Formatted later by the log listener; don't share the job's dict
+        if device.seen_at is not None and device.canonical_id not in self._block_timed:
+            self._block_timed.add(device.canonical_id)
+            metrics.BLOCK_SECONDS.observe(time.monotonic() - device.seen_at)
+        if self._enforcement_outcomes.get(device.canonical_id) == results:
+            log.debug("Enforcement for %s unchanged: %s", device.friendly_name, results)
+            return
+        self._enforcement_outcomes[device.canonical_id] = results
+        failed = [action for action, result in results.items() if result is not True]
+        if failed:
+            log.warning("Enforcement incomplete for %s: %s", device.friendly_name, results)
+            self.events.record(event_store.ENFORCEMENT_INCOMPLETE, f"Enforcement incomplete for {device.friendly_name}", "WARNING",
+                               canonical_id=device.canonical_id, details=results)
+        else:
+            log.info("Enforcement complete for %s: %s", device.friendly_name, ", ".join(results))
+            self.events.record(event_store.ENFORCEMENT_COMPLETED, f"Enforcement complete for {device.friendly_name}",
+                               canonical_id=device.canonical_id, details=results)
             
-    def _hide_drive(self, drive_letter):
+    def _hide_drive(self, drive_letter, timeout=None):
         """Hide a drive letter from Windows Explorer"""
         try:
-            import winreg
-            
-            # Add drive to NoDrives registry key
-            drive_num = ord(drive_letter.upper()) - ord('A')
-            no_drives_value = 1 << drive_num
+            self._set_drive_hidden(drive_letter, True, timeout)
+            log.info("Hidden drive %s from Explorer", drive_letter)
+            return True
             
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, 
-                             r"Software\Microsoft\Windows\CurrentVersion\Policies\Explorer", 
-                             0, winreg.KEY_SET_VALUE) as key:
-                winreg.SetValueEx(key, "NoDrives", 0, winreg.REG_DWORD, no_drives_value)
-                
-            # Refresh Windows Explorer
-            os.system("rundll32.exe user32.dll,UpdatePerUserSystemParameters")
+        except Exception as e:
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error hiding drive %s: %s", drive_letter, e)
+            return False
             
-            log.info(f"Hidden drive {drive_letter} from Explorer")
+    def _unhide_drive(self, drive_letter, timeout=None):
+        """Show a drive letter in Windows Explorer again"""
+        try:
+            self._set_drive_hidden(drive_letter, False, timeout)
+            log.info("Restored drive %s in Explorer", drive_letter)
+            return True
             
         except Exception as e:
-            log.error(f"Error hiding drive {drive_letter}: {e}")
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error restoring drive %s: %s", drive_letter, e)
+            return False
+            
+    def _set_drive_hidden(self, drive_letter, hidden, timeout=None):
+        """Sets or clears one drive's bit in the NoDrives policy, keeping the other drives' bits"""
+        import winreg
+        
+        drive_bit = 1 << (ord(drive_letter[0].upper()) - ord('A'))
+        with self._no_drives_lock:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, EXPLORER_POLICY_KEY, 0,
+                                winreg.KEY_READ | winreg.KEY_SET_VALUE) as key:
+                try:
+                    no_drives_value = winreg.QueryValueEx(key, "NoDrives")[0]
+                except FileNotFoundError:
+                    no_drives_value = 0
+                no_drives_value = no_drives_value | drive_bit if hidden else no_drives_value & ~drive_bit
+                winreg.SetValueEx(key, "NoDrives", 0, winreg.REG_DWORD, no_drives_value)
+                
+        # Refresh Windows Explorer
+        subprocess.run(["rundll32.exe", "user32.dll,UpdatePerUserSystemParameters"], timeout=timeout)
             
-    def _eject_drive(self, drive_letter):
-        """Eject a USB drive"""
+    def _eject_drive(self, drive_letter, timeout=None):
+        """Eject a USB drive (the enforcement queue stops waiting after `timeout`)"""
         try:
             import win32api
             import win32con
@@ -180,55 +468,131 @@ class USBGuardService:
                 # IOCTL_STORAGE_EJECT_MEDIA
                 win32api.DeviceIoControl(handle, 0x2D4808, "", 0, None, 0, None, None)
                 win32api.CloseHandle(handle)
-                log.info(f"Ejected drive {drive_letter}")
+                log.info("Ejected drive %s", drive_letter)
+                return True
+            return False
                 
         except Exception as e:
-            log.error(f"Error ejecting drive {drive_letter}: {e}")
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error ejecting drive %s: %s", drive_letter, e)
+            return False
             
-    def _disable_wmi_device(self, device):
-        """Disable device using WMI"""
+    def _disable_wmi_device(self, device, timeout=None):
+        """Disable device using WMI (the enforcement queue stops waiting after `timeout`)"""
         try:
-            c = wmi.WMI()
-            
-            # Find the device by PnP ID
-            for pnp_device in c.Win32_PnPEntity():
-                if pnp_device.DeviceID == device.get('device_id_wmi'):
-                    # Try to disable the device
-                    if pnp_device.Disable():
-                        log.info(f"Disabled WMI device: {device['friendly_name']}")
-                    else:
-                        log.warning(f"Failed to disable WMI device: {device['friendly_name']}")
-                    break
+            # Keyed lookup of the device by PnP ID on this thread's WMI connection
+            pnp_device = get_pnp_entity(device.device_id_wmi)
+            if pnp_device is None:
+                log.warning("WMI device not found: %s", device.friendly_name)
+                return False
+                
+            # Try to disable the device
+            if pnp_device.Disable():
+                log.info("Disabled WMI device: %s", device.friendly_name)
+                return True
+            log.warning("Failed to disable WMI device: %s", device.friendly_name)
+            return False
                     
         except Exception as e:
-            log.error(f"Error disabling WMI device: {e}")
+            metrics.ERRORS_TOTAL.inc("enforcement")
+            log.error("Error disabling WMI device: %s", e)
+            return False
             
-    def _verify_device_fingerprint(self, device):
-        """Verify device fingerprint for registered storage devices"""
+    def _verify_device_fingerprint(self, device, details=None):
+        """Quarantines a registered storage device and queues its verification off the monitor thread"""
         try:
-            drive_letter = device.get('drive_letter')
-            if not drive_letter:
+            if not device.drive_letter:
                 return
                 
-            details = self.db.get_device_details(device['canonical_id'])
+            if details is None:
+                details = self.db.get_device_details(device.canonical_id)
             if not details or not details.get('structural_fingerprint'):
                 return
                 
-            # Verify the device
-            is_valid = self.fingerprinter.verify_device(
-                drive_letter, 
-                details['structural_fingerprint'], 
-                details['lockfile_signature']
-            )
-            
-            if is_valid:
-                log.info(f"Device fingerprint verified: {device['friendly_name']}")
+            with self._quarantine_lock:
+                self.quarantine[device.canonical_id] = device
+            if self.verification.submit(device, details):
+                log.info("Device quarantined until verified: %s (%s)", device.friendly_name, device.drive_letter)
+                self._publish(event_bus.DEVICE_ADDED, device, details, quarantined=True)
+                
+        except Exception as e:
+            metrics.ERRORS_TOTAL.inc("verification")
+            log.error("Error queuing device verification: %s", e)
+
+    def _run_verification(self, device, details):
+        """Worker-side check of one drive: hides it (quarantine), then checks the fingerprint and signed lockfile"""
+        self._hide_drive(device.drive_letter, self.verification.timeout)  # Logged if it fails; verified anyway
+        return self.fingerprinter.verify_device(
+            device.drive_letter,
+            details['structural_fingerprint'],
+            details['lockfile_signature'],
+            canonical_id=device.canonical_id
+        )
+
+    def _on_verification_result(self, device, details, outcome):
+        """Releases or blocks a quarantined drive once its verification finished (or timed out)"""
+        try:
+            drive_letter = device.drive_letter
+            with self._quarantine_lock:
+                quarantined = self.quarantine.pop(device.canonical_id, None)
+            if quarantined is None:
+                log.info("Verification of %s finished after it was disconnected (%s)", device.friendly_name, outcome)
+                self._unhide_drive(drive_letter)  # Free the letter for the next drive
+                return
+                
+            if outcome == VERIFY_PASSED:
+                log.info("Device fingerprint verified: %s", device.friendly_name)
+                self._unhide_drive(drive_letter)
+                self.events.record(event_store.VERIFICATION_PASSED, f"Device fingerprint verified: {device.friendly_name}",
+                                   canonical_id=device.canonical_id, details={"drive_letter": drive_letter})
+                self._publish(event_bus.DEVICE_VERIFIED, device, details, is_valid=True, quarantined=False)
+                self._schedule_content_check(device, details)
             else:
-                log.warning(f"Device fingerprint INVALID - blocking: {device['friendly_name']}")
+                # Fail closed: a drive that couldn't be verified in time is treated as invalid
+                log.warning("Device fingerprint INVALID (%s) - blocking: %s", outcome, device.friendly_name)
+                self.events.record(event_store.VERIFICATION_FAILED, f"Device fingerprint INVALID - blocking: {device.friendly_name}", "WARNING",
+                                   canonical_id=device.canonical_id, details={"drive_letter": drive_letter, "outcome": outcome})
+                self._publish(event_bus.DEVICE_VERIFIED, device, details, is_valid=False, quarantined=False)
                 self._block_storage_device(device)
                 
         except Exception as e:
-            log.error(f"Error verifying device fingerprint: {e}")
+            metrics.ERRORS_TOTAL.inc("verification")
+            log.error("Error handling verification result: %s", e)
+
+    def _schedule_content_check(self, device, details):
+        """Queues a background content check if the device was registered with a content tree"""
+        blob = self.db.get_content_tree(device.canonical_id)
+        if not blob:
+            return
+        try:
+            tree = MerkleTree.from_bytes(blob)
+        except ValueError as e:
+            metrics.ERRORS_TOTAL.inc("content_integrity")
+            log.error("Stored content tree of %s is unusable: %s", device.friendly_name, e)
+            return
+        path = raw_volume_path(device.drive_letter)
+        if not path:
+            log.warning("Cannot check contents of %s: volume of %s not found", device.friendly_name, device.drive_letter)
+            return
+        log.info("Content check of %s queued (%s %s blocks)", device.friendly_name, len(tree.leaves), tree.mode)
+        self.content.submit(device.canonical_id, ContentCheck(path, tree=tree),
+                            lambda check: self._on_content_checked(device, details, check))
+
+    def _on_content_checked(self, device, details, check):
+        """Blocks a drive whose contents no longer match its registered content tree"""
+        drive_letter = device.drive_letter
+        if check.error is not None:
+            log.error("Content check of %s could not complete: %s", device.friendly_name, check.error)
+        elif check.changed:
+            log.warning("Device contents CHANGED - blocking: %s (block %s)", device.friendly_name, check.tree.blocks()[check.changed[0]])
+            self.events.record(event_store.VERIFICATION_FAILED, f"Device contents changed - blocking: {device.friendly_name}", "WARNING",
+                               canonical_id=device.canonical_id, details={"drive_letter": drive_letter, "content": True})
+            self._publish(event_bus.DEVICE_VERIFIED, device, details, is_valid=False)
+            self._block_storage_device(device)
+        else:
+            log.info("Device contents verified: %s (%s bytes read)", device.friendly_name, check.bytes_read)
+            self.events.record(event_store.VERIFICATION_PASSED, f"Device contents verified: {device.friendly_name}",
+                               canonical_id=device.canonical_id, details={"drive_letter": drive_letter, "content": True})
 
 def main():
     """Main entry point for the background service"""
@@ -247,7 +611,7 @@ def main():
         log.info("Received shutdown signal")
         service.stop()
     except Exception as e:
-        log.error(f"Service error: {e}")
+        log.error("Service error: %s", e)
         service.stop()
 
 if __name__ == "__main__":
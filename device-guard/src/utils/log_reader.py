@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+# Bytes read per backwards seek from the end of a log file
+BLOCK_SIZE = 8192
+# If more than this many bytes were appended since the last poll, re-tail
+# from EOF instead of reading all of them forward.
+FORWARD_READ_LIMIT = 256 * 1024
+
+# Regex to parse the log format: 'YYYY-MM-DD HH:MM:SS,ms - NAME - LEVEL - MESSAGE'
+LOG_LINE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - .*? - (\w+) - (.*)")
+
+
+def parse_log_line(line):
+    """Parses one application log line into a log entry dict, or None if it doesn't match."""
+    match = LOG_LINE_PATTERN.match(line)
+    if not match:
+        return None
+    timestamp_str, level, message = match.groups()
+    # Fixed-width timestamp; slicing is much cheaper than strptime
+    timestamp = datetime(
+        int(timestamp_str[0:4]), int(timestamp_str[5:7]), int(timestamp_str[8:10]),
+        int(timestamp_str[11:13]), int(timestamp_str[14:16]), int(timestamp_str[17:19]),
+        int(timestamp_str[20:23]) * 1000
+    )
+    return {
+        "time": timestamp,
+        "type": "Application",
+        "status": level,
+        "message": message.strip()
+    }
+
+
+def _tail_lines(f, end, needed, block_size=BLOCK_SIZE):
+    """
+    Returns up to `needed` complete lines (bytes, oldest first) ending at offset `end`
+    of the open binary file `f`, reading backwards in fixed-size blocks.
+    """
+    pos = end
+    chunks = []
+    newlines = 0
+    # One newline more than `needed` guarantees the oldest returned line is complete
+    while pos > 0 and newlines <= needed:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        chunk = f.read(size)
+        chunks.append(chunk)
+        newlines += chunk.count(b'\n')
+    data = b''.join(reversed(chunks))
+    lines = data.split(b'\n')
+    if lines and lines[-1] == b'':
+        lines.pop()
+    if pos > 0 and lines:
+        lines.pop(0)  # Started mid-line
+    return lines[-needed:] if needed else []
+
+
+class LogTailReader:
+    """
+    Returns the last N lines of a RotatingFileHandler log, parsed.
+
+    The first read seeks backwards from EOF and continues into the rotated
+    backups (.1, .2, ...) when the current file is too short. The read offset
+    and parsed entries are cached, so later polls only read and parse bytes
+    appended since. Truncation or rotation (a new inode) triggers a re-tail.
+    """
+
+    def __init__(self, path, backup_count=5, block_size=BLOCK_SIZE):
+        self.path = path
+        self.backup_count = backup_count
+        self.block_size = block_size
+        self._identity = None
+        self._offset = 0
+        self._entries = deque(maxlen=0)
+        self._lock = threading.Lock()
+
+    def read(self, max_lines=100):
+        """Returns parsed entries for the last max_lines lines, oldest first."""
+        with self._lock:
+            st = os.stat(self.path)
+            identity = (st.st_dev, st.st_ino)
+            if (identity != self._identity or max_lines > self._entries.maxlen
+                    or st.st_size < self._offset or st.st_size - self._offset > FORWARD_READ_LIMIT):
+                self._reload(max_lines, st.st_size, identity)
+            elif st.st_size > self._offset:
+                self._read_forward(st.st_size)
+            entries = list(self._entries)[-max_lines:]
+        return [entry for entry in entries if entry is not None]
+
+    def reset(self):
+        """Drops all cached state; the next read re-tails from EOF."""
+        with self._lock:
+            self._identity = None
+            self._offset = 0
+            self._entries = deque(maxlen=0)
+
+    def _decode(self, line):
+        return parse_log_line(line.rstrip(b'\r').decode('utf-8', 'replace'))
+
+    def _reload(self, max_lines, size, identity):
+        with open(self.path, 'rb') as f:
+            # Only complete lines count; a trailing partial line is read on the next poll
+            f.seek(max(0, size - self.block_size))
+            tail = f.read()
+            newline = tail.rfind(b'\n')
+            end = size - len(tail) + newline + 1 if newline >= 0 else size
+            lines = _tail_lines(f, end, max_lines, self.block_size)
+        for i in range(1, self.backup_count + 1):
+            if len(lines) >= max_lines:
+                break
+            backup = f"{self.path}.{i}"
+            try:
+                with open(backup, 'rb') as f:
+                    lines = _tail_lines(f, os.fstat(f.fileno()).st_size, max_lines - len(lines), self.block_size) + lines
+            except FileNotFoundError:
+                break
+        self._entries = deque((self._decode(line) for line in lines), maxlen=max_lines)
+        self._identity = identity
+        self._offset = end
+
+    def _read_forward(self, size):
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        complete = data.rfind(b'\n') + 1
+        if complete == 0:
+            return  # No complete new line yet
+        for line in data[:complete].split(b'\n')[:-1]:
+            self._entries.append(self._decode(line))
+        self._offset += complete
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app_log.log")
+        line = "2025-09-26 16:21:55,474 - USBGuardApp - INFO - Message {}\n"
+        with open(f"{path}.1", "w") as f:
+            f.writelines(line.format(f"old {i}") for i in range(50))
+        with open(path, "w") as f:
+            f.writelines(line.format(i) for i in range(30))
+
+        reader = LogTailReader(path)
+
+        print("\n--- Tail continues into the rotated backup ---")
+        entries = reader.read(40)
+        print(f"First: {entries[0]['message']}, last: {entries[-1]['message']}")
+        assert len(entries) == 40
+        assert entries[0]['message'] == "Message old 40" and entries[-1]['message'] == "Message 29"
+        assert entries[-1]['time'] == datetime(2025, 9, 26, 16, 21, 55, 474000)
+
+        print("\n--- Repeat poll reads only appended bytes ---")
+        with open(path, "a") as f:
+            f.write(line.format("new"))
+            f.write("2025-09-26 16:21:56,000 - USBGuardApp - INFO - partial")
+        entries = reader.read(40)
+        assert entries[-1]['message'] == "Message new"
+        with open(path, "a") as f:
+            f.write(" line\n")
+        entries = reader.read(40)
+        print(f"Last: {entries[-1]['message']}")
+        assert entries[-1]['message'] == "partial line" and len(entries) == 40
+
+        print("\n--- Truncation is detected ---")
+        with open(path, "w") as f:
+            f.write(line.format("after clear"))
+        entries = reader.read(40)
+        assert entries[-1]['message'] == "Message after clear"
+
+    print("\nLog reader tests complete.")
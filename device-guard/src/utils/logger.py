@@ -1,22 +1,141 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
 
 # Define the log directory (will be in the data directory)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
 LOG_DIR = os.path.join(PROJECT_ROOT, "data")
 LOG_FILE = os.path.join(LOG_DIR, "app_log.log")
+LOG_BACKUP_COUNT = 5
+
+# Identical messages (same level, logger and text) repeated within this many
+# seconds are written once, then summarized in one line with their count
+LOG_DEDUP_WINDOW = 60
+# Distinct messages tracked at a time for deduplication
+LOG_DEDUP_KEYS = 1024
 
 # Create the log directory if it doesn't exist
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Puts records on the queue without formatting them: the message and its
+    args are merged by the writer thread, so a log call on a hot thread costs
+    a record and a queue put. Only tracebacks are rendered up front, while the
+    exception is still alive.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RepeatCollapsingHandler(logging.Handler):
+    """
+    Forwards records to `targets`, collapsing repeats: the first occurrence of
+    a message is written at once, later identical ones within `window` seconds
+    are only counted, and the count is written as one line when the window
+    closes (checked as records arrive, and on flush/close).
+    """
+
+    def __init__(self, targets, window=LOG_DEDUP_WINDOW, max_keys=LOG_DEDUP_KEYS, clock=time.monotonic):
+        super().__init__()
+        self.targets = list(targets)
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._seen = OrderedDict()  # (levelno, name, message) -> [window start, repeats, last record], oldest first
+
+    def emit(self, record):
+        # Runs on the listener thread, which dies on an uncaught error (e.g. a bad format string)
+        try:
+            now = self.clock()
+            self._close_windows(now)
+            key = (record.levelno, record.name, record.getMessage())
+            entry = self._seen.get(key)
+            if entry is not None:
+                entry[1] += 1
+                entry[2] = record
+                return
+            self._seen[key] = [now, 0, record]
+            while len(self._seen) > self.max_keys:
+                self._summarize(self._seen.popitem(last=False)[1])
+            self._forward(record)
+        except Exception:
+            self.handleError(record)
+
+    def _close_windows(self, now):
+        while self._seen:
+            key, entry = next(iter(self._seen.items()))
+            if now - entry[0] < self.window:
+                return
+            del self._seen[key]
+            self._summarize(entry)
+
+    def _summarize(self, entry):
+        started, repeats, record = entry
+        if repeats:
+            summary = logging.makeLogRecord(record.__dict__)
+            summary.msg = f"{record.getMessage()} [repeated {repeats} more time{'s' if repeats > 1 else ''} in {self.window}s]"
+            summary.args = None
+            self._forward(summary)
+
+    def _forward(self, record):
+        for target in self.targets:
+            if record.levelno >= target.level:
+                target.handle(record)
+
+    def flush(self):
+        for entry in self._seen.values():
+            self._summarize(entry)
+            entry[1] = 0
+        for target in self.targets:
+            target.flush()
+
+    def close(self):
+        self.flush()
+        self._seen.clear()
+        for target in self.targets:
+            target.close()
+        super().close()
+
+
+# Writes queued records to the file and console handlers on its own thread
+listener = None
+_listener_lock = threading.Lock()
+
+
+def stop_logging():
+    """Drains the queue, writes pending repeat counts and stops the writer thread (registered at exit)."""
+    global listener
+    with _listener_lock:
+        if listener is None:
+            return
+        active, listener = listener, None
+    active.stop()
+    for handler in active.handlers:
+        handler.close()
+
+
 def setup_logger():
     """
     Sets up a centralized logger for the application.
-    - Logs to a file in the 'logs' directory.
+    - Log calls only enqueue the record; a writer thread formats it and does the I/O.
+    - Logs to a file in the 'data' directory and to the console.
     - Rotates the log file when it reaches 2MB, keeping up to 5 backups.
+    - Collapses identical messages repeated within LOG_DEDUP_WINDOW seconds.
     """
+    global listener
     # Get the root logger
     logger = logging.getLogger("USBGuardApp")
     
@@ -36,22 +155,102 @@ def setup_logger():
     file_handler = RotatingFileHandler(
         LOG_FILE,
         maxBytes=2*1024*1024, # 2 Megabytes
-        backupCount=5
+        backupCount=LOG_BACKUP_COUNT
     )
     file_handler.setFormatter(formatter)
 
-    # Add the file handler to the logger
-    logger.addHandler(file_handler)
-
     # Optional: Add a console handler for debugging during development
     # You can comment this out for production
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+    # The logger itself only enqueues; the listener thread dedupes and writes
+    records = queue.SimpleQueue()
+    logger.addHandler(LazyQueueHandler(records))
+    with _listener_lock:
+        listener = QueueListener(records, RepeatCollapsingHandler([file_handler, console_handler]))
+        listener.start()
+    atexit.register(stop_logging)
     
     logger.info("Logger setup complete.")
 
     return logger
 
 # Create the logger instance to be imported by other modules
-log = setup_logger()
\ No newline at end of file
+log = setup_logger()
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    import io
+
+    print("\n--- Repeats within the window collapse into one line ---")
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+    now = [0.0]
+    collapser = RepeatCollapsingHandler([target], window=10, clock=lambda: now[0])
+    test_log = logging.getLogger("USBGuardApp.selfcheck")
+    test_log.propagate = False
+    test_log.addHandler(collapser)
+    for second in range(25):
+        now[0] = float(second)
+        test_log.warning("Blocking unauthorized storage device: %s (%s)", "Stick", "E:")
+        if second == 3:
+            test_log.info("Device disconnected: %s", "VID_0001")
+    collapser.flush()
+    lines = stream.getvalue().splitlines()
+    print("\n".join(lines))
+    assert lines == [
+        "WARNING - Blocking unauthorized storage device: Stick (E:)",
+        "INFO - Device disconnected: VID_0001",
+        "WARNING - Blocking unauthorized storage device: Stick (E:) [repeated 9 more times in 10s]",
+        "WARNING - Blocking unauthorized storage device: Stick (E:)",
+        "WARNING - Blocking unauthorized storage device: Stick (E:) [repeated 9 more times in 10s]",
+        "WARNING - Blocking unauthorized storage device: Stick (E:)",
+        "WARNING - Blocking unauthorized storage device: Stick (E:) [repeated 4 more times in 10s]",
+    ], lines
+
+    print("\n--- A malformed log call does not stop the writer thread ---")
+    stream.seek(0)
+    stream.truncate()
+    bad_listener = QueueListener(queue.SimpleQueue(), collapser)
+    bad_logger = logging.getLogger("USBGuardApp.badformat")
+    bad_logger.propagate = False
+    bad_logger.addHandler(LazyQueueHandler(bad_listener.queue))
+    bad_listener.start()
+    logging.raiseExceptions = False  # handleError() would print the traceback to stderr
+    bad_logger.warning("bad %s %s", "x")
+    bad_logger.warning("still logging")
+    bad_listener.stop()
+    logging.raiseExceptions = True
+    print(stream.getvalue().strip())
+    assert stream.getvalue() == "WARNING - still logging\n"
+
+    print("\n--- A log call does no I/O on the calling thread ---")
+    calls = 20000
+    log.setLevel(logging.WARNING)  # Keep the benchmark out of the log file
+    started = time.perf_counter()
+    for i in range(calls):
+        log.info("Handled %s event in %.2f ms", "arrival", 0.5)
+    disabled = (time.perf_counter() - started) / calls
+    slow = threading.Event()
+
+    class SlowDisk(logging.Handler):
+        def emit(self, record):
+            slow.wait(0.001)  # A 1 ms write per record
+
+    slow_listener = QueueListener(queue.SimpleQueue(), SlowDisk())
+    slow_logger = logging.getLogger("USBGuardApp.slowdisk")
+    slow_logger.propagate = False
+    slow_logger.addHandler(LazyQueueHandler(slow_listener.queue))
+    slow_listener.start()
+    started = time.perf_counter()
+    for i in range(1000):
+        slow_logger.warning("Blocking unauthorized peripheral device: %s", i)
+    enqueued = (time.perf_counter() - started) / 1000
+    slow_listener.stop()
+    print(f"disabled level: {disabled * 1e6:.2f} us/call, enabled over a 1 ms/record disk: {enqueued * 1e6:.1f} us/call")
+    assert enqueued < 0.0005
+
+    print("\nLogger tests complete.")
@@ -0,0 +1,175 @@
+import time
+import threading
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0)]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. observe() is one bisect and three
+    additions under a lock, cheap enough to leave on in production;
+    cumulative bucket counts are only computed when rendering.
+    """
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    @property
+    def count(self):
+        return self._count
+
+    def render(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total!r}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Engine metrics ---
+SCAN_SECONDS = Histogram("deviceguard_scan_duration_seconds", "Duration of one USB detection scan.")
+MONITOR_CYCLE_SECONDS = Histogram("deviceguard_monitor_cycle_seconds", "Duration of one monitor cycle (scan, whitelist check and decisions).")
+DB_LOOKUP_SECONDS = Histogram("deviceguard_db_lookup_seconds", "Latency of batched whitelist lookups (one per scan or API request).")
+VERIFICATION_SECONDS = Histogram("deviceguard_verification_seconds", "Latency of drive fingerprint verification.")
+ENFORCEMENT_SECONDS = Histogram("deviceguard_enforcement_seconds", "Time from queuing an enforcement job to its completion.")
+DECISION_SECONDS = Histogram("deviceguard_decision_latency_seconds", "Time from a device's arrival (its event, or the first scan that found it) to the service's decision on it.")
+BLOCK_SECONDS = Histogram("deviceguard_block_latency_seconds", "Time from an unauthorized device's arrival to the completion of its first block.")
+BLOCKS_TOTAL = Counter("deviceguard_blocks_total", "Unauthorized devices queued for blocking.", labels=("kind",))
+VERIFICATIONS_TOTAL = Counter("deviceguard_verifications_total", "Drive fingerprint verifications.", labels=("result",))
+VERIFY_CACHE_TOTAL = Counter("deviceguard_verification_cache_total", "Fingerprinter cache lookups: 'verification' skips the lockfile read and signature check, 'signature' only the signature check.", labels=("cache", "result"))
+ERRORS_TOTAL = Counter("deviceguard_errors_total", "Errors caught in the engine.", labels=("component",))
+
+
+# --- Test / Example Usage (for development) ---
+if __name__ == "__main__":
+    latency = Histogram("test_latency_seconds", "Test histogram.", buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.01, 0.05, 0.5, 3.0):
+        latency.observe(value)
+    requests = Counter("test_requests_total", "Test counter.", labels=("result",))
+    requests.inc("ok")
+    requests.inc("ok")
+    requests.inc("error")
+
+    print("\n--- Exposition format ---")
+    text = render()
+    print("\n".join(line for line in text.splitlines() if line.startswith("test_")))
+    assert 'test_latency_seconds_bucket{le="0.01"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 5' in text
+    assert "test_latency_seconds_count 5" in text
+    assert 'test_requests_total{result="ok"} 2' in text
+
+    print("\n--- Overhead ---")
+    n = 200000
+    started = time.perf_counter()
+    for _ in range(n):
+        SCAN_SECONDS.observe(0.003)
+    observe_ns = (time.perf_counter() - started) / n * 1e9
+    started = time.perf_counter()
+    for _ in range(n):
+        with DB_LOOKUP_SECONDS.time():
+            pass
+    timer_ns = (time.perf_counter() - started) / n * 1e9
+    print(f"observe(): {observe_ns:.0f} ns, timed block: {timer_ns:.0f} ns")
+
+    print("\nMetrics tests complete.")
@@ -5,6 +5,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const otherTableBody = document.getElementById('other-device-table');
     const registeredTableBody = document.getElementById('registered-devices-table');
     const registeredTabBtn = document.getElementById('registered-tab-btn');
+    const registeredSearch = document.getElementById('registered-search');
+    const registeredMoreBtn = document.getElementById('registered-more-btn');
     const settingsTabBtn = document.getElementById('settings-tab-btn');
     const logsTabBtn = document.getElementById('logs-tab-btn');
     
@@ -17,6 +19,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const logLevelSelect = document.getElementById('log-level');
     const maxLogSizeInput = document.getElementById('max-log-size');
     const exportDbBtn = document.getElementById('export-db-btn');
+    const importDbBtn = document.getElementById('import-db-btn');
+    const importDbFile = document.getElementById('import-db-file');
     const clearDbBtn = document.getElementById('clear-db-btn');
     const viewLogsBtn = document.getElementById('view-logs-btn');
     const restartServiceBtn = document.getElementById('restart-service-btn');
@@ -82,10 +86,10 @@ document.addEventListener('DOMContentLoaded', () => {
         populate(otherTableBody, otherDevices, false);
     };
     
-    const populateRegisteredTable = (devices) => {
+    const populateRegisteredTable = (devices, append = false) => {
         if (!registeredTableBody) return;
-        registeredTableBody.innerHTML = '';
-        if (!devices || devices.length === 0) {
+        if (!append) registeredTableBody.innerHTML = '';
+        if (!append && (!devices || devices.length === 0)) {
             registeredTableBody.innerHTML = `<tr><td colspan="8" class="text-center text-muted"><em>No devices are registered.</em></td></tr>`;
             return;
         }
@@ -116,6 +120,52 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     };
 
+    // --- Live device updates (Server-Sent Events, long-poll fallback) ---
+    // Detected devices by canonical_id; deltas pushed by the monitor are applied here
+    const liveDevices = new Map();
+
+    const renderLiveDevices = () => {
+        const devices = [...liveDevices.values()];
+        populateDetectionTables(devices.filter(d => d.drive_letter), devices.filter(d => !d.drive_letter));
+    };
+
+    const applyDeviceEvent = (message) => {
+        if (message.type === 'snapshot') {
+            // Without a monitor in the server process the snapshot is empty; keep the scanned list
+            if (!message.live) return;
+            liveDevices.clear();
+            message.devices.forEach(device => liveDevices.set(device.canonical_id, device));
+        } else if (message.type === 'removed') {
+            if (!liveDevices.delete(message.device.canonical_id)) return;
+        } else {
+            const known = liveDevices.get(message.device.canonical_id) || {};
+            liveDevices.set(message.device.canonical_id, { ...known, ...message.device });
+            if (message.type === 'blocked') showToast('Blocked', `Unauthorized device blocked: ${message.device.friendly_name}`, 'warning');
+            if (message.type === 'verified' && !message.device.is_valid) showToast('FAILED!', `${message.device.friendly_name} failed verification.`, 'danger');
+        }
+        renderLiveDevices();
+    };
+
+    const pollDeviceEvents = async (after) => {
+        try {
+            const response = await fetch(after === undefined ? '/api/events/poll' : `/api/events/poll?after=${after}`);
+            const data = await response.json();
+            data.events.forEach(applyDeviceEvent);
+            pollDeviceEvents(data.last_id);
+        } catch (error) {
+            setTimeout(() => pollDeviceEvents(after), 5000);
+        }
+    };
+
+    const subscribeDeviceEvents = () => {
+        if (!window.EventSource) return pollDeviceEvents();
+        // EventSource reconnects by itself and resumes from Last-Event-ID
+        const source = new EventSource('/api/events/stream');
+        ['snapshot', 'added', 'removed', 'blocked', 'verified'].forEach(type => {
+            source.addEventListener(type, (event) => applyDeviceEvent(JSON.parse(event.data)));
+        });
+    };
+
     const refreshDeviceList = async () => {
         const loadingHtml = (cols) => `<tr><td colspan="${cols}" class="text-center"><em><i class="fa-solid fa-spinner fa-spin"></i> Loading...</em></td></tr>`;
         if (storageTableBody) storageTableBody.innerHTML = loadingHtml(6);
@@ -125,6 +175,8 @@ document.addEventListener('DOMContentLoaded', () => {
             if (!response.ok) throw new Error('Server returned an error.');
             const data = await response.json();
             if (!data || !Array.isArray(data.storage_devices) || !Array.isArray(data.other_devices)) throw new Error("Invalid data format from server.");
+            liveDevices.clear();
+            [...data.storage_devices, ...data.other_devices].forEach(device => liveDevices.set(device.canonical_id, device));
             populateDetectionTables(data.storage_devices, data.other_devices);
         } catch (error) {
             showToast('Error', `Could not load devices: ${error.message}`, 'danger');
@@ -132,14 +184,40 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
     
+    // The whitelist is loaded one keyset page at a time; this is the last device shown
+    const REGISTERED_PAGE_SIZE = 100;
+    let lastRegistered = null;
+
+    const fetchRegisteredPage = async (after) => {
+        const params = new URLSearchParams({ limit: REGISTERED_PAGE_SIZE });
+        const query = registeredSearch?.value.trim();
+        if (query) params.set('q', query);
+        if (after) {
+            params.set('after_name', after.friendly_name);
+            params.set('after_id', after.canonical_id);
+        }
+        const response = await fetch(`/api/registered_devices?${params}`);
+        const page = await response.json();
+        if (!page || !Array.isArray(page.devices)) throw new Error("Invalid data format.");
+        if (page.devices.length) lastRegistered = page.devices[page.devices.length - 1];
+        registeredMoreBtn?.classList.toggle('d-none', !page.has_more);
+        return page.devices;
+    };
+
     const refreshRegisteredList = async () => {
         if (!registeredTableBody) return;
         registeredTableBody.innerHTML = `<tr><td colspan="8" class="text-center"><em><i class="fa-solid fa-spinner fa-spin"></i> Loading...</em></td></tr>`;
+        lastRegistered = null;
         try {
-            const response = await fetch('/api/registered_devices');
-            const devices = await response.json();
-            if (!Array.isArray(devices)) throw new Error("Invalid data format.");
-            populateRegisteredTable(devices);
+            populateRegisteredTable(await fetchRegisteredPage(null));
+        } catch (error) {
+            showToast('Error', `Could not load registered list: ${error.message}`, 'danger');
+        }
+    };
+
+    const loadMoreRegistered = async () => {
+        try {
+            populateRegisteredTable(await fetchRegisteredPage(lastRegistered), true);
         } catch (error) {
             showToast('Error', `Could not load registered list: ${error.message}`, 'danger');
         }
@@ -162,9 +240,14 @@ document.addEventListener('DOMContentLoaded', () => {
         const password = prompt('Enter admin password to register device:');
         if (!password) return;
         
+        // Storage can also have its contents recorded and re-checked in the background
+        const content_integrity = device.drive_letter &&
+            confirm('Also verify this drive\'s contents (sampled blocks, checked in the background)?') ? 'sampled' : null;
+
         showToast('Registering...', device.friendly_name, 'info');
-        const result = await postData('/api/devices/register', { ...device, password });
-        if (result?.success) showToast('Success', `${device.friendly_name} registered.`, 'success');
+        const result = await postData('/api/devices/register', { ...device, password, content_integrity });
+        if (result?.content_integrity === 'building') showToast('Success', `${device.friendly_name} registered. Recording its contents...`, 'success');
+        else if (result?.success) showToast('Success', `${device.friendly_name} registered.`, 'success');
         else showToast('Failure', `Could not register. Error: ${result?.error || 'Unknown'}`, 'danger');
         refreshDeviceList();
     };
@@ -238,7 +321,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = 'device_whitelist.json';
+            a.download = 'device_whitelist.ndjson';
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);
@@ -250,6 +333,31 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    const importDatabase = async () => {
+        const file = importDbFile?.files[0];
+        if (!file) return;
+        const password = prompt('Enter admin password to import the whitelist:');
+        const replace = confirm('Overwrite devices that are already registered? (Cancel keeps existing entries and only adds new ones)');
+        const form = new FormData();
+        form.append('file', file);
+        form.append('password', password || '');
+        form.append('mode', replace ? 'upsert' : 'skip');
+        try {
+            const response = await fetch('/api/settings/import_db', { method: 'POST', body: form });
+            const result = await response.json();
+            if (result?.success) {
+                showToast('Success', `Imported ${result.imported} device(s), skipped ${result.invalid} invalid row(s)`, 'success');
+                refreshRegisteredList();
+            } else {
+                showToast('Error', `Import failed: ${result?.error || 'Unknown'}`, 'danger');
+            }
+        } catch (error) {
+            showToast('Error', `Import failed: ${error.message}`, 'danger');
+        } finally {
+            importDbFile.value = '';
+        }
+    };
+
     const clearDatabase = async () => {
         if (!confirm('Are you sure you want to clear ALL registered devices? This action cannot be undone.')) return;
         
@@ -352,8 +460,17 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     // --- Event Listeners ---
-    refreshButton?.addEventListener('click', refreshDeviceList);
+    refreshButton?.addEventListener('click', async () => {
+        await postData('/api/scan', {});
+        refreshDeviceList();
+    });
     registeredTabBtn?.addEventListener('shown.bs.tab', refreshRegisteredList);
+    registeredMoreBtn?.addEventListener('click', loadMoreRegistered);
+    let registeredSearchTimer = null;
+    registeredSearch?.addEventListener('input', () => {
+        clearTimeout(registeredSearchTimer);
+        registeredSearchTimer = setTimeout(refreshRegisteredList, 250);
+    });
     settingsTabBtn?.addEventListener('shown.bs.tab', () => {
         // Load current settings when tab is opened
         // This would load from backend in a real implementation
@@ -364,12 +481,15 @@ document.addEventListener('DOMContentLoaded', () => {
     togglePasswordBtn?.addEventListener('click', togglePasswordVisibility);
     updatePasswordBtn?.addEventListener('click', updatePassword);
     exportDbBtn?.addEventListener('click', exportDatabase);
+    importDbBtn?.addEventListener('click', () => importDbFile?.click());
+    importDbFile?.addEventListener('change', importDatabase);
     clearDbBtn?.addEventListener('click', clearDatabase);
     viewLogsBtn?.addEventListener('click', viewLogs);
     refreshLogsBtn?.addEventListener('click', loadLogs);
     clearLogsBtn?.addEventListener('click', clearLogs);
     restartServiceBtn?.addEventListener('click', restartService);
 
-    // Initial load for the first tab
+    // Initial load for the first tab, then follow live changes
     refreshDeviceList();
+    subscribeDeviceEvents();
 });
\ No newline at end of file